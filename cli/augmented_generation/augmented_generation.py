@@ -1,7 +1,11 @@
+import functools
 from enum import Enum
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-from google import genai
+from hybrid_search.utils_response_cache import ResponseCache, get_response_cache
+
+if TYPE_CHECKING:
+    from google import genai
 
 RAG_MODEL = "gemini-2.5-flash"
 
@@ -14,13 +18,31 @@ class LLMOutputType(Enum):
 
 
 class LLMSummarizer:
-    def __init__(self, api_key: str, model_name: str = "") -> None:
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str = "",
+        response_cache: ResponseCache | None = None,
+    ) -> None:
         if model_name:
             self.model_name = model_name
         else:
             self.model_name = RAG_MODEL
 
-        self.client = genai.Client(api_key=api_key)
+        self.__api_key = api_key
+        self.__client: "genai.Client | None" = None
+        if response_cache is None:
+            response_cache = get_response_cache()
+        self.response_cache = response_cache
+
+    # Created lazily, like the other Gemini clients.
+    @property
+    def client(self) -> "genai.Client":
+        if self.__client is None:
+            from google import genai
+
+            self.__client = genai.Client(api_key=self.__api_key)
+        return self.__client
 
     def __get_prompt(
         self, query: str, documents: list[dict[str, Any]], output_type: LLMOutputType
@@ -140,8 +162,12 @@ class LLMSummarizer:
         if prompt is None or not prompt:
             return ""
 
-        response = self.client.models.generate_content(
-            model=self.model_name, contents=prompt
+        return self.response_cache.generate(
+            self.model_name,
+            prompt,
+            functools.partial(
+                self.client.models.generate_content,
+                model=self.model_name,
+                contents=prompt,
+            ),
         )
-
-        return response.text
@@ -1,39 +1,84 @@
+from argparse import ArgumentParser, Namespace
+from typing import Any
+
 from augmented_generation.augmented_generation import LLMOutputType, LLMSummarizer
-from augmented_generation.opts import get_opts
 from hybrid_search.hybrid_search import HybridSearch
+from search_server.client import SearchClient
 
 RESULT_PADDING = 2
+RAG_LIMIT = 5
 
 
-def run(api_key: str) -> None:
-    cli_opts, parser = get_opts()
-
-    searcher = HybridSearch()
-    rag_client = LLMSummarizer(api_key=api_key)
-
-    query = cli_opts.query
-    results = searcher.rrf_search(query, limit=cli_opts.limit)
-
-    match cli_opts.command:
+def answer(
+    searcher: HybridSearch,
+    rag_client: LLMSummarizer,
+    command: str,
+    query: str,
+    limit: int = RAG_LIMIT,
+) -> dict[str, Any]:
+    match command:
         case "rag":
-            rag_response = rag_client.answer(query, results, LLMOutputType.BASIC)
+            output_type = LLMOutputType.BASIC
             rag_response_header = "RAG Response"
         case "summarize":
-            rag_response = rag_client.answer(
-                query, results, LLMOutputType.COMPREHENSIVE
-            )
+            output_type = LLMOutputType.COMPREHENSIVE
             rag_response_header = "LLM Summary"
         case "citations":
-            rag_response = rag_client.answer(query, results, LLMOutputType.CITATIONS)
+            output_type = LLMOutputType.CITATIONS
             rag_response_header = "LLM Answer"
         case "question":
-            rag_response = rag_client.answer(query, results, LLMOutputType.QUESTION)
+            output_type = LLMOutputType.QUESTION
             rag_response_header = "Answer"
         case _:
-            parser.print_help()
+            raise ValueError(f"Unknown RAG command '{command}'")
+
+    results = searcher.rrf_search(query, limit=limit)
+    rag_response = rag_client.answer(query, results, output_type)
+
+    return {
+        "results": results,
+        "header": rag_response_header,
+        "response": rag_response,
+    }
+
 
+def print_answer(
+    results: list[dict[str, Any]], rag_response_header: str, rag_response: str
+) -> None:
     print("Search Results:")
     for result in results:
         print(f"{' ':<{RESULT_PADDING}}- {result['title']}")
 
     print(f"\n{rag_response_header}:\n\n{rag_response}")
+
+
+def run(cli_opts: Namespace, parser: ArgumentParser, api_key: str) -> None:
+    if cli_opts.command is None:
+        parser.print_help()
+        return
+
+    searcher = HybridSearch()
+    rag_client = LLMSummarizer(api_key=api_key)
+
+    response = answer(
+        searcher, rag_client, cli_opts.command, cli_opts.query, cli_opts.limit
+    )
+    print_answer(response["results"], response["header"], response["response"])
+
+
+def run_client(
+    cli_opts: Namespace, parser: ArgumentParser, client: SearchClient
+) -> None:
+    if cli_opts.command is None:
+        parser.print_help()
+        return
+
+    response = client.request(
+        "rag",
+        {
+            "command": cli_opts.command,
+            "query": cli_opts.query,
+            "limit": cli_opts.limit,
+        },
+    )
+    print_answer(response["results"], response["header"], response["response"])
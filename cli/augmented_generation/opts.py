@@ -1,14 +1,23 @@
 from argparse import ArgumentParser, Namespace
 
+from search_server.opts import add_client_opts
+
 
 def get_opts() -> tuple[Namespace, ArgumentParser]:
     parser = ArgumentParser(description="Retrieval Augmented Generation CLI")
+    add_client_opts(parser)
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
     rag_parser = subparsers.add_parser(
         "rag", help="Perform RAG (search + generate answer)"
     )
     rag_parser.add_argument("query", type=str, help="Search query for RAG")
+    rag_parser.add_argument(
+        "--limit",
+        type=int,
+        default=5,
+        help="The number of results to use from the document search",
+    )
 
     rag_summarize_parser = subparsers.add_parser(
         "summarize",
@@ -1,20 +1,28 @@
 import os
 import sys
 
-from augmented_generation.general import run
+from augmented_generation.general import run, run_client
+from augmented_generation.opts import get_opts
 from dotenv import load_dotenv
+from search_server.client import SearchClient
 
 
 def main() -> None:
     load_dotenv()
 
-    api_key = os.getenv("GEMINI_API_KEY")
-    if api_key is None:
-        print("Missing API key for LLM")
-        sys.exit(1)
+    cli_opts, parser = get_opts()
 
     try:
-        run(api_key)
+        if cli_opts.server:
+            run_client(cli_opts, parser, SearchClient(cli_opts.server))
+            return
+
+        api_key = os.getenv("GEMINI_API_KEY")
+        if api_key is None:
+            print("Missing API key for LLM")
+            sys.exit(1)
+
+        run(cli_opts, parser, api_key)
     except Exception as e:
         print(f"Error: {e}")
         sys.exit(1)
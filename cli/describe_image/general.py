@@ -4,8 +4,10 @@ from pathlib import Path
 from describe_image.opts import get_opts
 from google import genai
 from google.genai.types import Part
+from hybrid_search.utils_response_cache import get_response_cache
 
 DATA_DIR = "data"
+DESCRIBE_IMAGE_MODEL = "gemini-2.5-flash"
 
 
 def run(api_key: str) -> None:
@@ -17,8 +19,6 @@ def run(api_key: str) -> None:
     with open(Path(DATA_DIR, "paddington.jpeg"), "rb") as img_file:
         img = img_file.read()
 
-    client = genai.Client(api_key=api_key)
-
     prompt = """
     Given the included image and text query, rewrite the text query to improve search
     results from a movie database. Make sure to:
@@ -33,7 +33,21 @@ def run(api_key: str) -> None:
         cli_opts.query.strip(),
     ]
 
-    response = client.models.generate_content(model="gemini-2.5-flash", contents=parts)
+    # The image bytes are part of the cache key, so the same query about another
+    # image is sent again.
+    response_cache = get_response_cache()
+    text = response_cache.get(DESCRIBE_IMAGE_MODEL, parts)
+    if text is not None:
+        print(f"Rewritten query: {text.strip()}")
+        print("Total tokens: 0 (cached)")
+        return
+
+    client = genai.Client(api_key=api_key)
+    response = client.models.generate_content(
+        model=DESCRIBE_IMAGE_MODEL, contents=parts
+    )
+    if response.text is not None:
+        response_cache.put(DESCRIBE_IMAGE_MODEL, parts, response.text)
 
     print(f"Rewritten query: {response.text.strip()}")
     if response.usage_metadata is not None:
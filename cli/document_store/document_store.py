@@ -0,0 +1,353 @@
+import fcntl
+import functools
+import hashlib
+import json
+import os
+import re
+import shutil
+import uuid
+from collections.abc import Iterable, Iterator
+from contextlib import ExitStack
+from pathlib import Path
+from typing import IO, Any
+
+import numpy as np
+from numpy.typing import NDArray
+
+MOVIES_FILE = Path("data/movies.json")
+STORE_DIR = Path("cache/documents")
+# Number of documents handed to a consumer at a time by `iter_batches`.
+DOCUMENT_BATCH_SIZE = 1024
+READ_CHUNK_SIZE = 1 << 16
+# Text fields kept for every document, besides its id. Missing values are stored as
+# empty strings.
+TEXT_FIELDS = ("title", "description")
+DOCUMENT_KEY_DTYPE = "S32"
+WHITESPACE_OR_COMMA = re.compile(r"[\s,]*")
+# Generation directories are named after the generation and the process that built
+# them, and end with .tmp until they are complete.
+GENERATION_DIR = re.compile(r"generation_(\d+)_(\d+)_[0-9a-f]+(\.tmp)?")
+PUBLISH_LOCK_FILE = "publish.lock"
+
+
+# Yields the elements of the JSON array stored under `key` in the top-level object of
+# `json_file` one at a time, reading the file in chunks so only the element being
+# decoded has to be held in memory. The key must come before any other occurrence of
+# its quoted name in the file, which holds for `{"movies": [...]}`.
+def iter_json_array(json_file: IO[str], key: str) -> Iterator[Any]:
+    decoder = json.JSONDecoder()
+    array_start = re.compile(rf'"{re.escape(key)}"\s*:\s*\[')
+    buffer = ""
+    pos = 0
+
+    # Drops what has already been decoded. Returns False at the end of the file.
+    def read_more() -> bool:
+        nonlocal buffer, pos
+        chunk = json_file.read(READ_CHUNK_SIZE)
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return bool(chunk)
+
+    while (match := array_start.search(buffer)) is None:
+        if not read_more():
+            raise ValueError(f"No '{key}' array found in {json_file.name}")
+    pos = match.end()
+
+    while True:
+        pos = WHITESPACE_OR_COMMA.match(buffer, pos).end()
+        if pos == len(buffer):
+            if not read_more():
+                raise ValueError(f"Unterminated '{key}' array in {json_file.name}")
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            element, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Most likely the element continues in the next chunk.
+            if not read_more():
+                raise
+            continue
+        # A number could also be cut off by the end of the chunk.
+        if end == len(buffer) and read_more():
+            continue
+        yield element
+        pos = end
+
+
+def iter_batches(items: Iterable[Any], batch_size: int) -> Iterator[list[Any]]:
+    batch: list[Any] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _source_stat(source: Path) -> list[int]:
+    stat = source.stat()
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+# Content key of a document, so two versions of the catalog can be compared without
+# keeping the documents of either around.
+def document_key(document: dict[str, Any]) -> bytes:
+    text = "\0".join(document.get(field) or "" for field in TEXT_FIELDS)
+    digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16)
+    return digest.hexdigest().encode("ascii")
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _map_bytes(file_path: Path) -> NDArray[np.uint8]:
+    # Empty files can't be memory-mapped.
+    if file_path.stat().st_size == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(file_path, dtype=np.uint8, mode="r")
+
+
+# The movies in catalog order, as memory-mapped columns shared by every search
+# engine: their ids, content keys, and one UTF-8 blob per text field along with the
+# offset of each document's value in it. Documents are only decoded when they are
+# read, so a process holds no copy of the catalog and processes on the same machine
+# share its pages through the page cache.
+#
+# The store is derived from the movies file and rebuilt whenever that file changes.
+# Every build writes a new generation directory of its own and then atomically
+# replaces the manifest (meta.json), so concurrent readers always see a complete store
+# and concurrent builders never touch each other's directories. Readers keep the
+# generation they mapped until they load the store again, which long-lived ones do
+# with `reload_if_changed`.
+class DocumentStore:
+    def __init__(self, source: Path = MOVIES_FILE, store_dir: Path = STORE_DIR):
+        self.source = source
+        self.store_dir = store_dir
+        self.meta_path = Path(store_dir, "meta.json")
+
+        self.meta: dict[str, Any] = {}
+        self.doc_ids: NDArray[np.uint32] = np.zeros(0, dtype=np.uint32)
+        self.doc_keys: NDArray[np.bytes_] = np.zeros(0, dtype=DOCUMENT_KEY_DTYPE)
+        self.__text_offsets: dict[str, NDArray[np.int64]] = {}
+        self.__texts: dict[str, NDArray[np.uint8]] = {}
+        self.__id_order: NDArray[np.int64] | None = None
+        self.__meta_stat: tuple[int, int] | None = None
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def __generation_path(self) -> Path | None:
+        directory = self.meta.get("directory")
+        return None if directory is None else Path(self.store_dir, directory)
+
+    def is_stale(self) -> bool:
+        return self.meta.get("source_stat") != _source_stat(self.source)
+
+    def __stat_meta(self) -> tuple[int, int] | None:
+        try:
+            stat = self.meta_path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def __read_meta(self) -> None:
+        # Taken before reading, so a build that happens meanwhile is picked up by the
+        # next `reload_if_changed`.
+        self.__meta_stat = self.__stat_meta()
+        try:
+            with open(self.meta_path, "r") as meta_file:
+                self.meta = json.load(meta_file)
+        except FileNotFoundError:
+            self.meta = {}
+
+    # Loads the store, building it first if it is missing or out of date.
+    def load(self) -> None:
+        self.__read_meta()
+        # Stores written before the columnar layout, or before builds had directories
+        # of their own, don't name one.
+        path = self.__generation_path()
+        if self.is_stale() or path is None or not path.is_dir():
+            self.build()
+            return
+        self.__map_columns(path)
+
+    # Loads the store again if another process built a new generation, or if the
+    # movies file changed since it was built. Returns whether a reload happened.
+    def reload_if_changed(self) -> bool:
+        if self.__stat_meta() == self.__meta_stat and not self.is_stale():
+            return False
+        self.load()
+        return True
+
+    def __map_columns(self, path: Path) -> None:
+        self.doc_ids = np.load(Path(path, "doc_ids.npy"), mmap_mode="r")
+        self.doc_keys = np.load(Path(path, "doc_keys.npy"), mmap_mode="r")
+        for field in TEXT_FIELDS:
+            self.__text_offsets[field] = np.load(
+                Path(path, f"{field}_offsets.npy"), mmap_mode="r"
+            )
+            self.__texts[field] = _map_bytes(Path(path, f"{field}.bin"))
+        self.__id_order = None
+
+    def build(self) -> None:
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        # Generations are never reused, since other processes may still read the
+        # current one.
+        self.__read_meta()
+        source_stat = _source_stat(self.source)
+        generation = self.meta.get("generation", -1) + 1
+        directory = f"generation_{generation:06d}_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        path = Path(self.store_dir, directory)
+        tmp_path = path.with_name(f"{directory}.tmp")
+        tmp_path.mkdir()
+
+        doc_ids: list[int] = []
+        doc_keys: list[bytes] = []
+        text_offsets: dict[str, list[int]] = {field: [0] for field in TEXT_FIELDS}
+        with ExitStack() as stack:
+            source_file = stack.enter_context(open(self.source, "r"))
+            text_files = {
+                field: stack.enter_context(open(Path(tmp_path, f"{field}.bin"), "wb"))
+                for field in TEXT_FIELDS
+            }
+            for document in iter_json_array(source_file, "movies"):
+                doc_ids.append(document["id"])
+                doc_keys.append(document_key(document))
+                for field in TEXT_FIELDS:
+                    value = (document.get(field) or "").encode("utf-8")
+                    text_files[field].write(value)
+                    text_offsets[field].append(text_offsets[field][-1] + len(value))
+
+        np.save(Path(tmp_path, "doc_ids.npy"), np.asarray(doc_ids, dtype=np.uint32))
+        np.save(
+            Path(tmp_path, "doc_keys.npy"),
+            np.asarray(doc_keys, dtype=DOCUMENT_KEY_DTYPE),
+        )
+        for field in TEXT_FIELDS:
+            np.save(
+                Path(tmp_path, f"{field}_offsets.npy"),
+                np.asarray(text_offsets[field], dtype=np.int64),
+            )
+        os.replace(tmp_path, path)
+
+        meta = {
+            "generation": generation,
+            "directory": directory,
+            "source": str(self.source),
+            "source_stat": source_stat,
+            "num_documents": len(doc_ids),
+        }
+        with open(Path(self.store_dir, PUBLISH_LOCK_FILE), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Another builder published this generation or a later one while this
+            # one was building: its store is used instead.
+            self.__read_meta()
+            previous_path = self.__generation_path()
+            if self.meta.get("generation", -1) >= generation and previous_path:
+                shutil.rmtree(path, ignore_errors=True)
+                self.__map_columns(previous_path)
+                return
+
+            self.meta = meta
+            tmp_meta_path = self.meta_path.with_name(f"{directory}.json.tmp")
+            with open(tmp_meta_path, "w") as meta_file:
+                json.dump(self.meta, meta_file)
+            os.replace(tmp_meta_path, self.meta_path)
+            self.__meta_stat = self.__stat_meta()
+            self.__map_columns(path)
+            self.__remove_old_generations(generation, {path, previous_path})
+
+    # The previous generation is kept for readers that read the old manifest but
+    # haven't mapped its columns yet. Readers that still have an older generation
+    # mapped keep their mappings. Directories of builds still in progress are kept as
+    # well, and so are complete ones that may still be published.
+    def __remove_old_generations(self, generation: int, keep: set[Path | None]) -> None:
+        for old_path in self.store_dir.iterdir():
+            if old_path in keep or old_path == self.meta_path:
+                continue
+            match = GENERATION_DIR.fullmatch(old_path.name)
+            if match is None:
+                if old_path.is_dir():
+                    shutil.rmtree(old_path, ignore_errors=True)
+                elif not old_path.name.endswith(".tmp") and old_path.suffix != ".lock":
+                    old_path.unlink(missing_ok=True)
+            elif match.group(3):
+                if not _is_running(int(match.group(2))):
+                    shutil.rmtree(old_path, ignore_errors=True)
+            elif int(match.group(1)) < generation:
+                shutil.rmtree(old_path, ignore_errors=True)
+
+    def __text_values(self, field: str, start_row: int, end_row: int) -> list[str]:
+        offsets = self.__text_offsets[field][start_row : end_row + 1].tolist()
+        blob = self.__texts[field][offsets[0] : offsets[-1]].tobytes()
+        base = offsets[0]
+        return [
+            blob[start - base : end - base].decode("utf-8")
+            for start, end in zip(offsets, offsets[1:])
+        ]
+
+    def text(self, field: str, row: int) -> str:
+        return self.__text_values(field, row, row + 1)[0]
+
+    def get_row(self, row: int) -> dict[str, Any]:
+        document: dict[str, Any] = {"id": int(self.doc_ids[row])}
+        for field in TEXT_FIELDS:
+            document[field] = self.text(field, row)
+        return document
+
+    def __find_row(self, doc_id: int) -> int | None:
+        if self.__id_order is None:
+            self.__id_order = np.argsort(self.doc_ids, kind="stable")
+        order = self.__id_order
+        # The last document with a given id wins, as it would when building a dict.
+        pos = int(np.searchsorted(self.doc_ids, doc_id, "right", order)) - 1
+        if pos < 0 or self.doc_ids[order[pos]] != doc_id:
+            return None
+        return int(order[pos])
+
+    def row(self, doc_id: int) -> int:
+        row = self.__find_row(doc_id)
+        if row is None:
+            raise KeyError(f"Document '{doc_id}' is not in the store")
+        return row
+
+    # Indexes are only updated when asked to, so they may still hold documents that
+    # were deleted from the catalog since.
+    def __contains__(self, doc_id: int) -> bool:
+        return self.__find_row(doc_id) is not None
+
+    def get(self, doc_id: int) -> dict[str, Any]:
+        return self.get_row(self.row(doc_id))
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        keys = ("id",) + TEXT_FIELDS
+        for start_row in range(0, len(self), DOCUMENT_BATCH_SIZE):
+            end_row = min(start_row + DOCUMENT_BATCH_SIZE, len(self))
+            columns = [self.doc_ids[start_row:end_row].tolist()] + [
+                self.__text_values(field, start_row, end_row) for field in TEXT_FIELDS
+            ]
+            for values in zip(*columns):
+                yield dict(zip(keys, values))
+
+    def iter_batches(
+        self, batch_size: int = DOCUMENT_BATCH_SIZE
+    ) -> Iterator[list[dict[str, Any]]]:
+        return iter_batches(self, batch_size)
+
+
+# One store per process, shared by every search engine that needs the documents.
+# Long-lived processes that reload the store should hold their own instance instead.
+@functools.cache
+def get_document_store() -> DocumentStore:
+    store = DocumentStore()
+    store.load()
+    return store
@@ -0,0 +1,25 @@
+import json
+from argparse import ArgumentParser, Namespace
+
+from document_store.document_store import DocumentStore
+
+
+def build_command(store: DocumentStore) -> None:
+    store.build()
+    print(f"Stored {len(store)} documents in {store.store_dir}")
+
+
+def get_command(store: DocumentStore, doc_id: int) -> None:
+    store.load()
+    print(json.dumps(store.get(doc_id), indent=2))
+
+
+def run(cli_opts: Namespace, parser: ArgumentParser) -> None:
+    store = DocumentStore()
+    match cli_opts.command:
+        case "build":
+            build_command(store)
+        case "get":
+            get_command(store, cli_opts.doc_id)
+        case _:
+            parser.print_help()
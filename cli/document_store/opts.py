@@ -0,0 +1,15 @@
+from argparse import ArgumentParser, Namespace
+
+
+def get_opts() -> tuple[Namespace, ArgumentParser]:
+    parser = ArgumentParser(description="Document Store CLI")
+    subparsers = parser.add_subparsers(dest="command", help="Available commands")
+
+    subparsers.add_parser(
+        "build", help="Rebuild the document store from the movies file"
+    )
+
+    get_parser = subparsers.add_parser("get", help="Print the movie with the given id")
+    get_parser.add_argument("doc_id", type=int, help="Document id")
+
+    return parser.parse_args(), parser
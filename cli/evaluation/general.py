@@ -1,10 +1,18 @@
 import json
+import time
 from argparse import ArgumentParser, Namespace
+from collections.abc import Callable
 from pathlib import Path
+from typing import Any
 
-from hybrid_search.hybrid_search import HybridSearch
+from hybrid_search.hybrid_search import CANDIDATE_DEPTH_FACTOR, HybridSearch
+from search_server.client import SearchClient
+from semantic_search.utils_quantize import RESCORE_DEPTH
 
 GOLDEN_DATASET_PATH = "data/golden_dataset.json"
+# Candidates per result compared by the depth report. 500 is what the hybrid search
+# used to request.
+DEPTH_REPORT_FACTORS = (1, 2, 4, 10, 20, 50, 100, 500)
 
 
 def _load_golden_dataset() -> dict[str, list[dict[str, str | list[str]]]]:
@@ -12,24 +20,194 @@ def _load_golden_dataset() -> dict[str, list[dict[str, str | list[str]]]]:
         return json.load(golden)
 
 
+# All the test queries are searched at once, so their embeddings are computed in one
+# batch.
+def _get_rrf_search_many(
+    cli_opts: Namespace,
+) -> Callable[[list[str], int], list[list[dict[str, Any]]]]:
+    if cli_opts.server:
+        if cli_opts.quantization is not None or cli_opts.rescore != RESCORE_DEPTH:
+            raise ValueError(
+                "Quantization and rescoring are configured when starting the search "
+                "server"
+            )
+        if cli_opts.depth_report:
+            raise ValueError("The depth report times the search locally")
+        client = SearchClient(cli_opts.server)
+
+        def rrf_search_many_remote(
+            queries: list[str], limit: int
+        ) -> list[list[dict[str, Any]]]:
+            return client.request(
+                "rrf-many",
+                {
+                    "queries": queries,
+                    "limit": limit,
+                    "depth": cli_opts.depth,
+                    "adaptive_depth": cli_opts.adaptive_depth,
+                },
+            )["results"]
+
+        return rrf_search_many_remote
+
+    hybrid_searcher = HybridSearch(
+        quantization=cli_opts.quantization, rescore_depth=cli_opts.rescore
+    )
+
+    def rrf_search_many_local(
+        queries: list[str], limit: int
+    ) -> list[list[dict[str, Any]]]:
+        return hybrid_searcher.rrf_search_many(
+            queries,
+            limit=limit,
+            depth=cli_opts.depth,
+            adaptive_depth=cli_opts.adaptive_depth,
+        )
+
+    return rrf_search_many_local
+
+
+def _golden_recall(results: list[dict[str, Any]], test_case: dict[str, Any]) -> float:
+    titles = [result["title"] for result in results]
+    relevant = [title for title in titles if title in test_case["relevant_docs"]]
+    return len(relevant) / len(test_case["relevant_docs"])
+
+
+# Recall impact of the quantized chunk scores: the golden recall of the quantized and
+# full-precision searches, and how many of the full-precision results are kept. Both
+# searches use the same candidate depth.
+def _print_quantization_report(
+    cli_opts: Namespace,
+    test_cases: list[dict[str, Any]],
+    all_results: list[list[dict[str, Any]]],
+) -> None:
+    limit = cli_opts.limit
+    full_precision_results = HybridSearch().rrf_search_many(
+        [test_case["query"] for test_case in test_cases],
+        limit=limit,
+        depth=cli_opts.depth,
+        adaptive_depth=cli_opts.adaptive_depth,
+    )
+
+    recalls: list[float] = []
+    full_precision_recalls: list[float] = []
+    overlaps: list[float] = []
+    num_identical = 0
+    for test_case, results, full_precision in zip(
+        test_cases, all_results, full_precision_results
+    ):
+        recalls.append(_golden_recall(results, test_case))
+        full_precision_recalls.append(_golden_recall(full_precision, test_case))
+        ids = [result["id"] for result in results]
+        full_precision_ids = [result["id"] for result in full_precision]
+        num_identical += ids == full_precision_ids
+        if full_precision_ids:
+            overlaps.append(
+                len(set(ids) & set(full_precision_ids)) / len(full_precision_ids)
+            )
+
+    padding = 2
+    num_queries = len(test_cases)
+    print(
+        f"\n{cli_opts.quantization} (rescore={cli_opts.rescore}) vs full precision, "
+        f"k={limit}:"
+    )
+    print(
+        f"{'-':<{padding}}Mean Recall@{limit}: {sum(recalls) / num_queries:.4f} "
+        f"(full precision: {sum(full_precision_recalls) / num_queries:.4f})"
+    )
+    print(
+        f"{'-':<{padding}}Overlap with full precision: "
+        f"{sum(overlaps) / max(len(overlaps), 1):.4f}, "
+        f"identical results for {num_identical}/{num_queries} queries"
+    )
+
+
+def _time_rrf_search_many(
+    searcher: HybridSearch,
+    queries: list[str],
+    limit: int,
+    depth: int | None,
+    adaptive_depth: bool = False,
+) -> tuple[float, list[list[dict[str, Any]]]]:
+    start = time.perf_counter()
+    results = searcher.rrf_search_many(
+        queries, limit=limit, depth=depth, adaptive_depth=adaptive_depth
+    )
+    elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    return elapsed_ms, results
+
+
+# Latency against recall of the search at several candidate depths. Results are also
+# compared with those of a search over every candidate, which no depth can cut short.
+def _print_depth_report(cli_opts: Namespace, test_cases: list[dict[str, Any]]) -> None:
+    limit = cli_opts.limit
+    searcher = HybridSearch(
+        quantization=cli_opts.quantization, rescore_depth=cli_opts.rescore
+    )
+    queries = [test_case["query"] for test_case in test_cases]
+    # Also loads the models and indexes, and caches the query embeddings, before any
+    # search is timed.
+    full_ms, full_results = _time_rrf_search_many(
+        searcher, queries, limit, len(searcher.documents)
+    )
+
+    rows: list[tuple[str, float, list[list[dict[str, Any]]]]] = []
+    for factor in DEPTH_REPORT_FACTORS:
+        depth = limit * factor
+        rows.append(
+            (str(depth), *_time_rrf_search_many(searcher, queries, limit, depth))
+        )
+    start_depth = cli_opts.depth or limit * CANDIDATE_DEPTH_FACTOR
+    rows.append(
+        (
+            f"adaptive ({start_depth}+)",
+            *_time_rrf_search_many(searcher, queries, limit, start_depth, True),
+        )
+    )
+    rows.append((f"all ({len(searcher.documents)})", full_ms, full_results))
+
+    print(f"\nCandidate depth vs latency and recall, k={limit}:")
+    print(f"{'depth':<16}{'Recall@' + str(limit):>10}{'same top':>10}{'ms/query':>10}")
+    for name, elapsed_ms, all_results in rows:
+        recall = sum(
+            _golden_recall(results, test_case)
+            for results, test_case in zip(all_results, test_cases)
+        ) / len(test_cases)
+        num_same = sum(
+            [result["id"] for result in results]
+            == [result["id"] for result in full_depth_results]
+            for results, full_depth_results in zip(all_results, full_results)
+        )
+        print(
+            f"{name:<16}{recall:>10.4f}{f'{num_same}/{len(test_cases)}':>10}"
+            f"{elapsed_ms:>10.2f}"
+        )
+
+
 def run(cli_opts: Namespace, parser: ArgumentParser) -> None:
     golden_dataset = _load_golden_dataset()
 
-    hybrid_searcher = HybridSearch()
+    rrf_search_many = _get_rrf_search_many(cli_opts)
 
     padding = 2
     limit = cli_opts.limit
-    for test_case in golden_dataset["test_cases"]:
+    test_cases = golden_dataset["test_cases"]
+    all_results = rrf_search_many(
+        [test_case["query"] for test_case in test_cases], limit
+    )
+    for test_case, results in zip(test_cases, all_results):
         query = test_case["query"]
-        results = hybrid_searcher.rrf_search(query, limit=limit)
         movies_retrieved = [result["title"] for result in results]
         movies_retrieved_relevant = [
             movie for movie in movies_retrieved if movie in test_case["relevant_docs"]
         ]
 
-        precision = len(movies_retrieved_relevant) / len(movies_retrieved)
+        precision = len(movies_retrieved_relevant) / max(len(movies_retrieved), 1)
         recall = len(movies_retrieved_relevant) / len(test_case["relevant_docs"])
-        f1 = 2 * (precision * recall) / (precision + recall)
+        f1 = 0.0
+        if precision + recall > 0:
+            f1 = 2 * (precision * recall) / (precision + recall)
 
         print(f"k={limit}\n")
         print(f"{'-':<{padding}}Query: {query}")
@@ -38,3 +216,8 @@ def run(cli_opts: Namespace, parser: ArgumentParser) -> None:
         print(f"{' ':<{padding}}- F1 Score: {f1:.4f}")
         print(f"{' ':<{padding}}- Retrieved: {', '.join(movies_retrieved)}")
         print(f"{' ':<{padding}}- Relevant: {', '.join(movies_retrieved_relevant)}")
+
+    if cli_opts.quantization is not None and test_cases:
+        _print_quantization_report(cli_opts, test_cases, all_results)
+    if cli_opts.depth_report and test_cases:
+        _print_depth_report(cli_opts, test_cases)
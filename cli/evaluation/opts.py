@@ -1,14 +1,28 @@
 from argparse import ArgumentParser, Namespace
 
+from hybrid_search.opts import add_depth_opts
+from search_server.opts import add_client_opts
+from semantic_search.opts import add_quantization_opts
+
 
 def get_opts() -> tuple[Namespace, ArgumentParser]:
     parser = ArgumentParser(description="Search Evaluation CLI")
+    add_client_opts(parser)
     parser.add_argument(
         "--limit",
         type=int,
         default=5,
         help="Number of results to evaluate (k for precision@k, recall@k)",
     )
+    # With a quantization method, the results are also compared with those of the
+    # full-precision search.
+    add_quantization_opts(parser)
+    add_depth_opts(parser)
+    parser.add_argument(
+        "--depth-report",
+        action="store_true",
+        help="Report the latency and recall of the search at several candidate depths",
+    )
 
     args = parser.parse_args()
 
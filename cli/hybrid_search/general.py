@@ -1,22 +1,35 @@
+import time
 from argparse import ArgumentParser, Namespace
 from logging import Logger
+from typing import Any
 
+import numpy as np
 from hybrid_search.hybrid_search import HybridSearch
+from hybrid_search.utils_cascade import CascadeRanker, CascadeStage
 from hybrid_search.utils_enhance import QueryEnhancer
-from hybrid_search.utils_rerank import LLMReranker
+from hybrid_search.utils_rerank import (
+    RERANKER_CROSS_ENCODER_MAX_LENGTH,
+    RERANKER_MAX_CONCURRENCY,
+    RERANKER_REQUESTS_PER_MINUTE,
+    LLMReranker,
+)
+from search_server.client import SearchClient
+from semantic_search.utils_quantize import RESCORE_DEPTH
 
 HYBRID_DESCRIPTION_LENGTH = 100
 
 
-def normalize(searcher: HybridSearch, scores: list[int | float]) -> None:
-    scores_normed = searcher.normalize(scores)
+def print_normalized(scores_normed: list[float]) -> None:
     if scores_normed:
         for score in scores_normed:
             print(f"* {score:.4f}")
 
 
-def weighted_search(searcher: HybridSearch, query: str, alpha: float, limit: int):
-    results = searcher.weighted_search(query, alpha, limit)
+def normalize(searcher: HybridSearch, scores: list[int | float]) -> None:
+    print_normalized(searcher.normalize(scores))
+
+
+def print_weighted_search(results: list[dict[str, Any]]) -> None:
     padding = 4
     for i, result in enumerate(results):
         left_num = f"{i + 1}."
@@ -26,10 +39,24 @@ def weighted_search(searcher: HybridSearch, query: str, alpha: float, limit: int
             f"{' ':<{padding}}BM25: {result['bm25_score']:.4f}, Semantic: {result['semantic_score']:.4f}"
         )
         print(f"{' ':<{padding}}{result['description'][:HYBRID_DESCRIPTION_LENGTH]}...")
-    pass
 
 
-def rrf_search(
+def weighted_search(
+    searcher: HybridSearch,
+    query: str,
+    alpha: float,
+    limit: int,
+    num_probes: int | None = None,
+    depth: int | None = None,
+    adaptive_depth: bool = False,
+):
+    results = searcher.weighted_search(
+        query, alpha, limit, num_probes, depth, adaptive_depth
+    )
+    print_weighted_search(results)
+
+
+def rrf_search_results(
     logger: Logger,
     searcher: HybridSearch,
     query_enhancer: QueryEnhancer,
@@ -40,7 +67,10 @@ def rrf_search(
     evaluate: bool,
     query_enhancement_method: str | None,
     reranking_method: str | None,
-):
+    num_probes: int | None = None,
+    depth: int | None = None,
+    adaptive_depth: bool = False,
+) -> dict[str, Any]:
     logger.debug("original query: '%s'", query)
 
     query_enhanced = query_enhancer.enhance(query, query_enhancement_method)
@@ -48,15 +78,15 @@ def rrf_search(
     logger.debug("enhanced query: '%s'", query_enhanced)
 
     new_limit = limit * 5
-    results = searcher.rrf_search(query_enhanced, k, new_limit)
+    results = searcher.rrf_search(
+        query_enhanced, k, new_limit, num_probes, depth, adaptive_depth
+    )
 
     logger.debug(
         "results of RRF search: %s", ", ".join([result["title"] for result in results])
     )
 
-    reranking = False
     if reranking_method is not None and reranking_method:
-        reranking = True
         results = reranker.rerank(query_enhanced, results, limit, reranking_method)
 
         logger.debug(
@@ -64,6 +94,30 @@ def rrf_search(
             ", ".join([result["title"] for result in results]),
         )
 
+    results_evaluated = None
+    if evaluate:
+        results_evaluated = reranker.evaluate(query_enhanced, results)
+
+    return {
+        "query_enhanced": query_enhanced,
+        "results": results,
+        "results_evaluated": results_evaluated,
+    }
+
+
+def print_rrf_search(
+    query: str,
+    query_enhanced: str,
+    results: list[dict[str, Any]],
+    results_evaluated: list[dict[str, Any]] | None,
+    k: int,
+    limit: int,
+    query_enhancement_method: str | None,
+    reranking_method: str | None,
+) -> None:
+    reranking = False
+    if reranking_method is not None and reranking_method:
+        reranking = True
         print(f"Reranking top {limit} results using {reranking_method}...")
     padding = 4
     if query_enhancement_method is not None and query_enhancement_method:
@@ -88,12 +142,11 @@ def rrf_search(
                     pass
         print(f"{' ':<{padding}}RRF Score: {result['rrf_score']:.4f}")
         print(
-            f"{' ':<{padding}}BM25 Rank: {result['bm25_rank']}, Semantic Rank: {result['semantic_rank']}"
+            f"{' ':<{padding}}BM25 Rank: {result['bm25_rank'] or '-'}, Semantic Rank: {result['semantic_rank'] or '-'}"
         )
         print(f"{' ':<{padding}}{result['description'][:HYBRID_DESCRIPTION_LENGTH]}...")
 
-    if evaluate:
-        results_evaluated = reranker.evaluate(query_enhanced, results)
+    if results_evaluated is not None:
         for i, result in enumerate(results_evaluated):
             if i == 0:
                 print()
@@ -103,6 +156,210 @@ def rrf_search(
             )
 
 
+def rrf_search(
+    logger: Logger,
+    searcher: HybridSearch,
+    query_enhancer: QueryEnhancer,
+    reranker: LLMReranker,
+    query: str,
+    k: int,
+    limit: int,
+    evaluate: bool,
+    query_enhancement_method: str | None,
+    reranking_method: str | None,
+    num_probes: int | None = None,
+    depth: int | None = None,
+    adaptive_depth: bool = False,
+):
+    response = rrf_search_results(
+        logger,
+        searcher,
+        query_enhancer,
+        reranker,
+        query,
+        k,
+        limit,
+        evaluate,
+        query_enhancement_method,
+        reranking_method,
+        num_probes,
+        depth,
+        adaptive_depth,
+    )
+    print_rrf_search(
+        query,
+        response["query_enhanced"],
+        response["results"],
+        response["results_evaluated"],
+        k,
+        limit,
+        query_enhancement_method,
+        reranking_method,
+    )
+
+
+def cascade_stages(cli_opts: Namespace) -> tuple[CascadeStage, ...]:
+    stages = [CascadeStage("rrf", cli_opts.rrf_candidates, cli_opts.rrf_budget_ms)]
+    if cli_opts.cross_encoder_candidates > 0:
+        stages.append(
+            CascadeStage(
+                "cross_encoder",
+                cli_opts.cross_encoder_candidates,
+                cli_opts.cross_encoder_budget_ms,
+                cli_opts.margin,
+            )
+        )
+    if cli_opts.llm_candidates > 0:
+        stages.append(
+            CascadeStage(
+                "llm", cli_opts.llm_candidates, cli_opts.llm_budget_ms, cli_opts.margin
+            )
+        )
+    return tuple(stages)
+
+
+def cascade_search_results(
+    ranker: CascadeRanker,
+    query: str,
+    limit: int,
+    k: int,
+    num_probes: int | None = None,
+    enhancement_method: str | None = None,
+) -> dict[str, Any]:
+    cascade = ranker.rank(query, limit, k, num_probes, enhancement_method)
+    return {
+        "query_enhanced": cascade.query,
+        "results": cascade.results,
+        "timings": [timing._asdict() for timing in cascade.timings],
+    }
+
+
+def print_cascade_search(
+    query: str,
+    query_enhanced: str,
+    results: list[dict[str, Any]],
+    timings: list[dict[str, Any]],
+) -> None:
+    padding = 4
+    if query_enhanced != query:
+        print(f"Enhanced query: '{query}' -> '{query_enhanced}'")
+    print(f"Cascade results for '{query_enhanced}':\n")
+    for i, result in enumerate(results):
+        left_num = f"{i + 1}."
+        print(f"{left_num:<{padding}}{result['title']}")
+        if "rerank_score" in result:
+            print(f"{' ':<{padding}}Rerank Score: {result['rerank_score']:.4f}")
+        if "cross_encoder_score" in result:
+            print(
+                f"{' ':<{padding}}Cross Encoder Score: {result['cross_encoder_score']:.4f}"
+            )
+        print(f"{' ':<{padding}}RRF Score: {result['rrf_score']:.4f}")
+        print(f"{' ':<{padding}}{result['description'][:HYBRID_DESCRIPTION_LENGTH]}...")
+
+    print("\nStages:")
+    for timing in timings:
+        if timing["skipped"]:
+            print(f"{' ':<{padding}}{timing['name']}: skipped ({timing['skipped']})")
+        else:
+            over_budget = " (over budget)" if timing["over_budget"] else ""
+            print(
+                f"{' ':<{padding}}{timing['name']}: {timing['candidates']} candidates "
+                f"in {timing['elapsed_ms']:.2f} ms{over_budget}"
+            )
+
+
+def cascade_search(
+    ranker: CascadeRanker,
+    query: str,
+    limit: int,
+    k: int,
+    num_probes: int | None = None,
+    enhancement_method: str | None = None,
+) -> None:
+    response = cascade_search_results(
+        ranker, query, limit, k, num_probes, enhancement_method
+    )
+    print_cascade_search(
+        query, response["query_enhanced"], response["results"], response["timings"]
+    )
+
+
+# Every query is searched `repeat` times with the same ranker, so the later searches
+# use the cost estimates (and caches) warmed up by the earlier ones, like a server.
+def cascade_bench(
+    ranker: CascadeRanker,
+    queries: list[str],
+    repeat: int,
+    limit: int,
+    k: int,
+    num_probes: int | None = None,
+    enhancement_method: str | None = None,
+) -> None:
+    if repeat < 1:
+        raise ValueError("repeat must be at least 1")
+    elapsed_ms: dict[str, list[float]] = {}
+    skipped: dict[str, int] = {}
+    over_budget: dict[str, int] = {}
+    totals_ms: list[float] = []
+    for _ in range(repeat):
+        for query in queries:
+            cascade = ranker.rank(query, limit, k, num_probes, enhancement_method)
+            totals_ms.append(sum(timing.elapsed_ms for timing in cascade.timings))
+            for timing in cascade.timings:
+                elapsed_ms.setdefault(timing.name, []).append(timing.elapsed_ms)
+                skipped[timing.name] = skipped.get(timing.name, 0) + bool(
+                    timing.skipped
+                )
+                over_budget[timing.name] = (
+                    over_budget.get(timing.name, 0) + timing.over_budget
+                )
+
+    print(f"{len(totals_ms)} searches")
+    print(
+        f"{'stage':<15}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'skipped':>10}"
+        f"{'over budget':>13}"
+    )
+    for name, stage_ms in [*elapsed_ms.items(), ("total", totals_ms)]:
+        p50, p99 = np.percentile(stage_ms, [50, 99])
+        print(
+            f"{name:<15}{p50:>10.2f}{p99:>10.2f}{max(stage_ms):>10.2f}"
+            f"{skipped.get(name, 0):>10}{over_budget.get(name, 0):>13}"
+        )
+
+
+# The first rerank predicts every score, the next ones find them all in the cache. The
+# model is loaded before timing.
+def cross_encoder_bench(
+    searcher: HybridSearch,
+    reranker: LLMReranker,
+    query: str,
+    limit: int,
+    repeat: int,
+) -> None:
+    if repeat < 1:
+        raise ValueError("repeat must be at least 1")
+    results = searcher.rrf_search(query, limit=limit)
+    _ = reranker.cross_encoder
+
+    start = time.perf_counter()
+    reranker.rerank(query, [dict(result) for result in results], limit, "cross_encoder")
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        reranker.rerank(
+            query, [dict(result) for result in results], limit, "cross_encoder"
+        )
+    cached_ms = (time.perf_counter() - start) * 1000 / repeat
+
+    print(
+        f"Reranked {len(results)} results with the cross-encoder "
+        f"(max length {reranker.cross_encoder_max_length} tokens)"
+    )
+    print(f"Scores predicted: {cold_ms:.2f} ms")
+    print(f"Scores cached:    {cached_ms:.2f} ms")
+
+
 def run(
     cli_opts: Namespace,
     opt_parser: ArgumentParser,
@@ -115,7 +372,15 @@ def run(
         case "normalize":
             normalize(searcher, cli_opts.scores)
         case "weighted-search":
-            weighted_search(searcher, cli_opts.text, cli_opts.alpha, cli_opts.limit)
+            weighted_search(
+                searcher,
+                cli_opts.text,
+                cli_opts.alpha,
+                cli_opts.limit,
+                cli_opts.ann_probes,
+                cli_opts.depth,
+                cli_opts.adaptive_depth,
+            )
         case "rrf-search":
             rrf_search(
                 logger,
@@ -128,6 +393,121 @@ def run(
                 cli_opts.evaluate,
                 cli_opts.enhance,
                 cli_opts.rerank_method,
+                cli_opts.ann_probes,
+                cli_opts.depth,
+                cli_opts.adaptive_depth,
+            )
+        case "cascade-search":
+            cascade_search(
+                CascadeRanker(
+                    searcher, reranker, query_enhancer, cascade_stages(cli_opts)
+                ),
+                cli_opts.text,
+                cli_opts.limit,
+                cli_opts.k,
+                cli_opts.ann_probes,
+                cli_opts.enhance,
+            )
+        case "cascadebench":
+            cascade_bench(
+                CascadeRanker(
+                    searcher, reranker, query_enhancer, cascade_stages(cli_opts)
+                ),
+                cli_opts.queries,
+                cli_opts.repeat,
+                cli_opts.limit,
+                cli_opts.k,
+                cli_opts.ann_probes,
+                cli_opts.enhance,
+            )
+        case "crossencoderbench":
+            cross_encoder_bench(
+                searcher, reranker, cli_opts.text, cli_opts.limit, cli_opts.repeat
+            )
+        case _:
+            opt_parser.print_help()
+
+
+def run_client(
+    cli_opts: Namespace, opt_parser: ArgumentParser, client: SearchClient
+) -> None:
+    # The server's searcher and reranker are configured when it starts, so these
+    # would be ignored.
+    if cli_opts.quantization is not None or cli_opts.rescore != RESCORE_DEPTH:
+        raise ValueError(
+            "Quantization and rescoring are configured when starting the search server"
+        )
+    if (
+        cli_opts.rerank_rpm != RERANKER_REQUESTS_PER_MINUTE
+        or cli_opts.rerank_concurrency != RERANKER_MAX_CONCURRENCY
+        or cli_opts.cross_encoder_max_length != RERANKER_CROSS_ENCODER_MAX_LENGTH
+    ):
+        raise ValueError(
+            "--rerank-rpm, --rerank-concurrency and --cross-encoder-max-length are "
+            "configured when starting the search server"
+        )
+    match cli_opts.command:
+        case "normalize":
+            response = client.request("normalize", {"scores": cli_opts.scores})
+            print_normalized(response["scores"])
+        case "weighted-search":
+            response = client.request(
+                "weighted-search",
+                {
+                    "query": cli_opts.text,
+                    "alpha": cli_opts.alpha,
+                    "limit": cli_opts.limit,
+                    "num_probes": cli_opts.ann_probes,
+                    "depth": cli_opts.depth,
+                    "adaptive_depth": cli_opts.adaptive_depth,
+                },
+            )
+            print_weighted_search(response["results"])
+        case "rrf-search":
+            response = client.request(
+                "rrf-search",
+                {
+                    "query": cli_opts.text,
+                    "k": cli_opts.k,
+                    "limit": cli_opts.limit,
+                    "evaluate": cli_opts.evaluate,
+                    "enhance": cli_opts.enhance,
+                    "rerank_method": cli_opts.rerank_method,
+                    "num_probes": cli_opts.ann_probes,
+                    "depth": cli_opts.depth,
+                    "adaptive_depth": cli_opts.adaptive_depth,
+                },
+            )
+            print_rrf_search(
+                cli_opts.text,
+                response["query_enhanced"],
+                response["results"],
+                response["results_evaluated"],
+                cli_opts.k,
+                cli_opts.limit,
+                cli_opts.enhance,
+                cli_opts.rerank_method,
+            )
+        case "cascade-search":
+            response = client.request(
+                "cascade-search",
+                {
+                    "query": cli_opts.text,
+                    "limit": cli_opts.limit,
+                    "k": cli_opts.k,
+                    "num_probes": cli_opts.ann_probes,
+                    "enhance": cli_opts.enhance,
+                    "stages": cascade_stages(cli_opts),
+                },
+            )
+            print_cascade_search(
+                cli_opts.text,
+                response["query_enhanced"],
+                response["results"],
+                response["timings"],
             )
+        # Benchmarks time the search and reranking of this process.
+        case "cascadebench" | "crossencoderbench":
+            raise ValueError(f"'{cli_opts.command}' is not supported with --server")
         case _:
             opt_parser.print_help()
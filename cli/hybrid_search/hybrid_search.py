@@ -1,38 +1,98 @@
-import json
-from pathlib import Path
-from typing import Any
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any
 
-from keyword_search.inverted_index import InvertedIndex
-from semantic_search.semantic_search import ChunkedSemanticSearch
+from document_store.document_store import DocumentStore, get_document_store
+from semantic_search.utils_quantize import RESCORE_DEPTH
+from semantic_search.utils_query_cache import (
+    QueryEmbeddingCache,
+    get_query_embedding_cache,
+)
+
+if TYPE_CHECKING:
+    from keyword_search.inverted_index import InvertedIndex
+    from semantic_search.semantic_search import ChunkedSemanticSearch
 
-DATA_DIR = "data"
 WEIGHTED_ALPHA = 0.5
 RRF_K = 60
 HYBRID_LIMIT = 5
+# BM25 and the chunk search each return this many candidates per requested result,
+# unless a depth is given.
+CANDIDATE_DEPTH_FACTOR = 20
+
+Fusion = Callable[
+    [list[tuple[int, float]], list[dict[str, Any]], int], list[dict[str, Any]]
+]
 
 
+# The documents, the semantic engine and the BM25 index are only loaded the first time
+# a search needs them, so cheap commands like `normalize` never pay for them.
 class HybridSearch:
-    def __init__(self, documents: list[dict[str, Any]] | None = None):
-        if documents is None:
-            self.documents = self._load_documents()
-        else:
-            self.documents = documents
+    def __init__(
+        self,
+        documents: DocumentStore | None = None,
+        query_cache: QueryEmbeddingCache | None = None,
+        quantization: str | None = None,
+        rescore_depth: int = RESCORE_DEPTH,
+    ):
+        self.__documents = documents
+        # Passed on to the semantic engine (see `ChunkedSemanticSearch`).
+        self.quantization = quantization
+        self.rescore_depth = rescore_depth
+        # Shared with the semantic engine, which embeds the queries.
+        if query_cache is None:
+            query_cache = get_query_embedding_cache()
+        self.query_cache = query_cache
+        self.__semantic_search: "ChunkedSemanticSearch | None" = None
+        self.__idx: "InvertedIndex | None" = None
+
+    @property
+    def documents(self) -> DocumentStore:
+        if self.__documents is None:
+            self.__documents = get_document_store()
+        return self.__documents
+
+    @property
+    def semantic_search(self) -> "ChunkedSemanticSearch":
+        if self.__semantic_search is None:
+            from semantic_search.semantic_search import ChunkedSemanticSearch
+
+            self.__semantic_search = ChunkedSemanticSearch(
+                query_cache=self.query_cache,
+                quantization=self.quantization,
+                rescore_depth=self.rescore_depth,
+            )
+            self.__semantic_search.load_or_create_chunk_embeddings(self.documents)
+        return self.__semantic_search
 
-        self.semantic_search = ChunkedSemanticSearch()
-        self.semantic_search.load_or_create_chunk_embeddings(self.documents)
+    @property
+    def idx(self) -> "InvertedIndex":
+        # Importing the keyword search pulls in nltk, so it is deferred as well.
+        if self.__idx is None:
+            from keyword_search.inverted_index import InvertedIndex
 
-        self.idx: InvertedIndex = InvertedIndex()
-        if not self.idx.index_path.exists():
-            self.idx.build()
-        else:
-            self.idx.load()
+            self.__idx = InvertedIndex(documents=self.documents)
+            try:
+                self.__idx.load()
+            except FileNotFoundError:
+                self.__idx.build()
+        return self.__idx
 
-    def _load_documents(self) -> list[dict[str, Any]]:
-        with open(Path(DATA_DIR, "movies.json"), "r") as mfiles:
-            return json.load(mfiles)["movies"]
+    # Picks up the index updates and the document store generations written by other
+    # processes, re-encoding the chunks of the documents that changed (if the semantic
+    # engine is loaded), so all three engines see the same catalog. Returns whether
+    # anything was reloaded.
+    def reload_if_changed(self) -> bool:
+        generation = self.documents.meta.get("generation")
+        if not self.idx.reload_if_changed():
+            return False
+        if (
+            self.__semantic_search is not None
+            and self.documents.meta.get("generation") != generation
+        ):
+            self.__semantic_search.load_or_create_chunk_embeddings(self.documents)
+        return True
 
     def _bm25_search(self, query: str, limit: int) -> list[tuple[int, float]]:
-        self.idx.load()
         return self.idx.bm25_search(query, limit)
 
     def normalize(self, scores: list[int | float]) -> list[float]:
@@ -60,33 +120,113 @@ class HybridSearch:
     ) -> float:
         return alpha * bm25_score + (1 - alpha) * semantic_score
 
+    # Fuses the `depth` best BM25 and chunk search candidates of every query. With
+    # `adaptive`, `depth` is only where the search starts: it doubles for the queries
+    # whose fused results still changed at the last depth, until they stop changing
+    # or the depth covers the whole catalog.
+    def __search_many(
+        self,
+        queries: list[str],
+        limit: int,
+        depth: int | None,
+        adaptive: bool,
+        semantic_search_many: Callable[[list[str], int], list[list[dict[str, Any]]]],
+        fuse: Fusion,
+    ) -> list[list[dict[str, Any]]]:
+        if depth is None:
+            depth = limit * CANDIDATE_DEPTH_FACTOR
+        depth = max(depth, limit, 1)
+        self.reload_if_changed()
+        max_depth = max(len(self.documents), depth) if adaptive else depth
+
+        results: list[list[dict[str, Any]]] = [[] for _ in queries]
+        pending = list(range(len(queries)))
+        while pending:
+            semantic_results = semantic_search_many(
+                [queries[i] for i in pending], depth
+            )
+            changed: list[int] = []
+            for i, query_results in zip(pending, semantic_results):
+                fused = fuse(self._bm25_search(queries[i], depth), query_results, limit)
+                ids = [result["id"] for result in fused]
+                if depth < max_depth and ids != [result["id"] for result in results[i]]:
+                    changed.append(i)
+                results[i] = fused
+            pending = changed
+            depth = min(depth * 2, max_depth)
+        return results
+
+    # With `num_probes`, the semantic half only searches that many lists of the IVF
+    # index over the chunks (see `ChunkedSemanticSearch.search_chunks`). See
+    # `__search_many` for `depth` and `adaptive_depth`.
     def weighted_search(
-        self, query: str, alpha: float = WEIGHTED_ALPHA, limit=HYBRID_LIMIT
+        self,
+        query: str,
+        alpha: float = WEIGHTED_ALPHA,
+        limit=HYBRID_LIMIT,
+        num_probes: int | None = None,
+        depth: int | None = None,
+        adaptive_depth: bool = False,
     ):
-        new_limit = limit * 500
+        return self.__search_many(
+            [query],
+            limit,
+            depth,
+            adaptive_depth,
+            lambda queries, depth: [
+                self.semantic_search.search_chunks(queries[0], depth, num_probes)
+            ],
+            lambda bm25_scores, semantic_results, limit: self.__weighted_fusion(
+                bm25_scores, semantic_results, alpha, limit
+            ),
+        )[0]
+
+    # Same results as `weighted_search` for every query, with the semantic half of
+    # all the queries computed in one batch.
+    def weighted_search_many(
+        self,
+        queries: list[str],
+        alpha: float = WEIGHTED_ALPHA,
+        limit=HYBRID_LIMIT,
+        num_probes: int | None = None,
+        depth: int | None = None,
+        adaptive_depth: bool = False,
+    ):
+        return self.__search_many(
+            queries,
+            limit,
+            depth,
+            adaptive_depth,
+            lambda queries, depth: self.semantic_search.search_chunks_many(
+                queries, depth, num_probes
+            ),
+            lambda bm25_scores, semantic_results, limit: self.__weighted_fusion(
+                bm25_scores, semantic_results, alpha, limit
+            ),
+        )
 
-        bm25_scores = self._bm25_search(query, new_limit)
+    def __weighted_fusion(
+        self,
+        bm25_scores: list[tuple[int, float]],
+        semantic_results: list[dict[str, Any]],
+        alpha: float,
+        limit: int,
+    ):
         bm25_scores_normed = self._normalize_with_doc_id(bm25_scores)
 
-        semantic_scores = [
-            (doc["id"], doc["score"])
-            for doc in self.semantic_search.search_chunks(query, new_limit)
-        ]
+        semantic_scores = [(doc["id"], doc["score"]) for doc in semantic_results]
         semantic_scores_normed = self._normalize_with_doc_id(semantic_scores)
 
         final_scores = []
         doc_ids = set(
             list(bm25_scores_normed.keys()) + list(semantic_scores_normed.keys())
         )
-        for doc_id in doc_ids:
-            doc = self.idx.docmap[doc_id]
+        for doc_id in self.__in_store(doc_ids):
             bm25_score = bm25_scores_normed.get(doc_id, 0)
             semantic_score = semantic_scores_normed.get(doc_id, 0)
             final_scores.append(
                 {
-                    "id": doc["id"],
-                    "title": doc["title"],
-                    "description": doc["description"],
+                    "id": doc_id,
                     "hybrid_score": self.hybrid_score(
                         bm25_score, semantic_score, alpha
                     ),
@@ -95,9 +235,26 @@ class HybridSearch:
                 }
             )
 
-        return sorted(final_scores, key=lambda x: x["hybrid_score"], reverse=True)[
-            :limit
-        ]
+        top_scores = sorted(
+            final_scores, key=lambda x: x["hybrid_score"], reverse=True
+        )[:limit]
+        return [self.__with_document(scores) for scores in top_scores]
+
+    # The keyword index isn't updated along with the store, so it can still return
+    # movies that have since been deleted from the catalog. They are left out of the
+    # fused results.
+    def __in_store(self, doc_ids: set[int]) -> list[int]:
+        return [doc_id for doc_id in doc_ids if doc_id in self.documents]
+
+    # Documents are only read from the store for the results that are returned.
+    def __with_document(self, scores: dict[str, Any]) -> dict[str, Any]:
+        doc = self.documents.get(scores["id"])
+        return {
+            "id": doc["id"],
+            "title": doc["title"],
+            "description": doc["description"],
+            **{key: value for key, value in scores.items() if key != "id"},
+        }
 
     def rrf_score(self, rank: int, k: int) -> float:
         return 1 / (k + rank)
@@ -113,38 +270,80 @@ class HybridSearch:
         return rrf_scores
 
     def rrf_search(
-        self, query: str, k: int = RRF_K, limit: int = HYBRID_LIMIT
+        self,
+        query: str,
+        k: int = RRF_K,
+        limit: int = HYBRID_LIMIT,
+        num_probes: int | None = None,
+        depth: int | None = None,
+        adaptive_depth: bool = False,
     ) -> list[dict[str, str | int | float]]:
-        new_limit = limit * 500
+        return self.__search_many(
+            [query],
+            limit,
+            depth,
+            adaptive_depth,
+            lambda queries, depth: [
+                self.semantic_search.search_chunks(queries[0], depth, num_probes)
+            ],
+            lambda bm25_scores, semantic_results, limit: self.__rrf_fusion(
+                bm25_scores, semantic_results, k, limit
+            ),
+        )[0]
 
-        bm25_scores = self._bm25_search(query, new_limit)
+    # Same results as `rrf_search` for every query, with the semantic half of all the
+    # queries computed in one batch.
+    def rrf_search_many(
+        self,
+        queries: list[str],
+        k: int = RRF_K,
+        limit: int = HYBRID_LIMIT,
+        num_probes: int | None = None,
+        depth: int | None = None,
+        adaptive_depth: bool = False,
+    ) -> list[list[dict[str, str | int | float]]]:
+        return self.__search_many(
+            queries,
+            limit,
+            depth,
+            adaptive_depth,
+            lambda queries, depth: self.semantic_search.search_chunks_many(
+                queries, depth, num_probes
+            ),
+            lambda bm25_scores, semantic_results, limit: self.__rrf_fusion(
+                bm25_scores, semantic_results, k, limit
+            ),
+        )
+
+    def __rrf_fusion(
+        self,
+        bm25_scores: list[tuple[int, float]],
+        semantic_results: list[dict[str, Any]],
+        k: int,
+        limit: int,
+    ) -> list[dict[str, str | int | float]]:
         bm25_rrf = self._get_rrf_score_with_rank(bm25_scores, k)
 
-        semantic_scores = [
-            (doc["id"], doc["score"])
-            for doc in self.semantic_search.search_chunks(query, new_limit)
-        ]
+        semantic_scores = [(doc["id"], doc["score"]) for doc in semantic_results]
         semantic_rrf = self._get_rrf_score_with_rank(semantic_scores, k)
 
+        # A document missing from one of the candidate lists gets nothing from it, so
+        # results don't depend on both lists being deep enough to overlap.
         final_scores = []
         doc_ids = set(list(bm25_rrf.keys()) + list(semantic_rrf.keys()))
-        for doc_id in doc_ids:
-            doc = self.idx.docmap[doc_id]
-            bm25_vals = bm25_rrf.get(doc_id)
-            semantic_vals = semantic_rrf.get(doc_id)
-            if bm25_vals is None or semantic_vals is None:
-                continue
-            bm25_score, bm25_rank = bm25_vals
-            semantic_score, semantic_rank = semantic_vals
+        for doc_id in self.__in_store(doc_ids):
+            bm25_score, bm25_rank = bm25_rrf.get(doc_id, (0.0, None))
+            semantic_score, semantic_rank = semantic_rrf.get(doc_id, (0.0, None))
             final_scores.append(
                 {
-                    "id": doc["id"],
-                    "title": doc["title"],
-                    "description": doc["description"],
+                    "id": doc_id,
                     "rrf_score": bm25_score + semantic_score,
                     "bm25_rank": bm25_rank,
                     "semantic_rank": semantic_rank,
                 }
             )
 
-        return sorted(final_scores, key=lambda x: x["rrf_score"], reverse=True)[:limit]
+        top_scores = sorted(final_scores, key=lambda x: x["rrf_score"], reverse=True)[
+            :limit
+        ]
+        return [self.__with_document(scores) for scores in top_scores]
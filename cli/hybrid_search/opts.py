@@ -1,10 +1,131 @@
 from argparse import ArgumentParser, Namespace
 
-from hybrid_search.hybrid_search import HYBRID_LIMIT, RRF_K, WEIGHTED_ALPHA
+from hybrid_search.hybrid_search import (
+    CANDIDATE_DEPTH_FACTOR,
+    HYBRID_LIMIT,
+    RRF_K,
+    WEIGHTED_ALPHA,
+)
+from hybrid_search.utils_cascade import (
+    CASCADE_CROSS_ENCODER_STAGE,
+    CASCADE_LLM_STAGE,
+    CASCADE_MARGIN,
+    CASCADE_RRF_STAGE,
+)
+from hybrid_search.utils_rerank import (
+    RERANKER_CROSS_ENCODER_MAX_LENGTH,
+    RERANKER_MAX_CONCURRENCY,
+    RERANKER_REQUESTS_PER_MINUTE,
+)
+from search_server.opts import add_client_opts
+from semantic_search.opts import add_ann_opts, add_quantization_opts
+
+
+def add_depth_opts(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=None,
+        help=(
+            "Number of candidates taken from BM25 and from the chunk search "
+            f"(default: {CANDIDATE_DEPTH_FACTOR} per result)"
+        ),
+    )
+    parser.add_argument(
+        "--adaptive-depth",
+        action="store_true",
+        help="Start at --depth and double it until the fused results stop changing",
+    )
+
+
+def add_rerank_opts(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--rerank-rpm",
+        type=float,
+        default=RERANKER_REQUESTS_PER_MINUTE,
+        help="Maximum number of Gemini reranking requests per minute",
+    )
+    parser.add_argument(
+        "--rerank-concurrency",
+        type=int,
+        default=RERANKER_MAX_CONCURRENCY,
+        help="Maximum number of Gemini reranking requests in flight at once",
+    )
+    parser.add_argument(
+        "--cross-encoder-max-length",
+        type=int,
+        default=RERANKER_CROSS_ENCODER_MAX_LENGTH,
+        help="Token budget of a query and movie pair scored by the cross-encoder",
+    )
+
+
+def add_cascade_opts(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--limit", type=int, default=HYBRID_LIMIT, help="The number of results to show"
+    )
+    parser.add_argument("-k", type=int, default=RRF_K, help="k value")
+    parser.add_argument(
+        "--rrf-candidates",
+        type=int,
+        default=CASCADE_RRF_STAGE.candidates,
+        help="Number of RRF results passed on to the reranking stages",
+    )
+    parser.add_argument(
+        "--rrf-budget-ms",
+        type=float,
+        default=CASCADE_RRF_STAGE.latency_budget_ms,
+        help="Latency budget of candidate generation and fusion",
+    )
+    parser.add_argument(
+        "--cross-encoder-candidates",
+        type=int,
+        default=CASCADE_CROSS_ENCODER_STAGE.candidates,
+        help="Number of candidates reranked by the cross-encoder (0 to skip it)",
+    )
+    parser.add_argument(
+        "--cross-encoder-budget-ms",
+        type=float,
+        default=CASCADE_CROSS_ENCODER_STAGE.latency_budget_ms,
+        help="Latency budget of the cross-encoder stage",
+    )
+    parser.add_argument(
+        "--llm-candidates",
+        type=int,
+        default=0,
+        help=(
+            "Number of candidates reranked individually by Gemini (default: 0, no LLM "
+            f"stage; {CASCADE_LLM_STAGE.candidates} is a good start)"
+        ),
+    )
+    parser.add_argument(
+        "--llm-budget-ms",
+        type=float,
+        default=CASCADE_LLM_STAGE.latency_budget_ms,
+        help="Latency budget of the LLM stage",
+    )
+    parser.add_argument(
+        "--margin",
+        type=float,
+        default=CASCADE_MARGIN,
+        help=(
+            "Skip a reranking stage when the previous scores separate the top results "
+            "from the other candidates by this fraction of their range"
+        ),
+    )
+    parser.add_argument(
+        "--enhance",
+        type=str,
+        choices=["spell", "rewrite", "expand"],
+        help="Query enhancement method",
+    )
+    add_ann_opts(parser)
 
 
 def get_opts() -> tuple[Namespace, ArgumentParser]:
     parser = ArgumentParser(description="Hybrid Search CLI")
+    add_client_opts(parser)
+    add_quantization_opts(parser)
+    add_rerank_opts(parser)
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
     normalize_parser = subparsers.add_parser(
@@ -24,6 +145,8 @@ def get_opts() -> tuple[Namespace, ArgumentParser]:
     weighted_search_parser.add_argument(
         "--limit", type=int, default=HYBRID_LIMIT, help="The number of results to show"
     )
+    add_ann_opts(weighted_search_parser)
+    add_depth_opts(weighted_search_parser)
 
     rrf_search_parser = subparsers.add_parser(
         "rrf-search", help="Perform a Reciprocal Rank Fusion search using the query."
@@ -50,6 +173,45 @@ def get_opts() -> tuple[Namespace, ArgumentParser]:
         action="store_true",
         help="Evaluate the results of the RRF search",
     )
+    add_ann_opts(rrf_search_parser)
+    add_depth_opts(rrf_search_parser)
+
+    cascade_search_parser = subparsers.add_parser(
+        "cascade-search",
+        help=(
+            "Search with RRF, then rerank with a cross-encoder and optionally Gemini, "
+            "within per-stage candidate and latency budgets"
+        ),
+    )
+    cascade_search_parser.add_argument("text", type=str, help="Search query")
+    add_cascade_opts(cascade_search_parser)
+
+    cascade_bench_parser = subparsers.add_parser(
+        "cascadebench",
+        help="Report the per-stage latency percentiles of cascade searches",
+    )
+    cascade_bench_parser.add_argument(
+        "queries", type=str, nargs="+", help="Search queries"
+    )
+    cascade_bench_parser.add_argument(
+        "--repeat", type=int, default=5, help="Number of times every query is searched"
+    )
+    add_cascade_opts(cascade_bench_parser)
+
+    cross_encoder_bench_parser = subparsers.add_parser(
+        "crossencoderbench",
+        help="Time cross-encoder reranking of the RRF results of a query",
+    )
+    cross_encoder_bench_parser.add_argument("text", type=str, help="Search query")
+    cross_encoder_bench_parser.add_argument(
+        "--limit", type=int, default=25, help="Number of movies to rerank"
+    )
+    cross_encoder_bench_parser.add_argument(
+        "--repeat",
+        type=int,
+        default=5,
+        help="Number of timed reranks with cached scores",
+    )
 
     args = parser.parse_args()
 
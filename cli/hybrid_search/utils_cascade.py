@@ -0,0 +1,199 @@
+import math
+import time
+from typing import NamedTuple
+
+from hybrid_search.hybrid_search import HYBRID_LIMIT, RRF_K, HybridSearch
+from hybrid_search.utils_enhance import QueryEnhancer
+from hybrid_search.utils_rerank import LLMReranker
+
+CASCADE_RERANK_STAGES = ("cross_encoder", "llm")
+# Weight of the latest run in the running cost estimate of a stage, when it was
+# cheaper than the estimate. Costlier runs replace the estimate right away, so that
+# one slow run (say, prompts missing the response cache) shrinks the next candidate
+# sets instead of being averaged away.
+CASCADE_COST_SMOOTHING = 0.2
+CASCADE_MARGIN = 0.5
+
+
+# `candidates` is the number of best results of the previous stage that the stage
+# scores. A reranking stage is skipped when the scores of the stage before it already
+# separate the top `limit` results from the other candidates by at least `margin` of
+# their range.
+class CascadeStage(NamedTuple):
+    name: str
+    candidates: int
+    latency_budget_ms: float
+    margin: float = CASCADE_MARGIN
+
+
+CASCADE_RRF_STAGE = CascadeStage("rrf", 100, 150.0)
+CASCADE_CROSS_ENCODER_STAGE = CascadeStage("cross_encoder", 25, 100.0)
+CASCADE_LLM_STAGE = CascadeStage("llm", 10, 2000.0)
+# The LLM stage costs Gemini calls, so it has to be asked for.
+CASCADE_STAGES = (CASCADE_RRF_STAGE, CASCADE_CROSS_ENCODER_STAGE)
+
+CASCADE_SCORE_KEYS = {
+    "rrf": "rrf_score",
+    "cross_encoder": "cross_encoder_score",
+    "llm": "rerank_score",
+}
+CASCADE_RERANK_METHODS = {"cross_encoder": "cross_encoder", "llm": "individual"}
+
+
+# `skipped` says why a stage didn't run, and is empty for the stages that did.
+class StageTiming(NamedTuple):
+    name: str
+    candidates: int
+    elapsed_ms: float
+    skipped: str = ""
+    over_budget: bool = False
+
+
+class CascadeResult(NamedTuple):
+    query: str
+    results: list[dict[str, str | int | float]]
+    timings: list[StageTiming]
+
+
+# How decisively the (descending) scores separate the first `limit` from the rest, as
+# a fraction of their range. With no more than `limit` scores the top is decided.
+def score_margin(scores: list[float], limit: int) -> float:
+    if len(scores) <= limit:
+        return math.inf
+    spread = scores[0] - scores[-1]
+    if spread <= 0:
+        return 0.0
+    return (scores[limit - 1] - scores[limit]) / spread
+
+
+def _rerank_head(
+    reranker: LLMReranker,
+    stage: str,
+    query: str,
+    results: list[dict[str, str | int | float]],
+    num_candidates: int,
+) -> list[dict[str, str | int | float]]:
+    head = reranker.rerank(
+        query, results[:num_candidates], num_candidates, CASCADE_RERANK_METHODS[stage]
+    )
+    return head + results[num_candidates:]
+
+
+# Candidate generation and RRF fusion, then a cross-encoder, then an LLM, each on the
+# best candidates of the stage before it. Stages keep their latency budget by scoring
+# fewer candidates: their cost is assumed to grow linearly with the candidates, at the
+# rate measured over the previous queries (RRF fuses a fixed multiple of its
+# candidates from each list, see `CANDIDATE_DEPTH_FACTOR`). The first query has no
+# measurements, so its stages score all their candidates. Stages that still took
+# longer than their budget are marked as over budget in the timings.
+class CascadeRanker:
+    def __init__(
+        self,
+        searcher: HybridSearch,
+        reranker: LLMReranker,
+        query_enhancer: QueryEnhancer | None = None,
+        stages: tuple[CascadeStage, ...] = CASCADE_STAGES,
+    ) -> None:
+        if not stages or stages[0].name != "rrf":
+            raise ValueError("The first cascade stage must be 'rrf'")
+        for stage in stages[1:]:
+            if stage.name not in CASCADE_RERANK_STAGES:
+                raise ValueError(f"Unknown cascade stage '{stage.name}'")
+            if stage.candidates < 2:
+                raise ValueError(
+                    f"The '{stage.name}' cascade stage needs at least 2 candidates"
+                )
+        self.searcher = searcher
+        self.reranker = reranker
+        self.query_enhancer = query_enhancer
+        self.stages = stages
+        # Running estimate of the milliseconds per candidate of every stage.
+        self.__cost_ms: dict[str, float] = {}
+
+    def __update_cost(self, stage: str, elapsed_ms: float, num_candidates: int) -> None:
+        cost = elapsed_ms / num_candidates
+        previous = self.__cost_ms.get(stage)
+        if previous is not None and cost < previous:
+            cost = (
+                CASCADE_COST_SMOOTHING * cost + (1 - CASCADE_COST_SMOOTHING) * previous
+            )
+        self.__cost_ms[stage] = cost
+
+    # Skipped stages aren't measured, so their estimate is lowered a little on every
+    # skip to try them again eventually. Stages that never ran have no estimate.
+    def __decay_cost(self, stage: str) -> None:
+        if stage in self.__cost_ms:
+            self.__cost_ms[stage] *= 1 - CASCADE_COST_SMOOTHING
+
+    def __affordable_candidates(self, stage: CascadeStage, available: int) -> int:
+        num_candidates = min(stage.candidates, available)
+        cost = self.__cost_ms.get(stage.name)
+        if cost is not None and cost > 0:
+            num_candidates = min(num_candidates, int(stage.latency_budget_ms / cost))
+        return num_candidates
+
+    def rank(
+        self,
+        query: str,
+        limit: int = HYBRID_LIMIT,
+        k: int = RRF_K,
+        num_probes: int | None = None,
+        enhancement_method: str | None = None,
+    ) -> CascadeResult:
+        timings: list[StageTiming] = []
+        if enhancement_method and self.query_enhancer is not None:
+            start = time.perf_counter()
+            query = self.query_enhancer.enhance(query, enhancement_method)
+            timings.append(
+                StageTiming("enhance", 1, (time.perf_counter() - start) * 1000)
+            )
+
+        rrf = self.stages[0]
+        num_candidates = max(self.__affordable_candidates(rrf, rrf.candidates), limit)
+        start = time.perf_counter()
+        results = self.searcher.rrf_search(query, k, num_candidates, num_probes)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.__update_cost(rrf.name, elapsed_ms, num_candidates)
+        timings.append(
+            StageTiming(
+                rrf.name,
+                len(results),
+                elapsed_ms,
+                over_budget=elapsed_ms > rrf.latency_budget_ms,
+            )
+        )
+
+        scored_by = rrf
+        for stage in self.stages[1:]:
+            scores = [
+                float(result[CASCADE_SCORE_KEYS[scored_by.name]])
+                for result in results[: scored_by.candidates]
+            ]
+            num_candidates = self.__affordable_candidates(stage, len(results))
+            skipped = ""
+            if score_margin(scores, limit) >= stage.margin:
+                skipped = f"decisive {scored_by.name} margin"
+            elif num_candidates < 2:
+                skipped = "latency budget"
+                self.__decay_cost(stage.name)
+            if skipped:
+                timings.append(StageTiming(stage.name, 0, 0.0, skipped))
+                continue
+
+            start = time.perf_counter()
+            results = _rerank_head(
+                self.reranker, stage.name, query, results, num_candidates
+            )
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.__update_cost(stage.name, elapsed_ms, num_candidates)
+            timings.append(
+                StageTiming(
+                    stage.name,
+                    num_candidates,
+                    elapsed_ms,
+                    over_budget=elapsed_ms > stage.latency_budget_ms,
+                )
+            )
+            scored_by = stage._replace(candidates=num_candidates)
+
+        return CascadeResult(query=query, results=results[:limit], timings=timings)
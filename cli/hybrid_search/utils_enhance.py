@@ -1,15 +1,50 @@
-from google import genai
+import functools
+from typing import TYPE_CHECKING
+
+from hybrid_search.utils_response_cache import ResponseCache, get_response_cache
+
+if TYPE_CHECKING:
+    from google import genai
 
 ENHANCER_MODEL = "gemini-2.5-flash"
 
 
 class QueryEnhancer:
-    def __init__(self, api_key: str, model_name: str = "") -> None:
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str = "",
+        response_cache: ResponseCache | None = None,
+    ) -> None:
         if model_name:
             self.model_name = model_name
         else:
             self.model_name = ENHANCER_MODEL
-        self.client = genai.Client(api_key=api_key)
+        self.__api_key = api_key
+        self.__client: "genai.Client | None" = None
+        if response_cache is None:
+            response_cache = get_response_cache()
+        self.response_cache = response_cache
+
+    # The google.genai import is slow, so the client is created on the first request.
+    @property
+    def client(self) -> "genai.Client":
+        if self.__client is None:
+            from google import genai
+
+            self.__client = genai.Client(api_key=self.__api_key)
+        return self.__client
+
+    def __generate_content(self, prompt: str) -> str:
+        return self.response_cache.generate(
+            self.model_name,
+            prompt,
+            functools.partial(
+                self.client.models.generate_content,
+                model=self.model_name,
+                contents=prompt,
+            ),
+        )
 
     def __enhance_spelling(self, query: str) -> str:
         prompt = f"""Fix any spelling errors in this movie search query.
@@ -25,11 +60,7 @@ class QueryEnhancer:
 
         Corrected:"""
 
-        response = self.client.models.generate_content(
-            model=self.model_name, contents=prompt
-        )
-
-        return response.text
+        return self.__generate_content(prompt)
 
     def __enhance_by_rewriting(self, query: str) -> str:
         prompt = f"""Rewrite this movie search query to be more specific and searchable.
@@ -53,11 +84,7 @@ class QueryEnhancer:
 
         Rewritten query:"""
 
-        response = self.client.models.generate_content(
-            model=self.model_name, contents=prompt
-        )
-
-        return response.text
+        return self.__generate_content(prompt)
 
     def __enhance_with_expansion(self, query: str) -> str:
         prompt = f"""Expand this movie search query with related terms.
@@ -80,11 +107,7 @@ class QueryEnhancer:
         Original: "{query}"
         """
 
-        response = self.client.models.generate_content(
-            model=self.model_name, contents=prompt
-        )
-
-        return response.text
+        return self.__generate_content(prompt)
 
     def enhance(self, query: str, enhancement_method: str | None = None) -> str:
         # Need to add error handling later
@@ -0,0 +1,71 @@
+import asyncio
+import random
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor
+from typing import TypeVar
+
+T = TypeVar("T")
+
+RETRY_MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY_SECONDS = 1.0
+RETRY_MAX_DELAY_SECONDS = 30.0
+
+
+# Allows `rate` requests per second on average, and bursts of up to `capacity`
+# requests. Only meant to be shared by the tasks of a single event loop.
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float) -> None:
+        if rate <= 0 or capacity < 1:
+            raise ValueError("rate must be positive and capacity at least 1")
+        self.rate = rate
+        self.capacity = capacity
+        self.__tokens = capacity
+        self.__updated_at = time.monotonic()
+
+    def __refill(self) -> None:
+        now = time.monotonic()
+        self.__tokens = min(
+            self.capacity, self.__tokens + (now - self.__updated_at) * self.rate
+        )
+        self.__updated_at = now
+
+    async def acquire(self) -> None:
+        self.__refill()
+        while self.__tokens < 1:
+            await asyncio.sleep((1 - self.__tokens) / self.rate)
+            self.__refill()
+        self.__tokens -= 1
+
+
+# Gemini reports rate limiting as an API error with HTTP status 429. The status is
+# checked by attribute so that stub clients can raise their own errors.
+def is_rate_limit_error(error: Exception) -> bool:
+    return getattr(error, "code", None) == 429
+
+
+def backoff_delay(attempt: int) -> float:
+    delay = min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2**attempt)
+    # Full jitter, so requests that were throttled together don't retry together.
+    return random.uniform(0, delay)
+
+
+# Runs the blocking `call` in `executor` once the bucket allows it, retrying with
+# exponential backoff while it is rate limited. Any other error is raised right away.
+async def call_with_retries(
+    call: Callable[[], T],
+    bucket: TokenBucket,
+    executor: Executor | None = None,
+    max_attempts: int = RETRY_MAX_ATTEMPTS,
+) -> T:
+    loop = asyncio.get_running_loop()
+    attempt = 0
+    while True:
+        await bucket.acquire()
+        try:
+            return await loop.run_in_executor(executor, call)
+        except Exception as e:
+            attempt += 1
+            if not is_rate_limit_error(e) or attempt == max_attempts:
+                raise
+        await asyncio.sleep(backoff_delay(attempt - 1))
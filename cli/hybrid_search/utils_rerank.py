@@ -1,29 +1,137 @@
+import asyncio
+import functools
 import json
-from time import sleep
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any
 
-from google import genai
-from sentence_transformers.cross_encoder import CrossEncoder
+from hybrid_search.utils_rate_limit import TokenBucket, call_with_retries
+from hybrid_search.utils_response_cache import ResponseCache, get_response_cache
+from semantic_search.utils_query_cache import normalize_query
+
+if TYPE_CHECKING:
+    from google import genai
+    from sentence_transformers.cross_encoder import CrossEncoder
 
 RERANKER_MODEL = "gemini-2.5-flash"
-RERANKER_SLEEP_LENGTH_SECONDS = 3
+# Gemini calls are spread over at most this many requests per minute, with up to
+# RERANKER_MAX_CONCURRENCY of them in flight (and sent back to back) at once.
+RERANKER_REQUESTS_PER_MINUTE = 300
+RERANKER_MAX_CONCURRENCY = 8
 RERANKER_CROSS_ENCODER_MODEL = "cross-encoder/ms-marco-TinyBERT-L2-v2"
+# Pairs scored per forward pass. A batch is padded to its longest pair, and the top 25
+# results fit in one batch, so larger batches gain nothing on CPU.
+RERANKER_CROSS_ENCODER_BATCH_SIZE = 32
+# Token budget of a (query, title and description) pair; the description is truncated
+# to fit. Attention cost grows with the square of the length, so this bounds the cost
+# of every pair.
+RERANKER_CROSS_ENCODER_MAX_LENGTH = 128
+# Number of (query, movie) scores kept in memory.
+RERANKER_CROSS_ENCODER_CACHE_SIZE = 4096
 
 
 class LLMReranker:
-    def __init__(self, api_key: str, model_name: str = "") -> None:
+    # `client` replaces the Gemini client, e.g. with a stub exposing the same
+    # `models.generate_content`.
+    def __init__(
+        self,
+        api_key: str,
+        model_name: str = "",
+        client: Any = None,
+        requests_per_minute: float = RERANKER_REQUESTS_PER_MINUTE,
+        max_concurrency: int = RERANKER_MAX_CONCURRENCY,
+        response_cache: ResponseCache | None = None,
+        cross_encoder_max_length: int = RERANKER_CROSS_ENCODER_MAX_LENGTH,
+    ) -> None:
         if model_name:
             self.model_name = model_name
         else:
             self.model_name = RERANKER_MODEL
-        self.client = genai.Client(api_key=api_key)
-        self.cross_encoder = CrossEncoder(RERANKER_CROSS_ENCODER_MODEL)
+        self.__api_key = api_key
+        self.__client: "genai.Client | None" = client
+        self.__cross_encoder: "CrossEncoder | None" = None
+        self.cross_encoder_max_length = cross_encoder_max_length
+        # (normalized query, movie id) -> (text that was scored, score).
+        self.__cross_encoder_scores: OrderedDict[
+            tuple[str, str | int | float], tuple[str, float]
+        ] = OrderedDict()
+
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        # Shared by all the calls of the reranker, so the rate holds across queries.
+        self.rate_limiter = TokenBucket(requests_per_minute / 60, max_concurrency)
+        self.__executor: ThreadPoolExecutor | None = None
+        if response_cache is None:
+            response_cache = get_response_cache()
+        self.response_cache = response_cache
+
+    # Both the Gemini client and the cross-encoder are created on first use, so only
+    # the rerank method that is actually requested pays for its imports and model.
+    @property
+    def client(self) -> "genai.Client":
+        if self.__client is None:
+            from google import genai
+
+            self.__client = genai.Client(api_key=self.__api_key)
+        return self.__client
+
+    @property
+    def cross_encoder(self) -> "CrossEncoder":
+        if self.__cross_encoder is None:
+            from sentence_transformers.cross_encoder import CrossEncoder
+
+            self.__cross_encoder = CrossEncoder(
+                RERANKER_CROSS_ENCODER_MODEL, max_length=self.cross_encoder_max_length
+            )
+        return self.__cross_encoder
+
+    # The client is synchronous, so concurrent calls run on a pool of
+    # `max_concurrency` threads.
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(
+                max_workers=self.max_concurrency, thread_name_prefix="reranker"
+            )
+        return self.__executor
+
+    async def __generate_content_async(self, prompts: list[str]) -> list[Any]:
+        return await asyncio.gather(
+            *(
+                call_with_retries(
+                    functools.partial(
+                        self.client.models.generate_content,
+                        model=self.model_name,
+                        contents=prompt,
+                    ),
+                    self.rate_limiter,
+                    self.executor,
+                )
+                for prompt in prompts
+            )
+        )
 
-    def __rerank_individually(
-        self, query: str, results: list[dict[str, str | int | float]], limit: int
-    ) -> list[dict[str, str | int | float]]:
-        results_reranked: list[dict[str, str | int | float]] = []
-        for result in results:
-            prompt = f"""Rate how well this movie matches the search query.
+    # Sends every prompt that isn't cached concurrently, within the rate limit and
+    # retrying the calls that get rate limited. Returns the text of the responses, in
+    # the order of the prompts.
+    def generate_content(self, prompts: list[str]) -> list[str]:
+        texts = [self.response_cache.get(self.model_name, prompt) for prompt in prompts]
+        missing = [i for i, text in enumerate(texts) if text is None]
+        if missing:
+            responses = asyncio.run(
+                self.__generate_content_async([prompts[i] for i in missing])
+            )
+            for i, response in zip(missing, responses):
+                texts[i] = response.text
+                if response.text is not None:
+                    self.response_cache.put(self.model_name, prompts[i], response.text)
+        return texts
+
+    def __individual_prompt(
+        self, query: str, result: dict[str, str | int | float]
+    ) -> str:
+        return f"""Rate how well this movie matches the search query.
             
             Query: "{query}"
             Movie: {result.get("title", "")} - {result.get("description", "")}
@@ -39,14 +147,19 @@ class LLMReranker:
 
             Score:"""
 
-            response = self.client.models.generate_content(
-                model=self.model_name, contents=prompt
-            )
-
-            result["rerank_score"] = float(response.text)
+    # Each result is scored by its own Gemini call, as before, but the calls are made
+    # concurrently.
+    def __rerank_individually(
+        self, query: str, results: list[dict[str, str | int | float]], limit: int
+    ) -> list[dict[str, str | int | float]]:
+        texts = self.generate_content(
+            [self.__individual_prompt(query, result) for result in results]
+        )
 
+        results_reranked: list[dict[str, str | int | float]] = []
+        for result, text in zip(results, texts):
+            result["rerank_score"] = float(text)
             results_reranked.append(result)
-            sleep(RERANKER_SLEEP_LENGTH_SECONDS)
 
         return sorted(results_reranked, key=lambda x: x["rerank_score"], reverse=True)[
             :limit
@@ -73,11 +186,9 @@ class LLMReranker:
         [75, 12, 34, 2, 1]
         """
 
-        response = self.client.models.generate_content(
-            model=self.model_name, contents=prompt
-        )
+        [text] = self.generate_content([prompt])
 
-        ranked_ids = json.loads(response.text)
+        ranked_ids = json.loads(text)
         results_reranked: list[dict[str, str | int | float]] = []
         for i, movie_id in enumerate(ranked_ids):
             for result in results:
@@ -87,15 +198,56 @@ class LLMReranker:
 
         return results_reranked[:limit]
 
+    # Every word is at least one token, so keeping as many words as the budget has
+    # tokens leaves the truncation to the tokenizer without tokenizing the rest of long
+    # descriptions.
+    def __cross_encoder_text(self, result: dict[str, str | int | float]) -> str:
+        words = str(result.get("description", "")).split()
+        return (
+            f"{result.get('title', '')} - "
+            f"{' '.join(words[: self.cross_encoder_max_length])}"
+        )
+
+    # Scores come from the cache when the movie was already scored for the same query
+    # with the same text; the rest are predicted together.
+    def cross_encoder_scores(
+        self, query: str, results: list[dict[str, str | int | float]]
+    ) -> list[float]:
+        query = normalize_query(query)
+        texts = [self.__cross_encoder_text(result) for result in results]
+        scores: list[float | None] = []
+        missing: list[int] = []
+        for i, (result, text) in enumerate(zip(results, texts)):
+            key = (query, result.get("id", ""))
+            entry = self.__cross_encoder_scores.get(key)
+            if entry is not None and entry[0] == text:
+                self.__cross_encoder_scores.move_to_end(key)
+                scores.append(entry[1])
+            else:
+                missing.append(i)
+                scores.append(None)
+
+        if missing:
+            predicted = self.cross_encoder.predict(
+                [(query, texts[i]) for i in missing],
+                batch_size=RERANKER_CROSS_ENCODER_BATCH_SIZE,
+                show_progress_bar=False,
+            )
+            for i, score in zip(missing, predicted):
+                scores[i] = float(score)
+                self.__cross_encoder_scores[(query, results[i].get("id", ""))] = (
+                    texts[i],
+                    float(score),
+                )
+            while len(self.__cross_encoder_scores) > RERANKER_CROSS_ENCODER_CACHE_SIZE:
+                self.__cross_encoder_scores.popitem(last=False)
+
+        return scores
+
     def __rerank_cross_encoder(
         self, query: str, results: list[dict[str, str | int | float]], limit: int
     ) -> list[dict[str, str | int | float]]:
-        pairs: list[tuple[str, str]] = []
-        for result in results:
-            pairs.append(
-                (query, f"{result.get('title', '')} - {result.get('document', '')}")
-            )
-        scores = self.cross_encoder.predict(pairs, show_progress_bar=True)
+        scores = self.cross_encoder_scores(query, results)
         for score, result in zip(scores, results):
             result["cross_encoder_score"] = score
         return sorted(results, key=lambda x: x["cross_encoder_score"], reverse=True)[
@@ -155,11 +307,9 @@ class LLMReranker:
 
         [2, 0, 3, 2, 0, 1]"""
 
-        response = self.client.models.generate_content(
-            model=self.model_name, contents=prompt
-        )
+        [text] = self.generate_content([prompt])
 
-        evaluation_scores = json.loads(response.text)
+        evaluation_scores = json.loads(text)
         for evaluation_score, result in zip(evaluation_scores, results):
             result["evaluation_score"] = evaluation_score
 
@@ -0,0 +1,152 @@
+import functools
+import hashlib
+import sqlite3
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+RESPONSE_CACHE_FILE = Path("cache/gemini_responses.sqlite")
+# Responses are reused for a week; after that the prompt is sent again, so answers
+# follow changes of the model behind a name.
+RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+# Least recently used responses are evicted beyond this many entries. Responses are
+# a few hundred bytes to a few KB, so the file stays in the tens of MB.
+RESPONSE_CACHE_MAX_ENTRIES = 10_000
+
+
+# Hash of everything sent with a prompt. Images and other binary parts (anything with
+# `inline_data`, like google.genai's Part) are hashed by MIME type and bytes.
+def response_key(contents: Any) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    parts = contents if isinstance(contents, list) else [contents]
+    for part in parts:
+        inline_data = getattr(part, "inline_data", None)
+        if isinstance(part, str):
+            data = b"text:" + part.encode("utf-8")
+        elif isinstance(part, bytes):
+            data = b"bytes:" + part
+        elif inline_data is not None:
+            data = f"inline:{inline_data.mime_type}:".encode("utf-8")
+            data += inline_data.data
+        else:
+            data = b"repr:" + repr(part).encode("utf-8")
+        # Length-prefixed, so that parts can't run into each other.
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+# Text of Gemini responses keyed by (model name, hash of the contents), stored in
+# SQLite. Entries expire `ttl_seconds` after they were written, and the least recently
+# used ones are evicted past `max_entries`. Without a store path the cache only lives
+# in memory.
+class ResponseCache:
+    def __init__(
+        self,
+        store_path: Path | None = None,
+        ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self.store_path = store_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.__store: sqlite3.Connection | None = None
+
+        self.hits = 0
+        self.misses = 0
+        # Lookups that found an entry older than the TTL, also counted as misses.
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return self.store.execute("SELECT COUNT(*) FROM gemini_responses").fetchone()[0]
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "size": len(self),
+            "max_entries": self.max_entries,
+        }
+
+    @property
+    def store(self) -> sqlite3.Connection:
+        if self.__store is None:
+            if self.store_path is None:
+                self.__store = sqlite3.connect(":memory:")
+            else:
+                self.store_path.parent.mkdir(parents=True, exist_ok=True)
+                self.__store = sqlite3.connect(self.store_path, timeout=30)
+            self.__store.execute(
+                "CREATE TABLE IF NOT EXISTS gemini_responses ("
+                "model TEXT, key TEXT, text TEXT, created_at REAL, used_at REAL, "
+                "PRIMARY KEY (model, key))"
+            )
+            self.__store.execute(
+                "CREATE INDEX IF NOT EXISTS gemini_responses_used_at "
+                "ON gemini_responses (used_at)"
+            )
+        return self.__store
+
+    def get(self, model_name: str, contents: Any) -> str | None:
+        key = (model_name, response_key(contents))
+        row = self.store.execute(
+            "SELECT text, created_at FROM gemini_responses WHERE model = ? AND key = ?",
+            key,
+        ).fetchone()
+        now = time.time()
+        if row is not None and now - row[1] > self.ttl_seconds:
+            self.expired += 1
+            with self.store:
+                self.store.execute(
+                    "DELETE FROM gemini_responses WHERE model = ? AND key = ?", key
+                )
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        with self.store:
+            self.store.execute(
+                "UPDATE gemini_responses SET used_at = ? WHERE model = ? AND key = ?",
+                (now, *key),
+            )
+        return row[0]
+
+    def put(self, model_name: str, contents: Any, text: str) -> None:
+        now = time.time()
+        with self.store:
+            self.store.execute(
+                "INSERT OR REPLACE INTO gemini_responses VALUES (?, ?, ?, ?, ?)",
+                (model_name, response_key(contents), text, now, now),
+            )
+            evicted = self.store.execute(
+                "DELETE FROM gemini_responses WHERE rowid IN ("
+                "SELECT rowid FROM gemini_responses ORDER BY used_at DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+        self.evicted += evicted
+
+    # Returns the cached text of the response, or calls `generate` and caches the text
+    # of its response.
+    def generate(
+        self, model_name: str, contents: Any, generate: Callable[[], Any]
+    ) -> str:
+        text = self.get(model_name, contents)
+        if text is None:
+            text = generate().text
+            # Gemini returns no text for blocked prompts; those are asked again.
+            if text is not None:
+                self.put(model_name, contents, text)
+        return text
+
+
+# One cache per process, shared by every Gemini client.
+@functools.cache
+def get_response_cache() -> ResponseCache:
+    return ResponseCache(store_path=RESPONSE_CACHE_FILE)
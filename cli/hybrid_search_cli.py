@@ -3,30 +3,46 @@ import os
 import sys
 
 from dotenv import load_dotenv
-from hybrid_search.general import run
+from hybrid_search.general import run, run_client
 from hybrid_search.hybrid_search import HybridSearch
 from hybrid_search.opts import get_opts
 from hybrid_search.utils_enhance import QueryEnhancer
 from hybrid_search.utils_logging import new_logger
 from hybrid_search.utils_rerank import LLMReranker
+from search_server.client import SearchClient
 
 
 def main() -> None:
     load_dotenv()
 
+    cli_opts, cli_parser = get_opts()
+
+    if cli_opts.server:
+        try:
+            run_client(cli_opts, cli_parser, SearchClient(cli_opts.server))
+        except Exception as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        return
+
     api_key = os.getenv("GEMINI_API_KEY")
 
     if api_key is None:
         print("Error: Missing Gemini API key")
         sys.exit(1)
 
-    cli_opts, cli_parser = get_opts()
-
     logger = new_logger()
 
-    search = HybridSearch()
+    search = HybridSearch(
+        quantization=cli_opts.quantization, rescore_depth=cli_opts.rescore
+    )
     query_enhancer = QueryEnhancer(api_key)
-    reranker = LLMReranker(api_key)
+    reranker = LLMReranker(
+        api_key,
+        requests_per_minute=cli_opts.rerank_rpm,
+        max_concurrency=cli_opts.rerank_concurrency,
+        cross_encoder_max_length=cli_opts.cross_encoder_max_length,
+    )
 
     try:
         run(cli_opts, cli_parser, logger, search, query_enhancer, reranker)
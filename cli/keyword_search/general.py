@@ -1,10 +1,19 @@
+import subprocess
 import sys
+import time
 from argparse import ArgumentParser, Namespace
+from collections.abc import Callable
+from pathlib import Path
 
 from .inverted_index import BM25_B, BM25_K1, InvertedIndex
-from .text_processing.text_processing import TextProcessingContext, clean_text
+from .text_processing.text_processing import (
+    TextProcessingContext,
+    clean_text,
+    clean_text_pipeline,
+)
 
 BM25_SEARCH_RESULTS_LIMIT = 5
+KEYWORD_SEARCH_CLI = Path(__file__).resolve().parent.parent / "keyword_search_cli.py"
 
 
 def _get_movies_matching_keywords(
@@ -15,22 +24,20 @@ def _get_movies_matching_keywords(
     for keyword in keywords_clean:
         doc_indexes = movie_idx.get_documents(keyword)
         for doc_index in doc_indexes:
-            movie_matches.append(movie_idx.docmap[doc_index])
+            # Movies deleted from the catalog stay in the index until it is updated.
+            if doc_index not in movie_idx.documents:
+                continue
+            movie_matches.append(movie_idx.documents.get(doc_index))
             if len(movie_matches) == 5:
                 return movie_matches
     return movie_matches
 
 
-def load_stopwords(self) -> None:
-    with open(self.stopwords_file_path, "r") as swf:
-        self.stopwords = swf.read().splitlines()
-
-
 def load_index(inverted_index: InvertedIndex) -> None:
     try:
         inverted_index.load()
     except FileNotFoundError as e:
-        print(f"Could not find index or docmap: {e}")
+        print(f"Could not find index: {e}")
         sys.exit(1)
     except Exception as e:
         print(f"Error: {e}")
@@ -47,8 +54,47 @@ def search_command(
         print(f"{i + 1}. {movie['title']}")
 
 
-def build_command(inv_idx: InvertedIndex) -> None:
-    inv_idx.build()
+def build_command(inv_idx: InvertedIndex, workers: int = 1) -> None:
+    if workers < 1:
+        raise ValueError("workers must be at least 1")
+    with inv_idx.write_lock():
+        inv_idx.build(workers)
+
+
+# The merge runs in its own process, detached from this one, so the update returns as
+# soon as its own changes are committed. It waits for the write lock, so the next
+# update waits for the merge instead of committing over it.
+def _merge_in_background() -> None:
+    subprocess.Popen(
+        [sys.executable, str(KEYWORD_SEARCH_CLI), "merge"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def update_command(inv_idx: InvertedIndex) -> None:
+    with inv_idx.write_lock():
+        load_index(inv_idx)
+        start = time.perf_counter()
+        num_changed, num_removed = inv_idx.update()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    print(
+        f"Indexed {num_changed} new or changed movies and deleted {num_removed} "
+        f"in {elapsed_ms:.1f} ms ({len(inv_idx.segments)} segments)"
+    )
+    if inv_idx.needs_merge:
+        _merge_in_background()
+        print("Merging the segments in the background")
+
+
+def merge_command(inv_idx: InvertedIndex) -> None:
+    with inv_idx.write_lock():
+        load_index(inv_idx)
+        num_segments = len(inv_idx.segments)
+        inv_idx.merge()
+    print(f"Merged {num_segments} segments into {len(inv_idx.segments)}")
 
 
 def tf_command(inv_idx: InvertedIndex, doc_id: int, term: str) -> None:
@@ -97,11 +143,54 @@ def bm25_search_command(
     b: float = BM25_B,
 ) -> None:
     load_index(inv_idx)
-    top_matches = inv_idx.bm25_search(query, limit, k1, b)
+    top_matches = [
+        (doc_id, bm25_score)
+        for doc_id, bm25_score in inv_idx.bm25_search(query, limit, k1, b)
+        if doc_id in inv_idx.documents
+    ]
     for i, (doc_id, bm25_score) in enumerate(top_matches):
+        title = inv_idx.documents.get(doc_id)["title"]
+        print(f"{i + 1}. ({doc_id}) {title} - Score: {bm25_score:.2f}")
+
+
+def _time_analyzer(
+    analyzer: Callable[[str, TextProcessingContext], list[str]],
+    texts: list[str],
+    ctx: TextProcessingContext,
+) -> tuple[float, list[list[str]]]:
+    start = time.perf_counter()
+    tokens = [analyzer(text, ctx) for text in texts]
+    return time.perf_counter() - start, tokens
+
+
+def token_bench_command(inv_idx: InvertedIndex, repeat: int = 3) -> None:
+    if repeat < 1:
+        raise ValueError("repeat must be at least 1")
+
+    texts = [
+        f"{movie['title']} {movie['description']}" for movie in inv_idx.documents
+    ] * repeat
+
+    ctx = inv_idx.txt_proc_ctx
+    ctx.stem_cache.clear()
+    pipeline_s, pipeline_tokens = _time_analyzer(clean_text_pipeline, texts, ctx)
+    # The first pass fills the stem cache, the second one only hits it.
+    cold_s, cold_tokens = _time_analyzer(clean_text, texts, ctx)
+    warm_s, warm_tokens = _time_analyzer(clean_text, texts, ctx)
+
+    num_tokens = sum(len(tokens) for tokens in pipeline_tokens)
+    print(f"Texts: {len(texts)}, tokens: {num_tokens}, stems: {len(ctx.stem_cache)}")
+    for name, elapsed_s in (
+        ("pipeline", pipeline_s),
+        ("analyzer (cold cache)", cold_s),
+        ("analyzer (warm cache)", warm_s),
+    ):
         print(
-            f"{i + 1}. ({doc_id}) {inv_idx.docmap[doc_id]['title']} - Score: {bm25_score:.2f}"
+            f"{name:<22}{num_tokens / elapsed_s:>12,.0f} tokens/s "
+            f"({pipeline_s / elapsed_s:.2f}x)"
         )
+    identical = pipeline_tokens == cold_tokens and cold_tokens == warm_tokens
+    print(f"identical tokens: {identical}")
 
 
 def proc(
@@ -114,7 +203,11 @@ def proc(
         case "search":
             search_command(inv_idx, txt_proc_ctx, args.query)
         case "build":
-            build_command(inv_idx)
+            build_command(inv_idx, args.workers)
+        case "update":
+            update_command(inv_idx)
+        case "merge":
+            merge_command(inv_idx)
         case "tf":
             tf_command(inv_idx, args.tf_doc_id, args.tf_term)
         case "idf":
@@ -139,5 +232,7 @@ def proc(
                 args.bm25search_k1,
                 args.bm25search_b,
             )
+        case "tokenbench":
+            token_bench_command(inv_idx, args.repeat)
         case _:
             arg_parser.print_help()
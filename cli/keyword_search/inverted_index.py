@@ -1,114 +1,463 @@
+import fcntl
 import json
 import math
-import pickle
-from collections import Counter
+import os
+import shutil
+from collections import Counter, deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any
+from typing import Any, NamedTuple
 
+import numpy as np
+from document_store.document_store import (
+    DOCUMENT_BATCH_SIZE,
+    DOCUMENT_KEY_DTYPE,
+    DocumentStore,
+    document_key,
+    get_document_store,
+    iter_batches,
+)
 from nltk.stem import PorterStemmer
+from numpy.typing import NDArray
 
+from .segment import IndexSegment, bm25_term_scores, load_segment, new_segment
 from .text_processing.text_processing import TextProcessingContext, clean_text, tokenize
 
-DATA_DIR = "data"
 CACHE_DIR = "./cache"
 BM25_K1 = 1.5
 BM25_B = 0.75
+# Once an update leaves more segments than this, they should be merged back into one
+# (see `needs_merge`).
+MAX_INDEX_SEGMENTS = 8
+WRITE_LOCK_FILE = "write.lock"
+# Files of the single-segment layout that predates segments.
+LEGACY_INDEX_FILES = (
+    "terms.json",
+    "doc_ids.npy",
+    "doc_lengths.npy",
+    "postings_offsets.npy",
+    "postings_docs.npy",
+    "postings_tfs.npy",
+)
 
 
+# Row-sorted posting arrays of a set of movies, in the layout used by segments.
+class ShardPostings(NamedTuple):
+    terms: list[str]
+    doc_lengths: NDArray[np.uint32]
+    offsets: NDArray[np.int64]
+    docs: NDArray[np.uint32]
+    tfs: NDArray[np.uint32]
+
+
+# Module-level so it can run in worker processes. Rows start at `first_row`.
+def _index_shard(
+    movies: list[dict[str, Any]], first_row: int, txt_proc_ctx: TextProcessingContext
+) -> ShardPostings:
+    postings: dict[str, list[int]] = {}
+    term_freqs: dict[str, list[int]] = {}
+    doc_lengths: list[int] = []
+    for row, movie in enumerate(movies, first_row):
+        tokens = clean_text(f"{movie['title']} {movie['description']}", txt_proc_ctx)
+        doc_lengths.append(len(tokens))
+        # Rows are visited in increasing order, so posting lists come out sorted.
+        for token, count in Counter(tokens).items():
+            postings.setdefault(token, []).append(row)
+            term_freqs.setdefault(token, []).append(count)
+
+    terms = sorted(postings)
+    posting_counts = [len(postings[term]) for term in terms]
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(posting_counts, out=offsets[1:])
+    num_postings = int(offsets[-1])
+    return ShardPostings(
+        terms=terms,
+        doc_lengths=np.asarray(doc_lengths, dtype=np.uint32),
+        offsets=offsets,
+        docs=np.fromiter(
+            (row for term in terms for row in postings[term]),
+            dtype=np.uint32,
+            count=num_postings,
+        ),
+        tfs=np.fromiter(
+            (tf for term in terms for tf in term_freqs[term]),
+            dtype=np.uint32,
+            count=num_postings,
+        ),
+    )
+
+
+# Text processing context of a worker process, set once when the worker starts so
+# its stem cache is kept across all the batches the worker indexes.
+_worker_state: dict[str, TextProcessingContext] = {}
+
+
+def _init_index_worker(txt_proc_ctx: TextProcessingContext) -> None:
+    _worker_state["txt_proc_ctx"] = txt_proc_ctx
+
+
+def _index_worker_shard(movies: list[dict[str, Any]], first_row: int) -> ShardPostings:
+    return _index_shard(movies, first_row, _worker_state["txt_proc_ctx"])
+
+
+# Shards cover consecutive row ranges, so a stable sort of all postings by term keeps
+# every posting list sorted by row, exactly as a single serial pass produces it.
+def _merge_shards(shards: list[ShardPostings]) -> ShardPostings:
+    terms = sorted({term for shard in shards for term in shard.terms})
+    term_ids = {term: term_id for term_id, term in enumerate(terms)}
+    posting_terms = np.concatenate(
+        [
+            np.repeat(
+                np.asarray([term_ids[term] for term in shard.terms], dtype=np.int64),
+                np.diff(shard.offsets),
+            )
+            for shard in shards
+        ]
+    )
+    order = np.argsort(posting_terms, kind="stable")
+
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(posting_terms, minlength=len(terms)), out=offsets[1:])
+    return ShardPostings(
+        terms=terms,
+        doc_lengths=np.concatenate([shard.doc_lengths for shard in shards]),
+        offsets=offsets,
+        docs=np.concatenate([shard.docs for shard in shards])[order],
+        tfs=np.concatenate([shard.tfs for shard in shards])[order],
+    )
+
+
+# The index is a list of immutable segments (see `segment.py`) tied together by the
+# manifest in meta.json. Updates write a new segment and/or new tombstones and then
+# atomically replace the manifest, so readers never see a partial update and keep
+# using the segments they have loaded until they reload.
+#
+# Documents are addressed by their global row: segments are laid out one after the
+# other, in manifest order, and rows of deleted documents stay in place (masked out by
+# `live`) until the segments are merged.
 class InvertedIndex:
     def __init__(
         self,
         stemmer: PorterStemmer | None = None,
         txt_proc_ctx: TextProcessingContext | None = None,
+        documents: DocumentStore | None = None,
     ):
-        self.index_path: Path = Path(CACHE_DIR, "index.pkl")
-        self.docmap_path: Path = Path(CACHE_DIR, "docmap.pkl")
-        self.term_freq_path: Path = Path(CACHE_DIR, "term_frequencies.pkl")
-        self.doc_lengths_path: Path = Path(CACHE_DIR, "doc_lengths.pkl")
-        self.movies_file_path: Path = Path(DATA_DIR, "movies.json")
-
-        self.stopwords: list[str] = []
-        self.index: dict[str, set[int]] = {}
-        self.docmap: dict[int, dict[str, int | str]] = {}
-        self.term_frequencies: dict[int, Counter[str]] = {}
-        if stemmer is None:
-            self.__stemmer = PorterStemmer()
-        else:
-            self.__stemmer = stemmer
-        self.doc_lengths: dict[int, int] = {}
+        self.index_dir: Path = Path(CACHE_DIR, "index")
+        # Replaced atomically after every change, so it always describes a complete
+        # index.
+        self.index_path: Path = Path(self.index_dir, "meta.json")
+
         if txt_proc_ctx is None:
             self.txt_proc_ctx = TextProcessingContext(stemmer)
         else:
             self.txt_proc_ctx = txt_proc_ctx
 
+        self.meta: dict[str, Any] = {}
+        self.segments: list[IndexSegment] = []
+        self.row_offsets: NDArray[np.int64] = np.zeros(1, dtype=np.int64)
+        self.doc_ids: NDArray[np.uint32] = np.zeros(0, dtype=np.uint32)
+        self.doc_keys: NDArray[np.bytes_] = np.zeros(0, dtype=DOCUMENT_KEY_DTYPE)
+        self.doc_lengths: NDArray[np.uint32] = np.zeros(0, dtype=np.uint32)
+        # None when no document has been deleted since the last merge.
+        self.live: NDArray[np.bool_] | None = None
+        self.__doc_rows: dict[int, int] | None = None
+        self.__generation: tuple[int, int] | None = None
+        self.__documents = documents
+
+    @property
+    def num_rows(self) -> int:
+        return int(self.row_offsets[-1])
+
+    # The index only keeps ids; titles and descriptions are read from the store, which
+    # is the process-wide one unless another store is given.
+    @property
+    def documents(self) -> DocumentStore:
+        if self.__documents is None:
+            self.__documents = get_document_store()
+        return self.__documents
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.__get_doc_rows())
+
     def __validate_term(self, term: str) -> None:
         term_tok = tokenize(term)
         if len(term_tok) > 1:
             raise ValueError("Expected only one term")
 
-    def __add_document(self, doc_id: int, text: str) -> None:
-        tokens = clean_text(text, self.txt_proc_ctx)
-        self.doc_lengths[doc_id] = len(tokens)
-        self.term_frequencies[doc_id] = Counter()
-        for token in tokens:
-            if token not in self.index:
-                self.index[token] = set()
-            self.index[token].add(doc_id)
-            self.term_frequencies[doc_id][token] += 1
+    def __stem_term(self, term: str) -> str:
+        self.__validate_term(term)
+        return self.txt_proc_ctx.stem(term)
+
+    # Live postings of an (already stemmed) term across all segments, as global rows.
+    def __get_postings(
+        self, term: str
+    ) -> tuple[NDArray[np.uint32], NDArray[np.uint32]]:
+        rows_parts: list[NDArray[np.uint32]] = []
+        tfs_parts: list[NDArray[np.uint32]] = []
+        for segment, row_offset in zip(self.segments, self.row_offsets.tolist()):
+            term_id = segment.terms.get(term)
+            if term_id is None:
+                continue
+            rows, tfs = segment.postings(term_id)
+            if segment.live is not None:
+                keep = segment.live[rows]
+                rows, tfs = rows[keep], tfs[keep]
+            rows_parts.append(rows + np.uint32(row_offset) if row_offset else rows)
+            tfs_parts.append(tfs)
+
+        if len(rows_parts) == 1:
+            return rows_parts[0], tfs_parts[0]
+        if not rows_parts:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.uint32)
+        return np.concatenate(rows_parts), np.concatenate(tfs_parts)
+
+    def __get_doc_rows(self) -> dict[int, int]:
+        if self.__doc_rows is None:
+            self.__doc_rows = {
+                int(doc): row
+                for row, doc in enumerate(self.doc_ids.tolist())
+                if self.live is None or self.live[row]
+            }
+        return self.__doc_rows
+
+    def __get_doc_row(self, doc_id: int) -> int:
+        row = self.__get_doc_rows().get(doc_id)
+        if row is None:
+            raise ValueError(f"Document '{doc_id}' is not in the index")
+        return row
 
     def get_documents(self, term: str) -> list[int]:
-        self.__validate_term(term)
-        stemmed_term = self.__stemmer.stem(term)
-        doc_ids = self.index.get(stemmed_term, None)
-        if doc_ids is None:
-            return []
-        return sorted(doc_ids)
+        rows, _ = self.__get_postings(self.__stem_term(term))
+        return sorted(self.doc_ids[rows].tolist())
+
+    # Segment names are never reused, even by a build that didn't load the index
+    # first, since other processes may still be reading the old segments.
+    def __next_segment_path(self) -> Path:
+        segment_number = self.meta.get("next_segment", 0)
+        segment_path = Path(self.index_dir, f"segment_{segment_number:06d}")
+        while segment_path.exists():
+            segment_number += 1
+            segment_path = Path(self.index_dir, f"segment_{segment_number:06d}")
+        self.meta["next_segment"] = segment_number + 1
+        return segment_path
+
+    # Movies are tokenized in batches of DOCUMENT_BATCH_SIZE, so only one batch per
+    # worker has to be held in memory besides the postings built so far.
+    def __index_batches(
+        self, batches: Iterable[list[dict[str, Any]]], workers: int
+    ) -> list[ShardPostings]:
+        shards: list[ShardPostings] = []
+        first_row = 0
+        if workers <= 1:
+            for batch in batches:
+                shards.append(_index_shard(batch, first_row, self.txt_proc_ctx))
+                first_row += len(batch)
+            return shards
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_index_worker,
+            initargs=(self.txt_proc_ctx,),
+        ) as executor:
+            # Batches are submitted as workers free up rather than all at once.
+            pending: deque[Future[ShardPostings]] = deque()
+            for batch in batches:
+                pending.append(executor.submit(_index_worker_shard, batch, first_row))
+                first_row += len(batch)
+                if len(pending) >= 2 * workers:
+                    shards.append(pending.popleft().result())
+            shards.extend(future.result() for future in pending)
+        return shards
+
+    def __build_segment(
+        self, movies: Iterable[dict[str, Any]], workers: int = 1
+    ) -> IndexSegment:
+        doc_ids: list[int] = []
+        doc_keys: list[bytes] = []
+
+        def batches() -> Iterable[list[dict[str, Any]]]:
+            for batch in iter_batches(movies, DOCUMENT_BATCH_SIZE):
+                for movie in batch:
+                    doc_ids.append(movie["id"])
+                    doc_keys.append(document_key(movie))
+                yield batch
+
+        shards = self.__index_batches(batches(), workers)
+        if len(shards) == 1:
+            postings = shards[0]
+        elif shards:
+            postings = _merge_shards(shards)
+        else:
+            postings = _index_shard([], 0, self.txt_proc_ctx)
+
+        segment = new_segment(
+            self.__next_segment_path(),
+            np.asarray(doc_ids, dtype=np.uint32),
+            np.asarray(doc_keys, dtype=DOCUMENT_KEY_DTYPE),
+            postings.terms,
+            postings.doc_lengths,
+            postings.offsets,
+            postings.docs,
+            postings.tfs,
+        )
+        segment.save()
+        return segment
 
-    def build(self) -> None:
-        with open(self.movies_file_path, "r") as movie_data_file:
-            movie_data: dict[str, list[dict[str, Any]]] = json.load(movie_data_file)
+    # With more than one worker, movies are tokenized (which is dominated by stemming)
+    # in separate processes. The resulting index is byte-identical to a serial build.
+    def build(self, workers: int = 1) -> None:
+        self.meta = {
+            "generation": self.meta.get("generation", 0),
+            "next_segment": self.meta.get("next_segment", 0),
+        }
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.__commit([self.__build_segment(self.documents, workers)])
 
-        for movie in movie_data["movies"]:
-            doc_id: int = movie["id"]
-            self.docmap[doc_id] = movie
+    # Adds the given movies in a new segment. Movies that are already in the index are
+    # replaced: their previous version is deleted.
+    def add_documents(self, movies: list[dict[str, Any]]) -> None:
+        if not movies:
+            return
+        self.__delete_rows([self.__get_doc_rows().get(movie["id"]) for movie in movies])
+        self.__commit(self.segments + [self.__build_segment(movies)])
 
-            self.__add_document(doc_id, f"{movie['title']} {movie['description']}")
+    def delete_documents(self, doc_ids: list[int]) -> None:
+        self.__delete_rows([self.__get_doc_rows().get(doc_id) for doc_id in doc_ids])
+        self.__commit(self.segments)
 
-        self.save()
+    # Brings the index in line with the movies file, only indexing the movies that
+    # were added or changed and deleting the ones that are gone. Returns the number of
+    # added or changed movies and the number of deleted ones.
+    def update(self) -> tuple[int, int]:
+        # Documents are compared through their content keys, so only the changed
+        # ones are ever read from the store.
+        documents = self.documents
+        doc_rows = self.__get_doc_rows()
+        indexed_keys = self.doc_keys.tolist()
+        movie_ids = documents.doc_ids.tolist()
+        changed = [
+            documents.get_row(row)
+            for row, (doc_id, key) in enumerate(
+                zip(movie_ids, documents.doc_keys.tolist())
+            )
+            if doc_id not in doc_rows or indexed_keys[doc_rows[doc_id]] != key
+        ]
+        movie_id_set = set(movie_ids)
+        removed = [doc_id for doc_id in doc_rows if doc_id not in movie_id_set]
+        if not changed and not removed:
+            return 0, 0
+
+        self.__delete_rows([self.__get_doc_rows().get(doc_id) for doc_id in removed])
+        if changed:
+            self.add_documents(changed)
+        else:
+            self.__commit(self.segments)
+        return len(changed), len(removed)
+
+    # Updates don't merge the segments themselves, so they take time proportional to
+    # the changes only. Merging is left to a separate `merge` (the update command
+    # starts one in the background).
+    @property
+    def needs_merge(self) -> bool:
+        return len(self.segments) > MAX_INDEX_SEGMENTS
+
+    # Taken by every command that changes the index, so that a background merge and
+    # an update or build never commit over each other's segments. Readers don't take
+    # it. Writers should (re)load the index once they hold it.
+    @contextmanager
+    def write_lock(self) -> Iterator[None]:
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        with open(Path(self.index_dir, WRITE_LOCK_FILE), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def __delete_rows(self, rows: list[int | None]) -> None:
+        deleted = np.asarray([row for row in rows if row is not None], dtype=np.int64)
+        if len(deleted) == 0:
+            return
+        segment_indices = np.searchsorted(self.row_offsets, deleted, side="right") - 1
+        for segment_index in np.unique(segment_indices).tolist():
+            segment = self.segments[segment_index]
+            segment_rows = deleted[segment_indices == segment_index] - int(
+                self.row_offsets[segment_index]
+            )
+            segment.set_deleted(np.union1d(segment.deleted_rows(), segment_rows))
+            # Marks the tombstones as changed so they are written by the next commit.
+            segment.deleted_file = None
+
+    # Rewrites all live documents into a single segment, dropping deleted documents
+    # for good. Postings are merged directly, without re-tokenizing anything. Readers
+    # keep using the old segments until they reload.
+    def merge(self) -> None:
+        if len(self.segments) <= 1 and self.live is None:
+            return
+
+        if self.live is None:
+            live_rows = np.arange(self.num_rows)
+        else:
+            live_rows = np.flatnonzero(self.live)
+        new_rows = np.full(self.num_rows, -1, dtype=np.int64)
+        new_rows[live_rows] = np.arange(len(live_rows))
+
+        terms = sorted({term for segment in self.segments for term in segment.terms})
+        merged_terms: list[str] = []
+        rows_parts: list[NDArray[np.int64]] = []
+        tfs_parts: list[NDArray[np.uint32]] = []
+        for term in terms:
+            rows, tfs = self.__get_postings(term)
+            if len(rows) == 0:
+                continue
+            merged_terms.append(term)
+            rows_parts.append(new_rows[rows])
+            tfs_parts.append(tfs)
+
+        postings_offsets = np.zeros(len(merged_terms) + 1, dtype=np.int64)
+        np.cumsum([len(rows) for rows in rows_parts], out=postings_offsets[1:])
+        empty = np.zeros(0, dtype=np.uint32)
+        segment = new_segment(
+            self.__next_segment_path(),
+            np.ascontiguousarray(self.doc_ids[live_rows]),
+            np.ascontiguousarray(self.doc_keys[live_rows]),
+            merged_terms,
+            np.ascontiguousarray(self.doc_lengths[live_rows]),
+            postings_offsets,
+            np.concatenate(rows_parts or [empty]).astype(np.uint32),
+            np.concatenate(tfs_parts or [empty]),
+        )
+        segment.save()
+        self.__commit([segment])
 
     def get_tf(self, doc_id: int, term: str) -> int:
-        self.__validate_term(term)
-        stemmed_term = self.__stemmer.stem(term)
-        return self.term_frequencies[doc_id][stemmed_term]
+        row = self.__get_doc_row(doc_id)
+        rows, tfs = self.__get_postings(self.__stem_term(term))
+        pos = int(np.searchsorted(rows, row))
+        if pos < len(rows) and rows[pos] == row:
+            return int(tfs[pos])
+        return 0
 
     def get_idf(self, term: str) -> float:
-        doc_count = len(self.docmap)
+        doc_count = self.num_docs
         term_doc_count = len(self.get_documents(term))
         return math.log((doc_count + 1) / (term_doc_count + 1))
 
+    def __compute_bm25_idf(self, doc_count: int, term_doc_count: int) -> float:
+        return math.log((doc_count - term_doc_count + 0.5) / (term_doc_count + 0.5) + 1)
+
     def get_bm25_idf(self, term: str) -> float:
         self.__validate_term(term)
-        doc_count = len(self.docmap)
+        doc_count = self.num_docs
         term_doc_count = len(self.get_documents(term))
-        return math.log((doc_count - term_doc_count + 0.5) / (term_doc_count + 0.5) + 1)
-
-    def __get_avg_doc_length(self) -> float:
-        num_docs = len(self.doc_lengths)
-        if num_docs == 0:
-            return 0.0
-        doc_lengths_total = 0
-        for doc_length in self.doc_lengths.values():
-            doc_lengths_total += doc_length
-        return doc_lengths_total / num_docs
+        return self.__compute_bm25_idf(doc_count, term_doc_count)
 
     def get_bm25_tf(
         self, doc_id: int, term: str, k1: float = BM25_K1, b: float = BM25_B
     ) -> float:
-        doc_len = self.doc_lengths[doc_id]
-        avg_doc_len = self.__get_avg_doc_length()
-        length_norm = (1 - b) + (b * (doc_len / avg_doc_len))
+        doc_len = int(self.doc_lengths[self.__get_doc_row(doc_id)])
         tf = self.get_tf(doc_id, term)
-        return (tf * (k1 + 1)) / (tf + k1 * length_norm)
+        return bm25_term_scores(tf, doc_len, 1.0, self.meta["avg_doc_length"], k1, b)
 
     def bm25(
         self, doc_id: int, term: str, k1: float = BM25_K1, b: float = BM25_B
@@ -117,42 +466,188 @@ class InvertedIndex:
         bm25_idf = self.get_bm25_idf(term)
         return bm25_tf * bm25_idf
 
+    def __bm25_top_rows(
+        self, query_terms: Counter[str], limit: int, k1: float, b: float
+    ) -> list[tuple[int, float]]:
+        num_docs = self.meta["num_docs"]
+        avg_doc_len = self.meta["avg_doc_length"]
+
+        # Term-at-a-time: each query term's posting list is scored in one vectorized
+        # step and accumulated into the rows it contains.
+        scores = np.zeros(self.num_rows)
+        matched = np.zeros(self.num_rows, dtype=bool)
+        for term, query_term_count in query_terms.items():
+            rows, tfs = self.__get_postings(term)
+            if len(rows) == 0:
+                continue
+            idf = self.__compute_bm25_idf(num_docs, len(rows)) * query_term_count
+            scores[rows] += bm25_term_scores(
+                tfs, self.doc_lengths[rows], idf, avg_doc_len, k1, b
+            )
+            matched[rows] = True
+
+        candidates = np.flatnonzero(matched)
+        candidate_scores = scores[candidates]
+        if len(candidates) > limit > 0:
+            # Keep everything tied with the limit-th best score so ties can be broken
+            # by row below.
+            kth = len(candidates) - limit
+            kth_score = np.partition(candidate_scores, kth)[kth]
+            keep = candidate_scores >= kth_score
+            candidates, candidate_scores = candidates[keep], candidate_scores[keep]
+
+        # Ties are broken by the lowest row, i.e. index order.
+        order = np.lexsort((candidates, -candidate_scores))[:limit]
+        return list(zip(candidates[order].tolist(), candidate_scores[order].tolist()))
+
     def bm25_search(
         self, query: str, limit: int, k1: float = BM25_K1, b: float = BM25_B
     ) -> list[tuple[int, float]]:
-        query_tokens = clean_text(query, self.txt_proc_ctx)
-        scores: dict[int, float] = {}
-        for doc_id in self.docmap:
-            score = 0
-            for query_token in query_tokens:
-                score += self.bm25(doc_id, query_token, k1, b)
-            scores[doc_id] = score
-
-        top_docs = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:limit]
-        return top_docs
-
-    def __serialize(self, file_path: Path, data: dict[Any, Any]) -> None:
-        with open(file_path, "wb") as out_file:
-            pickle.dump(data, out_file)
-
-    def save(self) -> None:
-        cache_dir = Path(CACHE_DIR)
-        if not cache_dir.exists():
-            cache_dir.mkdir(exist_ok=True)
-
-        self.__serialize(self.index_path, self.index)
-        self.__serialize(self.docmap_path, self.docmap)
-        self.__serialize(self.term_freq_path, self.term_frequencies)
-        self.__serialize(self.doc_lengths_path, self.doc_lengths)
-
-    def __unserialize(self, file_path: Path) -> dict[Any, Any]:
-        if not file_path.exists():
-            raise FileNotFoundError(f"could not find file '{file_path}'")
-        with open(file_path, "rb") as fp:
-            return pickle.load(fp)
+        # Query tokens are already stemmed by `clean_text`, so they can be looked up in
+        # the index directly. Repeated tokens contribute once per occurrence.
+        query_terms = Counter(clean_text(query, self.txt_proc_ctx))
+
+        top_rows = self.__bm25_top_rows(query_terms, limit, k1, b)
+
+        top_rows = self.__pad_with_unmatched(top_rows, limit)
+        doc_ids = self.doc_ids[[row for row, _ in top_rows]].tolist()
+        return [(doc_id, score) for doc_id, (_, score) in zip(doc_ids, top_rows)]
+
+    # Documents that match none of the query terms score zero. They are still
+    # returned (in index order) when there are fewer matches than `limit` so callers
+    # such as the hybrid search keep seeing the full candidate list.
+    def __pad_with_unmatched(
+        self, top_rows: list[tuple[int, float]], limit: int
+    ) -> list[tuple[int, float]]:
+        if len(top_rows) >= limit:
+            return top_rows
+        # Fewer results than `limit` means every matching document is in `top_rows`.
+        matched = {row for row, _ in top_rows}
+        for row in range(self.num_rows):
+            if row not in matched and (self.live is None or self.live[row]):
+                top_rows.append((row, 0.0))
+                if len(top_rows) == limit:
+                    break
+        return top_rows
+
+    # meta.json is replaced by every commit, so its modification time and size
+    # identify the generation of the index on disk with a single stat call.
+    def __disk_generation(self) -> tuple[int, int] | None:
+        try:
+            stat = self.index_path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    # Publishes a new version of the index made of `segments`: changed tombstones are
+    # written to new files, the manifest is replaced and whatever it no longer
+    # references is removed.
+    def __commit(self, segments: list[IndexSegment]) -> None:
+        self.meta["generation"] = self.meta.get("generation", 0) + 1
+        for segment in segments:
+            if segment.live is not None and segment.deleted_file is None:
+                segment.save_deleted(f"deleted_{self.meta['generation']:06d}.npy")
+
+        self.meta["segments"] = [
+            {"name": segment.name, "deleted": segment.deleted_file}
+            for segment in segments
+        ]
+        self.__set_segments(segments)
+        live_doc_lengths = (
+            self.doc_lengths if self.live is None else self.doc_lengths[self.live]
+        )
+        num_docs = len(live_doc_lengths)
+        self.meta["num_docs"] = num_docs
+        self.meta["avg_doc_length"] = (
+            int(live_doc_lengths.sum()) / num_docs if num_docs else 0.0
+        )
+
+        tmp_path = self.index_path.with_name(f"{self.index_path.name}.tmp")
+        with open(tmp_path, "w") as meta_file:
+            json.dump(self.meta, meta_file)
+        os.replace(tmp_path, self.index_path)
+        self.__generation = self.__disk_generation()
+        self.__remove_unreferenced()
+
+    def __remove_unreferenced(self) -> None:
+        referenced = {
+            segment["name"]: segment["deleted"] for segment in self.meta["segments"]
+        }
+        for path in self.index_dir.iterdir():
+            if path.is_dir() and path.name.startswith("segment_"):
+                if path.name not in referenced:
+                    shutil.rmtree(path, ignore_errors=True)
+                    continue
+                for deleted_path in path.glob("deleted_*"):
+                    if deleted_path.name != referenced[path.name]:
+                        deleted_path.unlink(missing_ok=True)
+            elif path.name in LEGACY_INDEX_FILES:
+                path.unlink(missing_ok=True)
+
+    def __set_segments(self, segments: list[IndexSegment]) -> None:
+        self.segments = segments
+        self.row_offsets = np.zeros(len(segments) + 1, dtype=np.int64)
+        np.cumsum([segment.num_rows for segment in segments], out=self.row_offsets[1:])
+        if len(segments) == 1:
+            self.doc_ids = segments[0].doc_ids
+            self.doc_keys = segments[0].doc_keys
+            self.doc_lengths = segments[0].doc_lengths
+        else:
+            empty = np.zeros(0, dtype=np.uint32)
+            self.doc_ids = np.concatenate(
+                [segment.doc_ids for segment in segments] or [empty]
+            )
+            self.doc_keys = np.concatenate(
+                [segment.doc_keys for segment in segments]
+                or [np.zeros(0, dtype=DOCUMENT_KEY_DTYPE)]
+            )
+            self.doc_lengths = np.concatenate(
+                [segment.doc_lengths for segment in segments] or [empty]
+            )
+
+        self.live = None
+        if any(segment.live is not None for segment in segments):
+            self.live = np.concatenate(
+                [
+                    (
+                        np.ones(segment.num_rows, dtype=bool)
+                        if segment.live is None
+                        else segment.live
+                    )
+                    for segment in segments
+                ]
+            )
+        self.__doc_rows = None
 
     def load(self) -> None:
-        self.index = self.__unserialize(self.index_path)
-        self.docmap = self.__unserialize(self.docmap_path)
-        self.term_frequencies = self.__unserialize(self.term_freq_path)
-        self.doc_lengths = self.__unserialize(self.doc_lengths_path)
+        # Taken before reading anything, so a commit that happens while loading is
+        # picked up by the next `reload_if_changed`.
+        generation = self.__disk_generation()
+        if generation is None:
+            raise FileNotFoundError(f"could not find file '{self.index_path}'")
+        with open(self.index_path, "r") as meta_file:
+            meta = json.load(meta_file)
+        if "segments" not in meta:
+            raise FileNotFoundError(
+                f"'{self.index_path}' uses an outdated index layout, rebuild the index"
+            )
+
+        self.meta = meta
+        self.__set_segments(
+            [
+                load_segment(Path(self.index_dir, segment["name"]), segment["deleted"])
+                for segment in meta["segments"]
+            ]
+        )
+        self.__generation = generation
+
+    # Reloads the index only if it changed since it was last loaded or committed, and
+    # the document store along with it, since updates change both. Returns whether
+    # either was reloaded.
+    def reload_if_changed(self) -> bool:
+        documents_changed = self.documents.reload_if_changed()
+        generation = self.__disk_generation()
+        if generation is None or generation == self.__generation:
+            return documents_changed
+        self.load()
+        return True
@@ -14,6 +14,22 @@ def get_opts() -> tuple[Namespace, ArgumentParser]:
     build_parser = subparsers.add_parser(
         "build", help="Build inverted index for movie data"
     )
+    build_parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes used to tokenize the movies",
+    )
+
+    update_parser = subparsers.add_parser(
+        "update",
+        help="Index only the movies that were added, changed or removed since the "
+        "index was last built or updated",
+    )
+
+    merge_parser = subparsers.add_parser(
+        "merge", help="Merge the index segments into one, dropping deleted movies"
+    )
 
     tf_parser = subparsers.add_parser(
         "tf", help="Get the number of times a term appears in the specfied document"
@@ -96,4 +112,16 @@ def get_opts() -> tuple[Namespace, ArgumentParser]:
         help="Tunable BM25 b parameter",
     )
 
+    token_bench_parser = subparsers.add_parser(
+        "tokenbench",
+        help="Compare the throughput of the step-by-step text processing pipeline "
+        "and the compiled analyzer over the movie data",
+    )
+    token_bench_parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of times the movie data is processed per analyzer",
+    )
+
     return parser.parse_args(), parser
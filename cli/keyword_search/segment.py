@@ -0,0 +1,149 @@
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from numpy.typing import NDArray
+
+# Columns of an on-disk segment. Documents are identified by their row and every
+# column is a flat array that can be memory-mapped:
+# - doc_ids[row] and doc_keys[row] are the id and content key (see the document store)
+#   of the document indexed at that row. The documents themselves live in the store.
+# - postings_offsets[t]:postings_offsets[t + 1] is the slice of `postings_docs` and
+#   `postings_tfs` holding term t's (row-sorted) posting list and term frequencies.
+SEGMENT_COLUMNS = (
+    "doc_ids",
+    "doc_keys",
+    "doc_lengths",
+    "postings_offsets",
+    "postings_docs",
+    "postings_tfs",
+)
+
+
+def bm25_term_scores(
+    tfs: Any, doc_lengths: Any, idf: float, avg_doc_len: float, k1: float, b: float
+) -> Any:
+    # Works element-wise on arrays as well as on scalars, with the same operation
+    # order so both produce bit-identical scores.
+    length_norm = (1 - b) + (b * (doc_lengths / avg_doc_len))
+    bm25_tf = (tfs * (k1 + 1)) / (tfs + k1 * length_norm)
+    return bm25_tf * idf
+
+
+# A segment is immutable once written. Deleting one of its documents only adds it to
+# the segment's tombstones (`deleted`), which are stored in a separate file so every
+# change to them can be published atomically through the index manifest.
+class IndexSegment:
+    def __init__(
+        self,
+        path: Path,
+        terms: dict[str, int],
+        columns: dict[str, NDArray[Any]],
+    ) -> None:
+        self.path = path
+        self.terms = terms
+        self.doc_ids: NDArray[np.uint32] = columns["doc_ids"]
+        self.doc_keys: NDArray[np.bytes_] = columns["doc_keys"]
+        self.doc_lengths: NDArray[np.uint32] = columns["doc_lengths"]
+        self.postings_offsets: NDArray[np.int64] = columns["postings_offsets"]
+        self.postings_docs: NDArray[np.uint32] = columns["postings_docs"]
+        self.postings_tfs: NDArray[np.uint32] = columns["postings_tfs"]
+
+        self.deleted_file: str | None = None
+        # None when nothing in the segment has been deleted.
+        self.live: NDArray[np.bool_] | None = None
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.doc_ids)
+
+    def postings(self, term_id: int) -> tuple[NDArray[np.uint32], NDArray[np.uint32]]:
+        start = self.postings_offsets[term_id]
+        end = self.postings_offsets[term_id + 1]
+        return self.postings_docs[start:end], self.postings_tfs[start:end]
+
+    def deleted_rows(self) -> NDArray[np.int64]:
+        if self.live is None:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(~self.live)
+
+    def set_deleted(self, deleted_rows: NDArray[np.int64]) -> None:
+        if len(deleted_rows) == 0:
+            self.live = None
+            return
+        self.live = np.ones(self.num_rows, dtype=bool)
+        self.live[deleted_rows] = False
+
+    def save_deleted(self, file_name: str) -> None:
+        tmp_path = Path(self.path, f"{file_name}.tmp")
+        with open(tmp_path, "wb") as deleted_file:
+            np.save(deleted_file, self.deleted_rows(), allow_pickle=False)
+        os.replace(tmp_path, Path(self.path, file_name))
+        self.deleted_file = file_name
+
+    # Segments are written to a temporary directory that is only renamed once it is
+    # complete.
+    def save(self) -> None:
+        tmp_path = self.path.with_name(f"{self.name}.tmp")
+        if tmp_path.exists():
+            shutil.rmtree(tmp_path)
+        tmp_path.mkdir(parents=True)
+
+        for column in SEGMENT_COLUMNS:
+            np.save(Path(tmp_path, f"{column}.npy"), getattr(self, column))
+        with open(Path(tmp_path, "terms.json"), "w") as terms_file:
+            json.dump(list(self.terms), terms_file)
+        os.replace(tmp_path, self.path)
+
+
+def load_segment(path: Path, deleted_file: str | None) -> IndexSegment:
+    # Segments from before the document store kept a pickled docmap instead of keys.
+    if not Path(path, "doc_keys.npy").exists():
+        raise FileNotFoundError(
+            f"'{path}' uses an outdated segment layout, rebuild the index"
+        )
+    with open(Path(path, "terms.json"), "r") as terms_file:
+        terms = {term: term_id for term_id, term in enumerate(json.load(terms_file))}
+    # Columns are memory-mapped; only the pages touched by queries are read.
+    columns = {
+        column: np.load(Path(path, f"{column}.npy"), mmap_mode="r")
+        for column in SEGMENT_COLUMNS
+    }
+
+    segment = IndexSegment(path, terms, columns)
+    if deleted_file is not None:
+        segment.set_deleted(np.load(Path(path, deleted_file), allow_pickle=False))
+        segment.deleted_file = deleted_file
+    return segment
+
+
+# Builds a segment from row-sorted posting arrays.
+def new_segment(
+    path: Path,
+    doc_ids: NDArray[np.uint32],
+    doc_keys: NDArray[np.bytes_],
+    terms: list[str],
+    doc_lengths: NDArray[np.uint32],
+    postings_offsets: NDArray[np.int64],
+    postings_docs: NDArray[np.uint32],
+    postings_tfs: NDArray[np.uint32],
+) -> IndexSegment:
+    columns: dict[str, NDArray[Any]] = {
+        "doc_ids": doc_ids,
+        "doc_keys": doc_keys,
+        "doc_lengths": doc_lengths,
+        "postings_offsets": postings_offsets,
+        "postings_docs": postings_docs,
+        "postings_tfs": postings_tfs,
+    }
+
+    return IndexSegment(
+        path, {term: term_id for term_id, term in enumerate(terms)}, columns
+    )
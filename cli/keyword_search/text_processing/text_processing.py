@@ -6,17 +6,33 @@ from typing import Iterable, TypeVar
 from nltk.stem import PorterStemmer
 
 STOPWORDS_FILE = Path("data/stopwords.txt")
+PUNCTUATION_TABLE = str.maketrans("", "", string.punctuation)
+# Distinct tokens kept in the stem cache. It is emptied once it is full, so a
+# long-lived process (the search server) doesn't keep every token it ever saw.
+STEM_CACHE_SIZE = 1 << 17
 
 
 class TextProcessingContext:
     def __init__(self, stemmer: PorterStemmer | None = None):
         with open(STOPWORDS_FILE, "r") as swf:
-            self.stopwords = swf.read().splitlines()
+            self.stopwords = frozenset(swf.read().splitlines())
 
         if stemmer is None:
             self.stemmer = PorterStemmer()
         else:
             self.stemmer = stemmer
+        # The vocabulary is tiny compared to the number of tokens, so every distinct
+        # token is only stemmed once (until STEM_CACHE_SIZE tokens were seen). Shared
+        # by indexing and querying.
+        self.stem_cache: dict[str, str] = {}
+
+    def stem(self, token: str) -> str:
+        stemmed = self.stem_cache.get(token)
+        if stemmed is None:
+            if len(self.stem_cache) >= STEM_CACHE_SIZE:
+                self.stem_cache.clear()
+            stemmed = self.stem_cache[token] = self.stemmer.stem(token)
+        return stemmed
 
 
 T = TypeVar("T")
@@ -36,8 +52,7 @@ def convert_to_lower(text: str, ctx: TextProcessingContext | None = None) -> str
 
 
 def remove_punctuation(text: str, ctx: TextProcessingContext | None = None) -> str:
-    str_trans_map = str.maketrans("", "", string.punctuation)
-    return text.translate(str_trans_map)
+    return text.translate(PUNCTUATION_TABLE)
 
 
 def tokenize(text: str, ctx: TextProcessingContext | None = None) -> list[str]:
@@ -53,12 +68,31 @@ def remove_stop_words(tokens: list[str], ctx: TextProcessingContext) -> list[str
     return [token for token in tokens if token not in ctx.stopwords]
 
 
+CLEAN_TEXT_STEPS = (
+    convert_to_lower,
+    remove_punctuation,
+    tokenize,
+    remove_stop_words,
+    stem_tokens,
+)
+
+
+# Reference implementation of `clean_text`, one step at a time and without the stem
+# cache.
+def clean_text_pipeline(text: str, ctx: TextProcessingContext) -> list[str]:
+    return _run_pipeline(text, ctx, CLEAN_TEXT_STEPS)
+
+
+# Same result as running CLEAN_TEXT_STEPS, fused into a single pass over the tokens.
 def clean_text(text: str, ctx: TextProcessingContext) -> list[str]:
-    steps = [
-        convert_to_lower,
-        remove_punctuation,
-        tokenize,
-        remove_stop_words,
-        stem_tokens,
-    ]
-    return _run_pipeline(text, ctx, steps)
+    stopwords = ctx.stopwords
+    stem_cache = ctx.stem_cache
+    tokens: list[str] = []
+    for token in text.lower().translate(PUNCTUATION_TABLE).split():
+        if token in stopwords:
+            continue
+        stemmed = stem_cache.get(token)
+        if stemmed is None:
+            stemmed = ctx.stem(token)
+        tokens.append(stemmed)
+    return tokens
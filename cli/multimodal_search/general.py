@@ -1,17 +1,15 @@
-import json
 from argparse import ArgumentParser, Namespace
 from pathlib import Path
 from typing import Any
 
+from document_store.document_store import get_document_store
 from multimodal_search.multimodal_search import MultimodalSearch
 from multimodal_search.opts import get_opts
+from search_server.client import SearchClient
 
-DATA_DIR = "data"
 
-
-def __get_docs() -> list[dict[str, Any]]:
-    with open(Path(DATA_DIR, "movies.json")) as docs:
-        return json.load(docs)["movies"]
+def print_image_embedding(dimensions: int) -> None:
+    print(f"Embedding shape: {dimensions} dimensions")
 
 
 def verify_image_embedding(
@@ -19,14 +17,10 @@ def verify_image_embedding(
 ) -> None:
     image_embedding = mm_searcher.embed_image(cli_opts.image)
 
-    print(f"Embedding shape: {image_embedding.shape[0]} dimensions")
-
+    print_image_embedding(image_embedding.shape[0])
 
-def image_search(
-    cli_opts: Namespace, parser: ArgumentParser, mm_searcher: MultimodalSearch
-) -> None:
-    results = mm_searcher.search_with_image(cli_opts.image)
 
+def print_image_search(results: list[dict[str, Any]]) -> None:
     desc_limit = 100
     padding = 4
     for i, result in enumerate(results):
@@ -37,13 +31,51 @@ def image_search(
         print(f"{' ':<{padding}}{result['description'][:desc_limit]}...")
 
 
+def image_search(
+    cli_opts: Namespace, parser: ArgumentParser, mm_searcher: MultimodalSearch
+) -> None:
+    print_image_search(mm_searcher.search_with_image(cli_opts.image))
+
+
+def build_embeddings(mm_searcher: MultimodalSearch) -> None:
+    text_embeddings = mm_searcher.build_text_embeddings()
+
+    print(f"Cached {len(text_embeddings)} CLIP text embeddings")
+
+
+def run_client(
+    cli_opts: Namespace, parser: ArgumentParser, client: SearchClient
+) -> None:
+    # The server resolves the image path, so send it as an absolute path.
+    match cli_opts.command:
+        case "verify_image_embedding":
+            response = client.request(
+                "verify_image_embedding",
+                {"image": str(Path(cli_opts.image).resolve())},
+            )
+            print_image_embedding(response["dimensions"])
+        case "image_search":
+            response = client.request(
+                "image_search", {"image": str(Path(cli_opts.image).resolve())}
+            )
+            print_image_search(response["results"])
+        case _:
+            parser.print_help()
+
+
 def run() -> None:
     cli_opts, parser = get_opts()
 
-    docs = __get_docs()
-    mm_searcher = MultimodalSearch(docs)
+    # Building the cache is always done locally.
+    if cli_opts.server and cli_opts.command != "build":
+        run_client(cli_opts, parser, SearchClient(cli_opts.server))
+        return
+
+    mm_searcher = MultimodalSearch(get_document_store())
 
     match cli_opts.command:
+        case "build":
+            build_embeddings(mm_searcher)
         case "verify_image_embedding":
             verify_image_embedding(cli_opts, parser, mm_searcher)
         case "image_search":
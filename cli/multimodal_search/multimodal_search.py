@@ -1,45 +1,129 @@
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 import numpy as np
+from document_store.document_store import DocumentStore
 from numpy.typing import NDArray
 from PIL import Image
-from sentence_transformers import SentenceTransformer
+from semantic_search.utils_embedding_cache import (
+    EMBEDDING_KEY_DTYPE,
+    EmbeddingCache,
+    embedding_key,
+    load_embedding_cache,
+    save_embedding_cache,
+    update_embedding_cache,
+)
+from semantic_search.utils_vectors import cosine_top_k, normalize_rows
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
 
 DEFAULT_MODEL = "clip-ViT-B-32"
+CACHE_DIR = "cache"
+# Part of the cache keys, so that changing how documents are turned into text
+# invalidates the cached embeddings.
+TEXT_FORMAT = "{title}: {description}"
 
 
 class MultimodalSearch:
-    def __init__(self, documents: list[dict[str, Any]], model_name: str = "") -> None:
+    def __init__(self, documents: DocumentStore, model_name: str = "") -> None:
         self.model_name = model_name or DEFAULT_MODEL
-        self.model = SentenceTransformer(self.model_name)
         self.documents = documents
 
-        self.texts = [f"{doc['title']}: {doc['description']}" for doc in self.documents]
-        self.text_embeddings = self.model.encode(self.texts, show_progress_bar=True)
+        self.embedding_cache_path = Path(CACHE_DIR, "clip_embeddings.npy")
+        self.embedding_offsets_cache_path = Path(
+            CACHE_DIR, "clip_embedding_offsets.npy"
+        )
+        self.embedding_keys_cache_path = Path(CACHE_DIR, "clip_embedding_keys.npy")
+
+        self.__model: "SentenceTransformer | None" = None
+        # Embedding i belongs to the document at row i of the store, as of the store
+        # generation they were computed for.
+        self.__text_embeddings: NDArray[np.float32] | None = None
+        self.__generation: int | None = None
+
+    # The CLIP model is only loaded once something has to be encoded: an image, or
+    # documents whose text embeddings aren't cached yet.
+    @property
+    def model(self) -> "SentenceTransformer":
+        if self.__model is None:
+            from sentence_transformers import SentenceTransformer
+
+            self.__model = SentenceTransformer(self.model_name)
+        return self.__model
+
+    # Follows the store when it is reloaded, encoding only the documents that changed.
+    @property
+    def text_embeddings(self) -> NDArray[np.float32]:
+        if (
+            self.__text_embeddings is None
+            or self.__generation != self.documents.meta.get("generation")
+        ):
+            self.load_or_create_text_embeddings()
+        return self.__text_embeddings
+
+    def __document_text(self, row: int) -> str:
+        return TEXT_FORMAT.format(**self.documents.get_row(row))
+
+    # The store's content keys already cover the title and the description, so the
+    # documents don't have to be read to check the cache.
+    def __embedding_keys(self) -> NDArray[np.bytes_]:
+        return np.array(
+            [
+                embedding_key(self.model_name, TEXT_FORMAT, doc_key.decode("ascii"))
+                for doc_key in self.documents.doc_keys.tolist()
+            ],
+            dtype=EMBEDDING_KEY_DTYPE,
+        )
+
+    def __update_text_embeddings(
+        self, cache: EmbeddingCache | None
+    ) -> NDArray[np.float32]:
+        updated_cache, _ = update_embedding_cache(
+            cache,
+            self.__embedding_keys(),
+            lambda row: [self.__document_text(row)],
+            lambda texts: self.model.encode(texts, show_progress_bar=True),
+            self.model_name,
+        )
+        if updated_cache is not cache:
+            save_embedding_cache(
+                self.embedding_cache_path,
+                self.embedding_offsets_cache_path,
+                self.embedding_keys_cache_path,
+                updated_cache,
+            )
+
+        self.__text_embeddings = updated_cache.embeddings
+        self.__generation = self.documents.meta.get("generation")
+        return self.__text_embeddings
+
+    # Re-encodes every document, ignoring the cache.
+    def build_text_embeddings(self) -> NDArray[np.float32]:
+        return self.__update_text_embeddings(None)
+
+    # Only documents that are new or whose text changed since the cache was written
+    # are encoded.
+    def load_or_create_text_embeddings(self) -> NDArray[np.float32]:
+        cache = load_embedding_cache(
+            self.embedding_cache_path,
+            self.embedding_offsets_cache_path,
+            self.embedding_keys_cache_path,
+            self.model_name,
+        )
+        return self.__update_text_embeddings(cache)
 
     def embed_image(self, image_path: str):
         with Image.open(Path(image_path)) as im:
             image_embedding = self.model.encode([im])
         return image_embedding[0]
 
-    def __cosine_similarity(
-        self, vec1: NDArray[np.float64], vec2: NDArray[np.float64]
-    ) -> float:
-        dot_product = np.dot(vec1, vec2)
-        norm1 = np.linalg.norm(vec1)
-        norm2 = np.linalg.norm(vec2)
-
-        if norm1 == 0 or norm2 == 0:
-            return 0.0
-
-        return dot_product / (norm1 * norm2)
-
     def search_with_image(self, image_path: str) -> list[dict[str, Any]]:
-        image_embedding = self.embed_image(image_path)
+        image_embedding = normalize_rows(self.embed_image(image_path))
+        doc_indices, scores = cosine_top_k(self.text_embeddings, image_embedding, 5)
         results: list[dict[str, Any]] = []
-        for doc, text_embbedding in zip(self.documents, self.text_embeddings):
-            cosim_score = self.__cosine_similarity(image_embedding, text_embbedding)
+        for doc_index, cosim_score in zip(doc_indices.tolist(), scores.tolist()):
+            doc = self.documents.get_row(doc_index)
             results.append(
                 {
                     "id": doc["id"],
@@ -48,6 +132,4 @@ class MultimodalSearch:
                     "cosine_similarity_score": cosim_score,
                 }
             )
-        return sorted(
-            results, key=lambda x: x["cosine_similarity_score"], reverse=True
-        )[:5]
+        return results
@@ -1,8 +1,11 @@
 from argparse import ArgumentParser, Namespace
 
+from search_server.opts import add_client_opts
+
 
 def get_opts() -> tuple[Namespace, ArgumentParser]:
     parser = ArgumentParser(description="CLI for performing multimodal search.")
+    add_client_opts(parser)
     subparser = parser.add_subparsers(dest="command", help="Available commands")
 
     verify_image_parser = subparser.add_parser(
@@ -12,6 +15,10 @@ def get_opts() -> tuple[Namespace, ArgumentParser]:
         "image", type=str, help="Path to the image to embed"
     )
 
+    subparser.add_parser(
+        "build", help="Encode the movies with CLIP and cache their text embeddings"
+    )
+
     image_search_parser = subparser.add_parser(
         "image_search", help="Search using an image"
     )
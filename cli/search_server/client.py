@@ -0,0 +1,38 @@
+import json
+from typing import Any
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+SEARCH_SERVER_HOST = "127.0.0.1"
+SEARCH_SERVER_PORT = 8765
+SEARCH_CLIENT_TIMEOUT_SECONDS = 300
+
+
+# Deliberately stdlib-only so thin clients don't have to import any of the models.
+class SearchClient:
+    def __init__(
+        self, url: str, timeout: float = SEARCH_CLIENT_TIMEOUT_SECONDS
+    ) -> None:
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def request(self, endpoint: str, payload: dict[str, Any]) -> dict[str, Any]:
+        request = Request(
+            f"{self.url}/{endpoint}",
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return json.load(response)
+        except HTTPError as e:
+            try:
+                message = json.load(e).get("error", e.reason)
+            except ValueError:
+                message = e.reason
+            raise RuntimeError(f"search server error ({e.code}): {message}") from e
+        except URLError as e:
+            raise ConnectionError(
+                f"could not reach search server at '{self.url}': {e.reason}"
+            ) from e
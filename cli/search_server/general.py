@@ -0,0 +1,23 @@
+from argparse import ArgumentParser, Namespace
+from http.server import HTTPServer
+
+from hybrid_search.utils_logging import new_logger
+from search_server.server import SearchService, new_request_handler
+
+
+def run(cli_opts: Namespace, parser: ArgumentParser, api_key: str) -> None:
+    logger = new_logger()
+
+    print("Loading models and indexes...")
+    service = SearchService(api_key, logger, cli_opts.quantization, cli_opts.rescore)
+
+    # Requests are handled one at a time, so the models never have to be shared
+    # between threads.
+    server = HTTPServer((cli_opts.host, cli_opts.port), new_request_handler(service))
+    print(f"Search server listening on http://{cli_opts.host}:{cli_opts.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
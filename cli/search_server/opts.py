@@ -0,0 +1,34 @@
+from argparse import ArgumentParser, Namespace
+
+from search_server.client import SEARCH_SERVER_HOST, SEARCH_SERVER_PORT
+from semantic_search.opts import add_quantization_opts
+
+
+def add_client_opts(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--server",
+        type=str,
+        default=None,
+        help=(
+            "URL of a running search server (e.g. "
+            f"http://{SEARCH_SERVER_HOST}:{SEARCH_SERVER_PORT}) to send the request "
+            "to instead of loading the models locally"
+        ),
+    )
+
+
+def get_opts() -> tuple[Namespace, ArgumentParser]:
+    parser = ArgumentParser(
+        description="Long-lived search server that keeps the models and indexes loaded"
+    )
+    parser.add_argument(
+        "--host", type=str, default=SEARCH_SERVER_HOST, help="Address to listen on"
+    )
+    parser.add_argument(
+        "--port", type=int, default=SEARCH_SERVER_PORT, help="Port to listen on"
+    )
+    add_quantization_opts(parser)
+
+    args = parser.parse_args()
+
+    return args, parser
@@ -0,0 +1,285 @@
+import json
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler
+from logging import Logger
+from typing import Any
+
+import numpy as np
+from augmented_generation.augmented_generation import LLMSummarizer
+from augmented_generation.general import RAG_LIMIT, answer
+from document_store.document_store import DocumentStore
+from hybrid_search.general import cascade_search_results, rrf_search_results
+from hybrid_search.hybrid_search import (
+    HYBRID_LIMIT,
+    RRF_K,
+    WEIGHTED_ALPHA,
+    HybridSearch,
+)
+from hybrid_search.utils_cascade import CascadeRanker, CascadeStage
+from hybrid_search.utils_enhance import QueryEnhancer
+from hybrid_search.utils_rerank import LLMReranker
+from keyword_search.general import BM25_SEARCH_RESULTS_LIMIT
+from multimodal_search.multimodal_search import MultimodalSearch
+from semantic_search.utils_quantize import RESCORE_DEPTH
+
+SEARCH_ENDPOINTS = (
+    "bm25search",
+    "search_chunked",
+    "normalize",
+    "weighted-search",
+    "rrf",
+    "rrf-many",
+    "rrf-search",
+    "cascade-search",
+    "verify_image_embedding",
+    "image_search",
+    "rag",
+)
+# Rankers kept for the most recently used stage configurations, since clients choose
+# the stages (and their budgets) of every request.
+CASCADE_RANKERS_MAX = 16
+
+# Fields an endpoint can't do without. The others have defaults.
+REQUIRED_FIELDS = {
+    "bm25search": ("query",),
+    "search_chunked": ("query",),
+    "normalize": ("scores",),
+    "weighted-search": ("query",),
+    "rrf": ("query",),
+    "rrf-many": ("queries",),
+    "rrf-search": ("query",),
+    "cascade-search": ("query", "stages"),
+    "verify_image_embedding": ("image",),
+    "image_search": ("image",),
+    "rag": ("command", "query"),
+}
+
+
+# Raises a ValueError, which the handler answers with a 400, for requests that can't
+# be handled as sent. Lookups that fail while handling a request are the server's
+# errors (500).
+def check_payload(endpoint: str, payload: Any) -> None:
+    if not isinstance(payload, dict):
+        raise ValueError("The request body must be a JSON object")
+    for field in REQUIRED_FIELDS.get(endpoint, ()):
+        if field not in payload:
+            raise ValueError(f"Missing field '{field}'")
+
+
+# Holds every model and index for the lifetime of the server so requests only pay
+# for the actual search.
+class SearchService:
+    def __init__(
+        self,
+        api_key: str,
+        logger: Logger,
+        quantization: str | None = None,
+        rescore_depth: int = RESCORE_DEPTH,
+    ) -> None:
+        self.logger = logger
+        # Its own store rather than the process-wide one, since the server reloads it
+        # whenever another process builds a new generation.
+        documents = DocumentStore()
+        documents.load()
+        self.searcher = HybridSearch(
+            documents, quantization=quantization, rescore_depth=rescore_depth
+        )
+        self.query_enhancer = QueryEnhancer(api_key)
+        self.reranker = LLMReranker(api_key)
+        self.rag_client = LLMSummarizer(api_key=api_key)
+        self.mm_searcher = MultimodalSearch(self.searcher.documents)
+        # One ranker per stage configuration, so that each keeps the cost estimates
+        # its latency budgets rely on across requests.
+        self.cascade_rankers: OrderedDict[tuple[CascadeStage, ...], CascadeRanker] = (
+            OrderedDict()
+        )
+
+        # Everything is created lazily; load it all now so that the first request
+        # doesn't pay for it.
+        _ = self.searcher.idx
+        _ = self.searcher.semantic_search
+        if quantization is not None:
+            self.searcher.semantic_search.load_or_create_chunk_int8()
+        _ = self.query_enhancer.client
+        _ = self.reranker.client
+        _ = self.reranker.cross_encoder
+        _ = self.rag_client.client
+        _ = self.mm_searcher.text_embeddings
+
+    def __cascade_ranker(self, stages: tuple[CascadeStage, ...]) -> CascadeRanker:
+        ranker = self.cascade_rankers.get(stages)
+        if ranker is None:
+            ranker = CascadeRanker(
+                self.searcher, self.reranker, self.query_enhancer, stages
+            )
+            self.cascade_rankers[stages] = ranker
+            while len(self.cascade_rankers) > CASCADE_RANKERS_MAX:
+                self.cascade_rankers.popitem(last=False)
+        else:
+            self.cascade_rankers.move_to_end(stages)
+        return ranker
+
+    def handle(self, endpoint: str, payload: dict[str, Any]) -> dict[str, Any]:
+        match endpoint:
+            case "bm25search":
+                limit = payload.get("limit", BM25_SEARCH_RESULTS_LIMIT)
+                self.searcher.reload_if_changed()
+                matches = self.searcher.idx.bm25_search(payload["query"], limit)
+                return {
+                    "results": [
+                        {
+                            "id": doc_id,
+                            "title": self.searcher.documents.get(doc_id)["title"],
+                            "score": score,
+                        }
+                        for doc_id, score in matches
+                        if doc_id in self.searcher.documents
+                    ]
+                }
+            case "search_chunked":
+                self.searcher.reload_if_changed()
+                return {
+                    "results": self.searcher.semantic_search.search_chunks(
+                        payload["query"],
+                        payload.get("limit", HYBRID_LIMIT),
+                        payload.get("num_probes"),
+                    )
+                }
+            case "normalize":
+                return {"scores": self.searcher.normalize(payload["scores"])}
+            case "weighted-search":
+                return {
+                    "results": self.searcher.weighted_search(
+                        payload["query"],
+                        payload.get("alpha", WEIGHTED_ALPHA),
+                        payload.get("limit", HYBRID_LIMIT),
+                        payload.get("num_probes"),
+                        payload.get("depth"),
+                        payload.get("adaptive_depth", False),
+                    )
+                }
+            case "rrf":
+                return {
+                    "results": self.searcher.rrf_search(
+                        payload["query"],
+                        payload.get("k", RRF_K),
+                        payload.get("limit", HYBRID_LIMIT),
+                        payload.get("num_probes"),
+                        payload.get("depth"),
+                        payload.get("adaptive_depth", False),
+                    )
+                }
+            case "rrf-many":
+                return {
+                    "results": self.searcher.rrf_search_many(
+                        payload["queries"],
+                        payload.get("k", RRF_K),
+                        payload.get("limit", HYBRID_LIMIT),
+                        payload.get("num_probes"),
+                        payload.get("depth"),
+                        payload.get("adaptive_depth", False),
+                    )
+                }
+            case "rrf-search":
+                return rrf_search_results(
+                    self.logger,
+                    self.searcher,
+                    self.query_enhancer,
+                    self.reranker,
+                    payload["query"],
+                    payload.get("k", RRF_K),
+                    payload.get("limit", HYBRID_LIMIT),
+                    payload.get("evaluate", False),
+                    payload.get("enhance"),
+                    payload.get("rerank_method"),
+                    payload.get("num_probes"),
+                    payload.get("depth"),
+                    payload.get("adaptive_depth", False),
+                )
+            case "cascade-search":
+                stages = tuple(CascadeStage(*stage) for stage in payload["stages"])
+                return cascade_search_results(
+                    self.__cascade_ranker(stages),
+                    payload["query"],
+                    payload.get("limit", HYBRID_LIMIT),
+                    payload.get("k", RRF_K),
+                    payload.get("num_probes"),
+                    payload.get("enhance"),
+                )
+            case "verify_image_embedding":
+                image_embedding = self.mm_searcher.embed_image(payload["image"])
+                return {"dimensions": image_embedding.shape[0]}
+            case "image_search":
+                self.searcher.reload_if_changed()
+                return {"results": self.mm_searcher.search_with_image(payload["image"])}
+            case "rag":
+                return answer(
+                    self.searcher,
+                    self.rag_client,
+                    payload["command"],
+                    payload["query"],
+                    payload.get("limit", RAG_LIMIT),
+                )
+            case _:
+                raise ValueError(f"Unknown endpoint '{endpoint}'")
+
+
+def _to_json(data: Any) -> Any:
+    # Scores coming out of numpy (e.g. cross-encoder scores) aren't JSON serializable.
+    if isinstance(data, np.generic):
+        return data.item()
+    raise TypeError(f"Object of type {type(data).__name__} is not JSON serializable")
+
+
+def new_request_handler(service: SearchService) -> type[BaseHTTPRequestHandler]:
+    class SearchRequestHandler(BaseHTTPRequestHandler):
+        def __send_json(self, status: int, data: dict[str, Any]) -> None:
+            body = json.dumps(data, default=_to_json).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            if self.path.strip("/") == "health":
+                self.__send_json(
+                    200,
+                    {
+                        "status": "ok",
+                        "query_cache": service.searcher.query_cache.stats(),
+                        # Shared by the enhancer, the reranker and the RAG client.
+                        "response_cache": service.reranker.response_cache.stats(),
+                    },
+                )
+            else:
+                self.__send_json(404, {"error": f"Unknown endpoint '{self.path}'"})
+
+        def do_POST(self) -> None:
+            endpoint = self.path.strip("/")
+            if endpoint not in SEARCH_ENDPOINTS:
+                self.__send_json(404, {"error": f"Unknown endpoint '{self.path}'"})
+                return
+
+            try:
+                content_length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(content_length) or b"{}")
+            except ValueError as e:
+                self.__send_json(400, {"error": f"Invalid JSON body: {e}"})
+                return
+
+            try:
+                check_payload(endpoint, payload)
+                response = service.handle(endpoint, payload)
+            except ValueError as e:
+                self.__send_json(400, {"error": str(e)})
+            except Exception as e:
+                service.logger.exception("error handling '%s'", endpoint)
+                self.__send_json(500, {"error": str(e)})
+            else:
+                self.__send_json(200, response)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            service.logger.info(format, *args)
+
+    return SearchRequestHandler
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+import os
+import sys
+
+from dotenv import load_dotenv
+from search_server.general import run
+from search_server.opts import get_opts
+
+
+def main() -> None:
+    load_dotenv()
+
+    api_key = os.getenv("GEMINI_API_KEY")
+
+    if api_key is None:
+        print("Error: Missing Gemini API key")
+        sys.exit(1)
+
+    cli_opts, cli_parser = get_opts()
+
+    try:
+        run(cli_opts, cli_parser, api_key)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
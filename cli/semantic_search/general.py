@@ -1,10 +1,13 @@
 from argparse import ArgumentParser, Namespace
 
 from semantic_search.semantic_search import (
+    ann_recall,
+    build_ann,
     chunk,
     embed_chunks,
     embed_query_text,
     embed_text,
+    quantize_chunks,
     search,
     search_chunks,
     semantic_chunk_pretty,
@@ -34,6 +37,23 @@ def proc(cli_opts: Namespace, opt_parser: ArgumentParser) -> None:
         case "embed_chunks":
             embed_chunks()
         case "search_chunked":
-            search_chunks(cli_opts.text, cli_opts.limit)
+            search_chunks(
+                cli_opts.text,
+                cli_opts.limit,
+                cli_opts.ann_probes,
+                cli_opts.quantization,
+                cli_opts.rescore,
+            )
+        case "quantize_chunks":
+            quantize_chunks()
+        case "build_ann":
+            build_ann(cli_opts.lists)
+        case "ann_recall":
+            ann_recall(
+                cli_opts.ann_recall_queries,
+                cli_opts.limit,
+                cli_opts.probes,
+                cli_opts.lists,
+            )
         case _:
             opt_parser.print_help()
@@ -1,5 +1,38 @@
 from argparse import ArgumentParser, Namespace
 
+from semantic_search.utils_ann import IVF_NUM_PROBES
+from semantic_search.utils_quantize import QUANTIZATION_METHODS, RESCORE_DEPTH
+
+
+def add_ann_opts(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--ann-probes",
+        type=int,
+        nargs="?",
+        const=IVF_NUM_PROBES,
+        default=None,
+        help=(
+            "Search the chunks approximately with the IVF index, scanning this many "
+            f"of its lists (default: {IVF_NUM_PROBES}) instead of every chunk"
+        ),
+    )
+
+
+def add_quantization_opts(parser: ArgumentParser) -> None:
+    parser.add_argument(
+        "--quantization",
+        type=str,
+        choices=QUANTIZATION_METHODS,
+        default=None,
+        help="Score the chunks from quantized embeddings",
+    )
+    parser.add_argument(
+        "--rescore",
+        type=int,
+        default=RESCORE_DEPTH,
+        help="Number of best quantized scores recomputed at full precision",
+    )
+
 
 def get_opts() -> tuple[Namespace, ArgumentParser]:
     parser = ArgumentParser(description="Semantic Search CLI")
@@ -66,6 +99,47 @@ def get_opts() -> tuple[Namespace, ArgumentParser]:
     search_chunked.add_argument(
         "--limit", "-n", type=int, default=5, help="Number of results to display"
     )
+    add_ann_opts(search_chunked)
+    add_quantization_opts(search_chunked)
+
+    subparsers.add_parser(
+        "quantize_chunks", help="Quantize the chunk embeddings to int8 codes"
+    )
+
+    build_ann_parser = subparsers.add_parser(
+        "build_ann", help="Build the IVF index over the chunk embeddings"
+    )
+    build_ann_parser.add_argument(
+        "--lists",
+        type=int,
+        default=None,
+        help="Number of IVF lists (default: about the square root of the chunk count)",
+    )
+
+    ann_recall_parser = subparsers.add_parser(
+        "ann_recall",
+        help="Compare the recall and latency of the IVF chunk search with the exact "
+        "scan for the given queries",
+    )
+    ann_recall_parser.add_argument(
+        "ann_recall_queries", type=str, nargs="+", help="Queries to search"
+    )
+    ann_recall_parser.add_argument(
+        "--limit", "-n", type=int, default=10, help="k for recall@k"
+    )
+    ann_recall_parser.add_argument(
+        "--probes",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4, 8, 16, 32],
+        help="Numbers of IVF lists to scan per query",
+    )
+    ann_recall_parser.add_argument(
+        "--lists",
+        type=int,
+        default=None,
+        help="Rebuild the IVF index with this many lists first",
+    )
 
     args = parser.parse_args()
 
@@ -1,23 +1,75 @@
-import json
 import re
 import string
+import time
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any, NamedTuple
 
 import numpy as np
+from document_store.document_store import DocumentStore, get_document_store
 from numpy.typing import NDArray
-from sentence_transformers import SentenceTransformer
+from semantic_search.utils_ann import IVFIndex, build_ivf_index, ivf_candidates
+from semantic_search.utils_embedding_cache import (
+    EMBEDDING_KEY_DTYPE,
+    EmbeddingCache,
+    embedding_key,
+    load_array,
+    load_embedding_cache,
+    save_array,
+    save_embedding_cache,
+    update_embedding_cache,
+)
+from semantic_search.utils_quantize import (
+    QUANTIZATION_METHODS,
+    RESCORE_DEPTH,
+    Int8Embeddings,
+    int8_similarities,
+    int8_similarities_many,
+    quantize_int8,
+)
+from semantic_search.utils_query_cache import (
+    QueryEmbeddingCache,
+    get_query_embedding_cache,
+)
+from semantic_search.utils_vectors import (
+    cosine_similarities,
+    cosine_similarities_many,
+    cosine_top_k,
+    cosine_top_k_many,
+    normalize_rows,
+    top_k_indices,
+)
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
 
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+CHUNK_MAX_SIZE = 4
+CHUNK_OVERLAP = 1
+# Number of queries scored per matrix-matrix product by the `*_many` searches, which
+# bounds the size of the (queries x embeddings) score matrix.
+QUERY_BATCH_SIZE = 64
 CACHE_DIR = "cache"
-MOVIES_FILE_PATH = "data/movies.json"
 SCORE_PRECISION = 2
+# Part of the cache keys, so that changing how documents are turned into text
+# invalidates the cached embeddings.
+DOCUMENT_TEXT_FORMAT = "{title}: {description}"
 
 
-# Need to find a better place to put this. Leave it here for now.
-def _load_movies() -> list[dict[str, Any]]:
-    with open(Path(MOVIES_FILE_PATH), "r") as mfiles:
-        return json.load(mfiles)["movies"]
+def _document_text(doc: dict[str, Any]) -> str:
+    return DOCUMENT_TEXT_FORMAT.format(**doc)
+
+
+# Cache keys of the documents of the store, one per document. The store's content
+# keys already cover the title and the description, so no document has to be read to
+# check the cache. `parts` say how the documents are encoded.
+def _document_embedding_keys(documents: DocumentStore, *parts: str) -> NDArray[Any]:
+    return np.array(
+        [
+            embedding_key(*parts, doc_key.decode("ascii"))
+            for doc_key in documents.doc_keys.tolist()
+        ],
+        dtype=EMBEDDING_KEY_DTYPE,
+    )
 
 
 def verify_model() -> None:
@@ -28,7 +80,7 @@ def verify_model() -> None:
 
 def embed_text(text: str) -> None:
     sem_search = SemanticSearch()
-    embedding: NDArray[np.float64] = sem_search.generate_embedding(text)
+    embedding = sem_search.generate_embedding(text)
 
     print(f"Text: {text}")
     print(f"First 3 dimensions: {embedding[:3]}")
@@ -37,11 +89,11 @@ def embed_text(text: str) -> None:
 
 def verify_embeddings() -> None:
     sem_search = SemanticSearch()
-    docs: list[dict[str, Any]] = _load_movies()
+    documents = get_document_store()
 
-    embeddings = sem_search.load_or_create_embeddings(docs)
+    embeddings = sem_search.load_or_create_embeddings(documents)
 
-    print(f"Number of docs: {len(docs)}")
+    print(f"Number of docs: {len(documents)}")
     print(
         f"Embeddings shape: {embeddings.shape[0]} vectors in {embeddings.shape[1]} dimensions"
     )
@@ -56,23 +108,11 @@ def embed_query_text(query: str) -> None:
     print(f"Shape: {embedding.shape}")
 
 
-# Need to find a better place to put this. Leave it here for now.
-def _cosine_similarity(vec1: NDArray[np.float64], vec2: NDArray[np.float64]) -> float:
-    dot_product = np.dot(vec1, vec2)
-    norm1 = np.linalg.norm(vec1)
-    norm2 = np.linalg.norm(vec2)
-
-    if norm1 == 0 or norm2 == 0:
-        return 0.0
-
-    return dot_product / (norm1 * norm2)
-
-
 def search(query: str, limit: int) -> None:
     sem_search = SemanticSearch()
-    docs: list[dict[str, Any]] = _load_movies()
+    documents = get_document_store()
 
-    _ = sem_search.load_or_create_embeddings(docs)
+    _ = sem_search.load_or_create_embeddings(documents)
 
     results = sem_search.search(query, limit)
     padding = 4
@@ -166,20 +206,28 @@ def semantic_chunk_pretty(text: str, max_chunk_size: int = 4, overlap: int = 0)
 
 def embed_chunks() -> None:
     chunked_sem_search = ChunkedSemanticSearch()
-    docs: list[dict[str, Any]] = _load_movies()
+    documents = get_document_store()
 
-    embeddings = chunked_sem_search.load_or_create_chunk_embeddings(docs)
+    embeddings = chunked_sem_search.load_or_create_chunk_embeddings(documents)
 
     print(f"Generated {len(embeddings)} chunked embeddings")
 
 
-def search_chunks(query: str, limit: int) -> None:
-    chunked_sem_search = ChunkedSemanticSearch()
-    docs: list[dict[str, Any]] = _load_movies()
+def search_chunks(
+    query: str,
+    limit: int,
+    num_probes: int | None = None,
+    quantization: str | None = None,
+    rescore_depth: int = RESCORE_DEPTH,
+) -> None:
+    chunked_sem_search = ChunkedSemanticSearch(
+        quantization=quantization, rescore_depth=rescore_depth
+    )
+    documents = get_document_store()
 
-    _ = chunked_sem_search.load_or_create_chunk_embeddings(docs)
+    _ = chunked_sem_search.load_or_create_chunk_embeddings(documents)
 
-    results = chunked_sem_search.search_chunks(query, limit)
+    results = chunked_sem_search.search_chunks(query, limit, num_probes)
     padding = 4
     for i, result in enumerate(results):
         left_num = f"{i + 1}."
@@ -187,55 +235,181 @@ def search_chunks(query: str, limit: int) -> None:
         print(f"{' ':<{padding}}{result['description']} ...")
 
 
-class SemanticSearch:
-    def __init__(self, model_name: str = EMBEDDING_MODEL) -> None:
-        self.embedding_cache_path = Path(CACHE_DIR, "movie_embeddings.npy")
+def quantize_chunks() -> None:
+    chunked_sem_search = ChunkedSemanticSearch()
+    documents = get_document_store()
 
-        self.model = SentenceTransformer(model_name)
-        self.embeddings: list[NDArray[np.float64]] | None = None
-        self.documents: list[dict[str, Any]] | None = None
-        self.document_map: dict[int, dict[str, Any]] | None = None
+    embeddings = chunked_sem_search.load_or_create_chunk_embeddings(documents)
+    quantized = chunked_sem_search.build_chunk_int8()
 
-    def generate_embedding(self, text: str) -> NDArray[np.float64]:
-        if text == "" or text.isspace():
-            raise ValueError("Text cannot be empty or whitespace only.")
+    float_mb = embeddings.nbytes / 1e6
+    int8_mb = (quantized.codes.nbytes + quantized.scales.nbytes) / 1e6
+    print(f"Quantized {len(embeddings)} chunk embeddings to int8")
+    print(
+        f"Size: {float_mb:.2f} MB as float32, {int8_mb:.2f} MB as int8 "
+        f"({float_mb / int8_mb:.1f}x smaller)"
+    )
 
-        embeddings = self.model.encode([text])
 
-        return embeddings[0]
+def build_ann(num_lists: int | None = None) -> None:
+    chunked_sem_search = ChunkedSemanticSearch()
+    documents = get_document_store()
+
+    embeddings = chunked_sem_search.load_or_create_chunk_embeddings(documents)
+    index = chunked_sem_search.build_chunk_ivf(num_lists)
+
+    list_sizes = np.diff(index.offsets)
+    print(f"Built an IVF index of {len(embeddings)} chunks in {index.num_lists} lists")
+    if index.num_lists > 0:
+        print(
+            f"List sizes: min {list_sizes.min()}, mean {list_sizes.mean():.1f}, "
+            f"max {list_sizes.max()}"
+        )
+
+
+def _time_chunk_searches(
+    chunked_sem_search: "ChunkedSemanticSearch",
+    queries: list[str],
+    limit: int,
+    num_probes: int | None,
+) -> tuple[float, list[list[int]]]:
+    start = time.perf_counter()
+    results = [
+        chunked_sem_search.search_chunks(query, limit, num_probes) for query in queries
+    ]
+    elapsed_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    return elapsed_ms, [[result["id"] for result in hits] for hits in results]
+
+
+# Recall@k of the IVF search against the exact scan: the fraction of the exact top-k
+# movies that the approximate search also returns, averaged over the queries.
+def ann_recall(
+    queries: list[str],
+    limit: int,
+    probes: list[int],
+    num_lists: int | None = None,
+) -> None:
+    chunked_sem_search = ChunkedSemanticSearch()
+    documents = get_document_store()
 
-    def build_embeddings(self, documents: list[dict[str, Any]]) -> NDArray[np.float64]:
-        self.documents = documents
-        doc_text: list[str] = []
-        self.document_map = {}
-        for doc in self.documents:
-            self.document_map[doc["id"]] = doc
-            doc_text.append(f"{doc['title']}: {doc['description']}")
+    embeddings = chunked_sem_search.load_or_create_chunk_embeddings(documents)
+    index = chunked_sem_search.load_or_create_chunk_ivf(num_lists)
+    # Embeds the queries up front so that encoding them isn't timed.
+    chunked_sem_search.generate_embeddings(queries)
 
-        self.embeddings = self.model.encode(doc_text, show_progress_bar=True)
+    exact_ms, exact_ids = _time_chunk_searches(chunked_sem_search, queries, limit, None)
+    print(
+        f"Chunks: {len(embeddings)}, lists: {index.num_lists}, "
+        f"queries: {len(queries)}, k: {limit}"
+    )
+    print(f"{'exact':<12}recall@{limit}: 1.0000  {exact_ms:.3f} ms/query")
+    for num_probes in probes:
+        ivf_ms, ivf_ids = _time_chunk_searches(
+            chunked_sem_search, queries, limit, num_probes
+        )
+        recalls = [
+            len(set(exact) & set(approximate)) / len(exact)
+            for exact, approximate in zip(exact_ids, ivf_ids)
+            if exact
+        ]
+        recall = sum(recalls) / len(recalls) if recalls else 1.0
+        name = f"probes={num_probes}"
+        print(
+            f"{name:<12}recall@{limit}: {recall:.4f}  {ivf_ms:.3f} ms/query "
+            f"({exact_ms / ivf_ms:.2f}x)"
+        )
 
-        if not self.embedding_cache_path.parent.exists():
-            self.embedding_cache_path.parent.mkdir()
-        with open(self.embedding_cache_path, "wb") as ecache:
-            np.save(ecache, self.embeddings)
 
+class SemanticSearch:
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL,
+        query_cache: QueryEmbeddingCache | None = None,
+    ) -> None:
+        self.embedding_cache_path = Path(CACHE_DIR, "movie_embeddings.npy")
+        self.embedding_offsets_cache_path = Path(
+            CACHE_DIR, "movie_embedding_offsets.npy"
+        )
+        self.embedding_keys_cache_path = Path(CACHE_DIR, "movie_embedding_keys.npy")
+
+        self.model_name = model_name
+        if query_cache is None:
+            query_cache = get_query_embedding_cache()
+        self.query_cache = query_cache
+        self.__model: "SentenceTransformer | None" = None
+        self.embeddings: NDArray[np.float32] | None = None
+        # Embedding i belongs to the document at row i of the store.
+        self.documents: DocumentStore | None = None
+
+    # Importing sentence_transformers (and torch) takes seconds, so neither the import
+    # nor the model load happens until something actually needs to encode text.
+    @property
+    def model(self) -> "SentenceTransformer":
+        if self.__model is None:
+            from sentence_transformers import SentenceTransformer
+
+            self.__model = SentenceTransformer(self.model_name)
+        return self.__model
+
+    # Query embeddings go through the query cache, so the model is only loaded (and
+    # run) for queries that haven't been seen before.
+    def generate_embedding(self, text: str) -> NDArray[np.float32]:
+        return self.generate_embeddings([text])[0]
+
+    # Encodes all the texts that aren't cached in a single batch.
+    def generate_embeddings(self, texts: list[str]) -> NDArray[np.float32]:
+        for text in texts:
+            if text == "" or text.isspace():
+                raise ValueError("Text cannot be empty or whitespace only.")
+
+        return self.query_cache.embed(
+            self.model_name, texts, lambda missing: self.model.encode(missing)
+        )
+
+    def _encode_texts(self, texts: list[str]) -> NDArray[Any]:
+        return self.model.encode(texts, show_progress_bar=True)
+
+    def __update_embeddings(
+        self, documents: DocumentStore, cache: EmbeddingCache | None
+    ) -> NDArray[np.float32]:
+        keys = _document_embedding_keys(
+            documents, self.model_name, DOCUMENT_TEXT_FORMAT
+        )
+        updated_cache, _ = update_embedding_cache(
+            cache,
+            keys,
+            lambda doc_index: [_document_text(documents.get_row(doc_index))],
+            self._encode_texts,
+            self.model_name,
+        )
+        if updated_cache is not cache:
+            save_embedding_cache(
+                self.embedding_cache_path,
+                self.embedding_offsets_cache_path,
+                self.embedding_keys_cache_path,
+                updated_cache,
+            )
+
+        self.documents = documents
+        self.embeddings = updated_cache.embeddings
         return self.embeddings
 
-    def load_or_create_embeddings(
-        self, documents: list[dict[str, Any]]
-    ) -> NDArray[np.float64]:
-        if self.embedding_cache_path.exists():
-            with open(self.embedding_cache_path, "rb") as ecache:
-                self.embeddings = np.load(ecache, allow_pickle=True)
-        if self.embeddings is None or (len(self.embeddings) != len(documents)):
-            self.embeddings = self.build_embeddings(documents)
+    # Re-encodes every document, ignoring the cache.
+    def build_embeddings(self, documents: DocumentStore) -> NDArray[np.float32]:
+        return self.__update_embeddings(documents, None)
 
-        if self.documents is None:
-            self.documents = documents
-            for doc in self.documents:
-                self.document_map[doc["id"]] = doc
-
-        return self.embeddings
+    # Only documents that are new or whose text changed since the cache was written
+    # are encoded.
+    def load_or_create_embeddings(
+        self, documents: DocumentStore
+    ) -> NDArray[np.float32]:
+        cache = load_embedding_cache(
+            self.embedding_cache_path,
+            self.embedding_offsets_cache_path,
+            self.embedding_keys_cache_path,
+            self.model_name,
+        )
+        return self.__update_embeddings(documents, cache)
 
     def search(self, query: str, limit: int) -> list[dict[str, Any]]:
         if self.embeddings is None:
@@ -243,151 +417,400 @@ class SemanticSearch:
                 "No embeddings loaded. Call `load_or_create_embeddings` first."
             )
 
-        query_embedding = self.generate_embedding(query)
-        query_cosine_sim_scores: list[tuple[float, dict[str, int | str]]] = []
-        for doc, doc_embedding in zip(self.documents, self.embeddings):
-            cosim_score = _cosine_similarity(query_embedding, doc_embedding)
-            query_cosine_sim_scores.append((cosim_score, doc))
-
-        query_cosine_sim_scores.sort(key=lambda x: x[0], reverse=True)
-        return [
-            {
-                "score": cosim_score,
-                "title": doc["title"],
-                "description": doc["description"],
-            }
-            for cosim_score, doc in query_cosine_sim_scores[:limit]
-        ]
+        query_embedding = normalize_rows(self.generate_embedding(query))
+        doc_indices, scores = cosine_top_k(self.embeddings, query_embedding, limit)
+        return self.__search_results(doc_indices, scores)
 
+    # Same results as calling `search` for every query (up to float rounding of the
+    # scores), but the queries are encoded in one batch and scored with matrix-matrix
+    # products.
+    def search_many(self, queries: list[str], limit: int) -> list[list[dict[str, Any]]]:
+        if self.embeddings is None:
+            raise ValueError(
+                "No embeddings loaded. Call `load_or_create_embeddings` first."
+            )
+        if not queries:
+            return []
+
+        query_embeddings = normalize_rows(self.generate_embeddings(queries))
+        results: list[list[dict[str, Any]]] = []
+        for start in range(0, len(queries), QUERY_BATCH_SIZE):
+            for doc_indices, scores in cosine_top_k_many(
+                self.embeddings,
+                query_embeddings[start : start + QUERY_BATCH_SIZE],
+                limit,
+            ):
+                results.append(self.__search_results(doc_indices, scores))
+        return results
 
-class ChunkedSemanticSearch(SemanticSearch):
-    def __init__(self, model_name: str = EMBEDDING_MODEL) -> None:
-        super().__init__(model_name)
-        self.chunk_embeddings_cache_path = Path(CACHE_DIR, "chunk_embeddings.npy")
-        self.chunk_metadata_cache_path = Path(CACHE_DIR, "chunk_metadata.json")
+    def __search_results(
+        self, doc_indices: NDArray[np.int64], scores: NDArray[np.float32]
+    ) -> list[dict[str, Any]]:
+        results: list[dict[str, Any]] = []
+        for doc_index, cosim_score in zip(doc_indices.tolist(), scores.tolist()):
+            doc = self.documents.get_row(doc_index)
+            results.append(
+                {
+                    "score": float(cosim_score),
+                    "title": doc["title"],
+                    "description": doc["description"],
+                }
+            )
+        return results
 
-        self.chunk_embeddings = None
-        self.chunk_metadata: dict[str, Any] | None = None
 
-    def build_chunk_embeddings(
-        self, documents: list[dict[str, Any]]
-    ) -> list[NDArray[np.float64]]:
-        self.documents = documents
-        doc_chunks: list[str] = []
-        chunk_metadata = []
-        self.document_map = {}
-        for doc in self.documents:
-            description = doc.get("description")
-            if description is None:
-                continue
-            description_chunks = semantic_chunk(description, 4, 1)
-            for i, desc_chunk in enumerate(description_chunks):
-                doc_chunks.append(desc_chunk)
-                chunk_metadata.append(
-                    {
-                        "movie_idx": doc["id"],
-                        "chunk_idx": i + 1,
-                        "total_chunks": len(description_chunks),
-                    }
-                )
+class ChunkGroups(NamedTuple):
+    order: NDArray[np.int64] | None
+    starts: NDArray[np.int64]
+    segment_ids: NDArray[np.int64]
+    movie_ids: NDArray[np.int32]
+
+
+# Chunks are stored movie by movie, so each movie's chunks normally form one contiguous
+# segment. If a movie id shows up in several places (e.g. duplicate entries in the
+# catalog), the chunks are regrouped with a stable sort first.
+def _group_chunks(movie_ids: NDArray[np.int32]) -> ChunkGroups:
+    order: NDArray[np.int64] | None = None
+    is_start = np.ones(len(movie_ids), dtype=bool)
+    is_start[1:] = movie_ids[1:] != movie_ids[:-1]
+    if np.count_nonzero(is_start) != len(np.unique(movie_ids)):
+        order = np.argsort(movie_ids, kind="stable")
+        movie_ids = movie_ids[order]
+        is_start[1:] = movie_ids[1:] != movie_ids[:-1]
+
+    starts = np.flatnonzero(is_start)
+    return ChunkGroups(
+        order=order,
+        starts=starts,
+        segment_ids=np.cumsum(is_start) - 1,
+        movie_ids=movie_ids[starts],
+    )
 
-            self.document_map[doc["id"]] = doc
 
-        self.chunk_metadata = {
-            "chunks": chunk_metadata,
-            "total_chunks": len(doc_chunks),
-        }
-        self.chunk_embeddings = self.model.encode(doc_chunks, show_progress_bar=True)
+# Structures derived from the chunk embeddings (the IVF index, the int8 codes) are
+# saved as one array per field, the first being the keys of the chunks they were
+# derived from.
+def _derived_cache_paths(prefix: str, fields: tuple[str, ...]) -> list[Path]:
+    return [Path(CACHE_DIR, f"{prefix}_{field}.npy") for field in fields]
 
-        if not self.chunk_embeddings_cache_path.parent.exists():
-            self.chunk_embeddings_cache_path.parent.mkdir()
 
-        with open(self.chunk_embeddings_cache_path, "wb") as ecache:
-            np.save(ecache, self.chunk_embeddings)
+def _load_derived_arrays(paths: list[Path]) -> list[NDArray[Any]] | None:
+    if not all(path.exists() for path in paths):
+        return None
+    return [load_array(path) for path in paths]
 
-        with open(self.chunk_metadata_cache_path, "w") as mcache:
-            json.dump(self.chunk_metadata, mcache, indent=2)
 
-        return self.chunk_embeddings
+def _save_derived_arrays(paths: list[Path], arrays: tuple[NDArray[Any], ...]) -> None:
+    # Same as the embedding caches: without its keys, a partially written structure is
+    # never reused.
+    keys_path, *other_paths = paths
+    keys, *other_arrays = arrays
+    keys_path.unlink(missing_ok=True)
+    for path, array in zip(other_paths, other_arrays):
+        save_array(path, array)
+    save_array(keys_path, keys)
 
-    def load_or_create_chunk_embeddings(
-        self, documents: list[dict[str, Any]]
-    ) -> np.ndarray:
-        if self.chunk_embeddings_cache_path.exists():
-            with open(self.chunk_embeddings_cache_path, "rb") as ecache:
-                self.chunk_embeddings = np.load(ecache, allow_pickle=True)
-
-        if self.chunk_metadata_cache_path.exists():
-            with open(self.chunk_metadata_cache_path, "r") as mcache:
-                self.chunk_metadata = json.load(mcache)
-
-        # Need to figure out another way to check whether the chunked embeddings for the
-        # current docs are correct. For now, will just check if they're None.
-        # if self.chunk_embeddings is None or (
-        #     len(self.chunk_embeddings) != len(documents)
-        # ):
-        # if self.chunk_embeddings is None:
-        if self.chunk_embeddings is None or self.chunk_metadata is None:
-            self.chunk_embeddings = self.build_chunk_embeddings(documents)
 
-        if self.documents is None:
-            self.documents = documents
-            self.document_map = {}
-            for doc in self.documents:
-                self.document_map[doc["id"]] = doc
+class ChunkedSemanticSearch(SemanticSearch):
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL,
+        query_cache: QueryEmbeddingCache | None = None,
+        quantization: str | None = None,
+        rescore_depth: int = RESCORE_DEPTH,
+    ) -> None:
+        super().__init__(model_name, query_cache)
+        if quantization is not None and quantization not in QUANTIZATION_METHODS:
+            raise ValueError(f"Unknown quantization method '{quantization}'")
+        # With a quantization method, chunks are scored from their quantized codes and
+        # only the `rescore_depth` best scores are recomputed at full precision.
+        self.quantization = quantization
+        self.rescore_depth = rescore_depth
+        # Chunks are cached per document: the chunk embeddings of a document are only
+        # recomputed when its description (or the model) changes.
+        self.chunk_embeddings_cache_path = Path(CACHE_DIR, "chunk_embeddings.npy")
+        self.chunk_offsets_cache_path = Path(CACHE_DIR, "chunk_offsets.npy")
+        self.chunk_keys_cache_path = Path(CACHE_DIR, "chunk_keys.npy")
+        # The IVF index over the chunk embeddings is built from the chunks with these
+        # keys, and rebuilt (the first time an approximate search needs it) once they
+        # change.
+        self.chunk_ivf_cache_paths = _derived_cache_paths("chunk_ivf", IVFIndex._fields)
+        # Same for the int8 codes.
+        self.chunk_int8_cache_paths = _derived_cache_paths(
+            "chunk_int8", Int8Embeddings._fields
+        )
+
+        self.chunk_embeddings: NDArray[np.float32] | None = None
+        self.chunk_keys: NDArray[np.bytes_] | None = None
+        self.chunk_ivf: IVFIndex | None = None
+        self.chunk_int8: Int8Embeddings | None = None
+        # Chunk metadata is kept as parallel int32 arrays, one entry per chunk.
+        self.chunk_movie_ids: NDArray[np.int32] | None = None
+        self.chunk_indices: NDArray[np.int32] | None = None
+        self.chunk_totals: NDArray[np.int32] | None = None
+        self.__chunk_groups: ChunkGroups | None = None
+
+    def __description_chunks(self, doc: dict[str, Any]) -> list[str]:
+        description = doc.get("description")
+        if description is None:
+            return []
+        return semantic_chunk(description, CHUNK_MAX_SIZE, CHUNK_OVERLAP)
+
+    # The metadata only depends on the documents and on how many chunks each one has,
+    # so it is derived from the offsets instead of being cached.
+    def __set_chunk_metadata(
+        self, documents: DocumentStore, offsets: NDArray[np.int64]
+    ) -> None:
+        chunk_counts = np.diff(offsets)
+        doc_ids = np.asarray(documents.doc_ids, dtype=np.int32)
+        self.chunk_movie_ids = np.repeat(doc_ids, chunk_counts)
+        self.chunk_indices = (
+            np.arange(offsets[-1]) - np.repeat(offsets[:-1], chunk_counts) + 1
+        ).astype(np.int32)
+        self.chunk_totals = np.repeat(chunk_counts, chunk_counts).astype(np.int32)
+        self.__chunk_groups = None
+
+    def __update_chunk_embeddings(
+        self, documents: DocumentStore, cache: EmbeddingCache | None
+    ) -> NDArray[np.float32]:
+        chunking = f"semantic_chunk:{CHUNK_MAX_SIZE}:{CHUNK_OVERLAP}"
+        keys = _document_embedding_keys(documents, self.model_name, chunking)
+        updated_cache, _ = update_embedding_cache(
+            cache,
+            keys,
+            lambda doc_index: self.__description_chunks(documents.get_row(doc_index)),
+            self._encode_texts,
+            self.model_name,
+        )
+        if updated_cache is not cache:
+            save_embedding_cache(
+                self.chunk_embeddings_cache_path,
+                self.chunk_offsets_cache_path,
+                self.chunk_keys_cache_path,
+                updated_cache,
+            )
 
+        self.documents = documents
+        self.chunk_embeddings = updated_cache.embeddings
+        self.chunk_keys = updated_cache.keys
+        self.__set_chunk_metadata(documents, updated_cache.offsets)
         return self.chunk_embeddings
 
-    def search_chunks(self, query: str, limit: int = 10) -> list[dict[str, Any]]:
-        if self.document_map is None:
-            raise Exception("Missing document map. Try rebuilding the cache.")
-
-        query_embedding = self.generate_embedding(query)
+    # Re-encodes every chunk, ignoring the cache.
+    def build_chunk_embeddings(self, documents: DocumentStore) -> NDArray[np.float32]:
+        return self.__update_chunk_embeddings(documents, None)
 
-        chunk_scores: list[dict[str, Any]] = []
-        for chunk_embedding, chunk_metadata in zip(
-            self.chunk_embeddings, self.chunk_metadata["chunks"]
+    # Only the chunks of documents that are new or whose description changed since the
+    # cache was written are encoded.
+    def load_or_create_chunk_embeddings(
+        self, documents: DocumentStore
+    ) -> NDArray[np.float32]:
+        cache = load_embedding_cache(
+            self.chunk_embeddings_cache_path,
+            self.chunk_offsets_cache_path,
+            self.chunk_keys_cache_path,
+            self.model_name,
+        )
+        return self.__update_chunk_embeddings(documents, cache)
+
+    # Clusters the chunk embeddings into `num_lists` lists (by default about the
+    # square root of the number of chunks), ignoring any saved index.
+    def build_chunk_ivf(self, num_lists: int | None = None) -> IVFIndex:
+        self.__check_chunk_embeddings()
+        self.chunk_ivf = build_ivf_index(
+            self.chunk_keys, np.asarray(self.chunk_embeddings), num_lists
+        )
+        _save_derived_arrays(self.chunk_ivf_cache_paths, self.chunk_ivf)
+        return self.chunk_ivf
+
+    # The saved index is reused as long as it was built from the current chunks (and
+    # with `num_lists` lists, if given).
+    def load_or_create_chunk_ivf(self, num_lists: int | None = None) -> IVFIndex:
+        index = self.chunk_ivf
+        if index is None:
+            arrays = _load_derived_arrays(self.chunk_ivf_cache_paths)
+            index = None if arrays is None else IVFIndex(*arrays)
+        if (
+            index is None
+            or not np.array_equal(index.keys, self.chunk_keys)
+            or (num_lists is not None and index.num_lists != num_lists)
         ):
-            cosim_score = _cosine_similarity(query_embedding, chunk_embedding)
-            chunk_scores.append(
-                {
-                    "chunk_idx": chunk_metadata["chunk_idx"],
-                    "movie_idx": chunk_metadata["movie_idx"],
-                    "score": cosim_score,
-                }
+            return self.build_chunk_ivf(num_lists)
+        self.chunk_ivf = index
+        return index
+
+    def build_chunk_int8(self) -> Int8Embeddings:
+        self.__check_chunk_embeddings()
+        self.chunk_int8 = quantize_int8(self.chunk_keys, self.chunk_embeddings)
+        _save_derived_arrays(self.chunk_int8_cache_paths, self.chunk_int8)
+        return self.chunk_int8
+
+    # The saved codes are reused as long as they were computed from the current chunks.
+    def load_or_create_chunk_int8(self) -> Int8Embeddings:
+        quantized = self.chunk_int8
+        if quantized is None:
+            arrays = _load_derived_arrays(self.chunk_int8_cache_paths)
+            quantized = None if arrays is None else Int8Embeddings(*arrays)
+        if quantized is None or not np.array_equal(quantized.keys, self.chunk_keys):
+            return self.build_chunk_int8()
+        self.chunk_int8 = quantized
+        return quantized
+
+    def __check_chunk_embeddings(self) -> None:
+        if self.chunk_embeddings is None:
+            raise ValueError(
+                "No chunk embeddings loaded. Call `load_or_create_chunk_embeddings` "
+                "first."
             )
 
-        movie_scores: dict[int, float] = {}
-        for chunk_score in chunk_scores:
-            movie_idx = chunk_score["movie_idx"]
-            score = chunk_score["score"]
-            if movie_idx not in movie_scores:
-                movie_scores[movie_idx] = score
-            if score > movie_scores[movie_idx]:
-                movie_scores[movie_idx] = score
+    # Similarities of the query with every chunk, or only with the chunks at
+    # `chunk_rows`.
+    def __chunk_scores(
+        self,
+        query_embedding: NDArray[np.float32],
+        chunk_rows: NDArray[np.int64] | None = None,
+    ) -> NDArray[np.float32]:
+        if self.quantization is None:
+            embeddings = self.chunk_embeddings
+            if chunk_rows is not None:
+                embeddings = embeddings[chunk_rows]
+            return cosine_similarities(embeddings, query_embedding)
+
+        scores = int8_similarities(
+            self.load_or_create_chunk_int8(), query_embedding, chunk_rows
+        )
+        return self.__rescore(scores, query_embedding, chunk_rows)
+
+    # Replaces the best approximate scores by the exact ones. Only those rows of the
+    # full-precision embeddings are read.
+    def __rescore(
+        self,
+        scores: NDArray[np.float32],
+        query_embedding: NDArray[np.float32],
+        chunk_rows: NDArray[np.int64] | None = None,
+    ) -> NDArray[np.float32]:
+        top = top_k_indices(scores, self.rescore_depth)
+        rows = top if chunk_rows is None else chunk_rows[top]
+        # Reading the rows in order keeps the accesses to the memory map sequential.
+        order = np.argsort(rows)
+        scores[top[order]] = cosine_similarities(
+            self.chunk_embeddings[rows[order]], query_embedding
+        )
+        return scores
+
+    # Without `num_probes` every chunk is scored. Otherwise only the chunks in the
+    # `num_probes` IVF lists closest to the query are, so movies without a chunk in
+    # those lists are missing from the results.
+    def search_chunks(
+        self, query: str, limit: int = 10, num_probes: int | None = None
+    ) -> list[dict[str, Any]]:
+        if self.documents is None:
+            raise Exception("Missing documents. Try rebuilding the cache.")
+
+        query_embedding = normalize_rows(self.generate_embedding(query))
+        if num_probes is not None:
+            return self.__search_chunks_ivf(query_embedding, limit, num_probes)
+        cosim_scores = self.__chunk_scores(query_embedding)
+        return self.__rank_movies(cosim_scores, self.__get_chunk_groups(), limit)
+
+    def __search_chunks_ivf(
+        self, query_embedding: NDArray[np.float32], limit: int, num_probes: int
+    ) -> list[dict[str, Any]]:
+        if num_probes < 1:
+            raise ValueError("num_probes must be at least 1")
+
+        index = self.load_or_create_chunk_ivf()
+        chunk_rows = ivf_candidates(index, query_embedding, num_probes)
+        cosim_scores = self.__chunk_scores(query_embedding, chunk_rows)
+        chunk_groups = _group_chunks(self.chunk_movie_ids[chunk_rows])
+        return self.__rank_movies(cosim_scores, chunk_groups, limit, chunk_rows)
+
+    # Same results as calling `search_chunks` for every query (up to float rounding of
+    # the scores), but the queries are encoded in one batch and scored with
+    # matrix-matrix products.
+    def search_chunks_many(
+        self, queries: list[str], limit: int = 10, num_probes: int | None = None
+    ) -> list[list[dict[str, Any]]]:
+        if self.documents is None:
+            raise Exception("Missing documents. Try rebuilding the cache.")
+        if not queries:
+            return []
+
+        query_embeddings = normalize_rows(self.generate_embeddings(queries))
+        if num_probes is not None:
+            return [
+                self.__search_chunks_ivf(query_embedding, limit, num_probes)
+                for query_embedding in query_embeddings
+            ]
+
+        chunk_groups = self.__get_chunk_groups()
+        results: list[list[dict[str, Any]]] = []
+        for start in range(0, len(queries), QUERY_BATCH_SIZE):
+            batch_embeddings = query_embeddings[start : start + QUERY_BATCH_SIZE]
+            if self.quantization is None:
+                batch_scores = cosine_similarities_many(
+                    self.chunk_embeddings, batch_embeddings
+                )
+            else:
+                batch_scores = int8_similarities_many(
+                    self.load_or_create_chunk_int8(), batch_embeddings
+                )
+            for query_embedding, cosim_scores in zip(batch_embeddings, batch_scores):
+                if self.quantization is not None:
+                    cosim_scores = self.__rescore(cosim_scores, query_embedding)
+                results.append(self.__rank_movies(cosim_scores, chunk_groups, limit))
+        return results
 
-        movie_scores_filtered: list[tuple[int, float]] = sorted(
-            movie_scores.items(), key=lambda x: x[1], reverse=True
-        )[:limit]
+    # Ranks movies by their best chunk, given the similarity of every chunk with the
+    # query. When only some chunks were scored, `chunk_rows` holds their rows.
+    def __rank_movies(
+        self,
+        cosim_scores: NDArray[np.float32],
+        chunk_groups: ChunkGroups,
+        limit: int,
+        chunk_rows: NDArray[np.int64] | None = None,
+    ) -> list[dict[str, Any]]:
+        if len(cosim_scores) == 0:
+            return []
+
+        # Segment-max over each movie's chunks, also yielding the (first) best chunk
+        # of every movie.
+        if chunk_groups.order is not None:
+            cosim_scores = cosim_scores[chunk_groups.order]
+        movie_scores = np.maximum.reduceat(cosim_scores, chunk_groups.starts)
+        is_best = cosim_scores == movie_scores[chunk_groups.segment_ids]
+        best_positions = np.flatnonzero(is_best)
+        best_segments = chunk_groups.segment_ids[best_positions]
+        is_first_best = np.ones(len(best_positions), dtype=bool)
+        is_first_best[1:] = best_segments[1:] != best_segments[:-1]
+        best_chunks = best_positions[is_first_best]
+        if chunk_groups.order is not None:
+            best_chunks = chunk_groups.order[best_chunks]
+        if chunk_rows is not None:
+            best_chunks = chunk_rows[best_chunks]
 
         results: list[dict[str, Any]] = []
-        for movie_idx, movie_score in movie_scores_filtered:
-            doc = self.document_map[movie_idx]
-            # Not sure I like how I'm doing this here. Will keep for now until I can
-            # think of something better.
-            metadata = [
-                cs
-                for cs in chunk_scores
-                if cs["score"] == movie_score and cs["movie_idx"] == movie_idx
-            ]
+        for segment in top_k_indices(movie_scores, limit).tolist():
+            movie_idx = int(chunk_groups.movie_ids[segment])
+            movie_score = float(movie_scores[segment])
+            doc = self.documents.get(movie_idx)
             results.append(
                 {
                     "id": doc["id"],
                     "title": doc["title"],
                     "description": doc["description"][:100],
                     "score": round(movie_score, SCORE_PRECISION),
-                    "metadata": metadata[0] if metadata else {},
+                    "metadata": {
+                        "chunk_idx": int(self.chunk_indices[best_chunks[segment]]),
+                        "movie_idx": movie_idx,
+                        "score": movie_score,
+                    },
                 }
             )
 
         return results
+
+    def __get_chunk_groups(self) -> ChunkGroups:
+        if self.__chunk_groups is None:
+            self.__chunk_groups = _group_chunks(np.asarray(self.chunk_movie_ids))
+        return self.__chunk_groups
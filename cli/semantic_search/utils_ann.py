@@ -0,0 +1,128 @@
+import math
+from typing import NamedTuple
+
+import numpy as np
+from numpy.typing import NDArray
+from semantic_search.utils_vectors import normalize_rows, top_k_indices
+
+# Number of clusters scanned per query when none is given. Together with the number
+# of lists this trades recall for latency: a query scans about
+# num_probes / num_lists of the vectors.
+IVF_NUM_PROBES = 8
+IVF_KMEANS_ITERS = 20
+# k-means is trained on at most this many vectors per cluster, sampled at random.
+IVF_TRAINING_SAMPLES_PER_LIST = 256
+IVF_SEED = 0
+# Rows assigned to their closest centroid at a time, which bounds the size of the
+# (rows x centroids) score matrix.
+IVF_ASSIGN_BATCH_SIZE = 4096
+
+
+# Inverted file index over unit-normalized vectors: the vectors are partitioned by
+# their closest centroid, and list l holds the rows rows[offsets[l]:offsets[l + 1]]
+# in increasing order. `keys` identify the vectors the index was built from, so it can
+# be checked for staleness like the embedding caches.
+class IVFIndex(NamedTuple):
+    keys: NDArray[np.bytes_]
+    centroids: NDArray[np.float32]
+    offsets: NDArray[np.int64]
+    rows: NDArray[np.int64]
+
+    @property
+    def num_lists(self) -> int:
+        return len(self.centroids)
+
+
+def default_num_lists(num_rows: int) -> int:
+    return max(1, round(math.sqrt(num_rows)))
+
+
+def _assign(
+    vectors: NDArray[np.float32], centroids: NDArray[np.float32]
+) -> NDArray[np.int64]:
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), IVF_ASSIGN_BATCH_SIZE):
+        batch = vectors[start : start + IVF_ASSIGN_BATCH_SIZE]
+        assignments[start : start + len(batch)] = np.argmax(batch @ centroids.T, axis=1)
+    return assignments
+
+
+# Spherical k-means: vectors are assigned by cosine similarity and every centroid is
+# the normalized mean of its vectors. Clusters that end up empty are re-seeded with a
+# random vector.
+def kmeans(
+    vectors: NDArray[np.float32],
+    num_clusters: int,
+    num_iters: int = IVF_KMEANS_ITERS,
+    seed: int = IVF_SEED,
+) -> NDArray[np.float32]:
+    rng = np.random.default_rng(seed)
+    initial_rows = rng.choice(len(vectors), num_clusters, replace=False)
+    centroids = np.array(vectors[np.sort(initial_rows)], dtype=np.float32)
+    for _ in range(num_iters):
+        assignments = _assign(vectors, centroids)
+        counts = np.bincount(assignments, minlength=num_clusters)
+        nonempty = np.flatnonzero(counts)
+        starts = (np.cumsum(counts) - counts)[nonempty]
+        sums = np.zeros_like(centroids)
+        sums[nonempty] = np.add.reduceat(
+            vectors[np.argsort(assignments, kind="stable")], starts
+        )
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), np.count_nonzero(empty))]
+        new_centroids = normalize_rows(sums)
+        if np.array_equal(new_centroids, centroids):
+            break
+        centroids = new_centroids
+    return centroids
+
+
+def build_ivf_index(
+    keys: NDArray[np.bytes_],
+    vectors: NDArray[np.float32],
+    num_lists: int | None = None,
+    seed: int = IVF_SEED,
+) -> IVFIndex:
+    if num_lists is None:
+        num_lists = default_num_lists(len(vectors))
+    num_lists = min(num_lists, len(vectors))
+    if num_lists <= 0:
+        return IVFIndex(
+            keys=keys,
+            centroids=np.zeros((0, vectors.shape[-1]), dtype=np.float32),
+            offsets=np.zeros(1, dtype=np.int64),
+            rows=np.zeros(0, dtype=np.int64),
+        )
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    num_samples = min(len(vectors), num_lists * IVF_TRAINING_SAMPLES_PER_LIST)
+    samples = vectors
+    if num_samples < len(vectors):
+        rng = np.random.default_rng(seed)
+        samples = vectors[np.sort(rng.choice(len(vectors), num_samples, replace=False))]
+    centroids = kmeans(samples, num_lists, seed=seed)
+
+    assignments = _assign(vectors, centroids)
+    offsets = np.zeros(num_lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignments, minlength=num_lists), out=offsets[1:])
+    return IVFIndex(
+        keys=keys,
+        centroids=centroids,
+        offsets=offsets,
+        rows=np.argsort(assignments, kind="stable"),
+    )
+
+
+# Rows of the `num_probes` lists whose centroids are the most similar to the query, in
+# increasing order.
+def ivf_candidates(
+    index: IVFIndex, normalized_query: NDArray[np.float32], num_probes: int
+) -> NDArray[np.int64]:
+    lists = top_k_indices(index.centroids @ normalized_query, num_probes)
+    rows = [
+        index.rows[index.offsets[list_id] : index.offsets[list_id + 1]]
+        for list_id in lists.tolist()
+    ]
+    if not rows:
+        return np.zeros(0, dtype=np.int64)
+    return np.sort(np.concatenate(rows))
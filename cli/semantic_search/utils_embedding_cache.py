@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any, NamedTuple
+
+import numpy as np
+from numpy.typing import NDArray
+from semantic_search.utils_vectors import is_normalized, normalize_rows
+
+# Embeddings are stored unit-normalized as raw (non-pickled) arrays of this type so
+# the cache can be memory-mapped and shared between processes through the page cache.
+EMBEDDING_DTYPE = np.float32
+# Cache keys are hex digests of the model name and the exact text that was encoded.
+EMBEDDING_KEY_DTYPE = "S32"
+
+
+def save_array(file_path: Path, array: NDArray[Any]) -> None:
+    if not file_path.parent.exists():
+        file_path.parent.mkdir(parents=True)
+    # Moved into place once complete, so processes that still have the old file
+    # memory-mapped keep reading intact data.
+    tmp_path = file_path.with_name(f"{file_path.stem}.tmp{file_path.suffix}")
+    with open(tmp_path, "wb") as array_file:
+        np.save(array_file, array, allow_pickle=False)
+    os.replace(tmp_path, file_path)
+
+
+def load_array(file_path: Path) -> NDArray[Any]:
+    return np.load(file_path, mmap_mode="r", allow_pickle=False)
+
+
+# Caches written before embeddings were stored normalized are normalized once and
+# rewritten in place, without re-encoding anything.
+def load_normalized_array(file_path: Path) -> NDArray[np.float32]:
+    array = load_array(file_path)
+    if not is_normalized(array):
+        save_array(file_path, normalize_rows(array))
+        array = load_array(file_path)
+    return array
+
+
+def embedding_key(*parts: str) -> bytes:
+    digest = hashlib.blake2b("\0".join(parts).encode("utf-8"), digest_size=16)
+    return digest.hexdigest().encode("ascii")
+
+
+# An embedding cache covers a list of units (documents, or all the chunks of one
+# document): unit i has the content key keys[i] and the embeddings
+# embeddings[offsets[i]:offsets[i + 1]], computed by the model `model_name`.
+class EmbeddingCache(NamedTuple):
+    keys: NDArray[np.bytes_]
+    offsets: NDArray[np.int64]
+    embeddings: NDArray[np.float32]
+    model_name: str
+
+    @property
+    def dimension(self) -> int:
+        return self.embeddings.shape[1] if self.embeddings.ndim == 2 else 0
+
+
+# The model name and the dimension of a cache are stored next to its keys.
+def _cache_meta_path(keys_path: Path) -> Path:
+    return keys_path.with_suffix(".json")
+
+
+def load_embedding_cache(
+    embeddings_path: Path, offsets_path: Path, keys_path: Path, model_name: str
+) -> EmbeddingCache | None:
+    # Caches without keys or a model name (e.g. written by older versions) can't be
+    # checked for staleness, so they are never reused.
+    meta_path = _cache_meta_path(keys_path)
+    paths = (embeddings_path, offsets_path, keys_path, meta_path)
+    if not all(path.exists() for path in paths):
+        return None
+    with open(meta_path, "r") as meta_file:
+        meta = json.load(meta_file)
+    if meta.get("model_name") != model_name:
+        return None
+
+    cache = EmbeddingCache(
+        keys=load_array(keys_path),
+        offsets=load_array(offsets_path),
+        embeddings=load_normalized_array(embeddings_path),
+        model_name=model_name,
+    )
+    if (
+        len(cache.offsets) != len(cache.keys) + 1
+        or cache.offsets[-1] != len(cache.embeddings)
+        or cache.dimension != meta.get("dimension")
+    ):
+        return None
+    return cache
+
+
+def save_embedding_cache(
+    embeddings_path: Path, offsets_path: Path, keys_path: Path, cache: EmbeddingCache
+) -> None:
+    # The keys go first and come back last, so an interrupted save leaves a cache
+    # that won't be reused.
+    keys_path.unlink(missing_ok=True)
+    save_array(embeddings_path, cache.embeddings)
+    save_array(offsets_path, cache.offsets)
+    meta_path = _cache_meta_path(keys_path)
+    tmp_meta_path = meta_path.with_name(f"{meta_path.stem}.tmp{meta_path.suffix}")
+    with open(tmp_meta_path, "w") as meta_file:
+        json.dump(
+            {"model_name": cache.model_name, "dimension": cache.dimension}, meta_file
+        )
+    os.replace(tmp_meta_path, meta_path)
+    save_array(keys_path, cache.keys)
+
+
+# Returns the cache for `keys` along with the number of units that had to be encoded.
+# Units whose key is already cached reuse their embeddings, units that are gone are
+# dropped and only new or edited units are passed to `encode`, in a single batch. A
+# cache of another model, or whose embeddings turn out to have another dimension than
+# the new ones, is discarded and every unit is encoded again.
+def update_embedding_cache(
+    cache: EmbeddingCache | None,
+    keys: NDArray[np.bytes_],
+    unit_texts: Callable[[int], list[str]],
+    encode: Callable[[list[str]], NDArray[Any]],
+    model_name: str,
+) -> tuple[EmbeddingCache, int]:
+    if cache is not None and cache.model_name != model_name:
+        cache = None
+    if cache is not None and np.array_equal(cache.keys, keys):
+        return cache, 0
+
+    cached_units: dict[bytes, int] = {}
+    num_cached_rows = 0
+    if cache is not None:
+        cached_units = {key: unit for unit, key in enumerate(cache.keys.tolist())}
+        num_cached_rows = len(cache.embeddings)
+
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    unit_rows: list[NDArray[np.int64]] = []
+    texts: list[str] = []
+    num_encoded = 0
+    for unit, key in enumerate(keys.tolist()):
+        cached_unit = cached_units.get(key)
+        if cached_unit is not None:
+            start = cache.offsets[cached_unit]
+            end = cache.offsets[cached_unit + 1]
+        else:
+            new_texts = unit_texts(unit)
+            start = num_cached_rows + len(texts)
+            end = start + len(new_texts)
+            texts.extend(new_texts)
+            num_encoded += 1
+        unit_rows.append(np.arange(start, end, dtype=np.int64))
+        offsets[unit + 1] = offsets[unit] + end - start
+
+    # Rows are gathered from the cached embeddings followed by the new ones. The
+    # cached ones are only read if some unit reuses them.
+    pool: list[NDArray[np.float32]] = []
+    rows = np.concatenate(unit_rows) if unit_rows else np.zeros(0, dtype=np.int64)
+    if num_encoded < len(keys):
+        pool.append(np.asarray(cache.embeddings))
+    else:
+        rows -= num_cached_rows
+    if texts:
+        new_embeddings = normalize_rows(encode(texts)).astype(EMBEDDING_DTYPE)
+        if pool and new_embeddings.shape[1] != cache.dimension:
+            return update_embedding_cache(None, keys, unit_texts, encode, model_name)
+        pool.append(new_embeddings)
+    if pool and unit_rows:
+        embeddings = np.concatenate(pool)[rows]
+    else:
+        embeddings = np.zeros((0, 0), dtype=EMBEDDING_DTYPE)
+
+    return (
+        EmbeddingCache(
+            keys=keys, offsets=offsets, embeddings=embeddings, model_name=model_name
+        ),
+        num_encoded,
+    )
@@ -0,0 +1,73 @@
+from typing import NamedTuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+QUANTIZATION_METHODS = ("int8",)
+# Number of best approximate scores that are recomputed from the full-precision
+# embeddings by default.
+RESCORE_DEPTH = 100
+INT8_MAX = 127
+# Rows converted back to float32 at a time. The block stays in the CPU cache, so the
+# conversion costs about as much as reading the rows.
+INT8_DEQUANTIZE_BATCH_SIZE = 512
+
+
+# Scalar-quantized embeddings: embedding[row] ~= codes[row] * scales, with one scale
+# per dimension so that the largest absolute value of every dimension maps to 127.
+# `keys` identify the embeddings the codes were computed from, like the IVF index.
+class Int8Embeddings(NamedTuple):
+    keys: NDArray[np.bytes_]
+    codes: NDArray[np.int8]
+    scales: NDArray[np.float32]
+
+
+def quantize_int8(
+    keys: NDArray[np.bytes_], embeddings: NDArray[np.float32]
+) -> Int8Embeddings:
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if len(embeddings) == 0:
+        scales = np.ones(embeddings.shape[-1], dtype=np.float32)
+    else:
+        scales = np.abs(embeddings).max(axis=0) / INT8_MAX
+        scales[scales == 0] = 1.0
+    codes = np.rint(embeddings / scales).clip(-INT8_MAX, INT8_MAX).astype(np.int8)
+    return Int8Embeddings(keys=keys, codes=codes, scales=scales.astype(np.float32))
+
+
+# Asymmetric distance computation: only the stored embeddings are quantized, the query
+# keeps full precision. Folding the scales into the query turns
+# query . (codes[row] * scales) into codes[row] . (query * scales).
+def int8_similarities(
+    quantized: Int8Embeddings,
+    normalized_query: NDArray[np.float32],
+    rows: NDArray[np.int64] | None = None,
+) -> NDArray[np.float32]:
+    scaled_query = np.asarray(normalized_query * quantized.scales, dtype=np.float32)
+    codes = quantized.codes if rows is None else quantized.codes[rows]
+    scores = np.empty(len(codes), dtype=np.float32)
+    block = np.empty((INT8_DEQUANTIZE_BATCH_SIZE, codes.shape[-1]), dtype=np.float32)
+    for start in range(0, len(codes), INT8_DEQUANTIZE_BATCH_SIZE):
+        code_block = codes[start : start + INT8_DEQUANTIZE_BATCH_SIZE]
+        float_block = block[: len(code_block)]
+        np.copyto(float_block, code_block, casting="unsafe")
+        np.matmul(
+            float_block, scaled_query, out=scores[start : start + len(code_block)]
+        )
+    return scores
+
+
+# Row q holds the approximate similarities of query q with every embedding.
+def int8_similarities_many(
+    quantized: Int8Embeddings, normalized_queries: NDArray[np.float32]
+) -> NDArray[np.float32]:
+    scaled_queries = np.asarray(normalized_queries * quantized.scales, dtype=np.float32)
+    codes = quantized.codes
+    scores = np.empty((len(scaled_queries), len(codes)), dtype=np.float32)
+    block = np.empty((INT8_DEQUANTIZE_BATCH_SIZE, codes.shape[-1]), dtype=np.float32)
+    for start in range(0, len(codes), INT8_DEQUANTIZE_BATCH_SIZE):
+        code_block = codes[start : start + INT8_DEQUANTIZE_BATCH_SIZE]
+        float_block = block[: len(code_block)]
+        np.copyto(float_block, code_block, casting="unsafe")
+        scores[:, start : start + len(code_block)] = scaled_queries @ float_block.T
+    return scores
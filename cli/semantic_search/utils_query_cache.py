@@ -0,0 +1,152 @@
+import functools
+import sqlite3
+import unicodedata
+from collections import OrderedDict
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from numpy.typing import NDArray
+
+QUERY_CACHE_FILE = Path("cache/query_embeddings.sqlite")
+# Number of query embeddings kept in memory. At 384 float32 dimensions that is
+# about 1.5 MB.
+QUERY_CACHE_SIZE = 1024
+QUERY_EMBEDDING_DTYPE = np.float32
+
+
+# Queries that only differ in Unicode normalization or in whitespace tokenize to the
+# same input ids, so they share one cache entry. The normalized text is also what gets
+# encoded, so a cached embedding is exactly what the model returns for its key.
+def normalize_query(query: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", query).split())
+
+
+# LRU cache of query embeddings keyed by (model name, normalized query). Lookups that
+# miss memory fall back to the optional on-disk store, which survives restarts and is
+# shared by every process using the same cache directory; entries are never evicted
+# from it. Only the queries missing from both are encoded, in a single batch.
+class QueryEmbeddingCache:
+    def __init__(
+        self, capacity: int = QUERY_CACHE_SIZE, store_path: Path | None = None
+    ) -> None:
+        self.capacity = capacity
+        self.store_path = store_path
+        self.__entries: OrderedDict[tuple[str, str], NDArray[np.float32]] = (
+            OrderedDict()
+        )
+        self.__store: sqlite3.Connection | None = None
+
+        self.hits = 0
+        # Lookups that missed memory but were found in the on-disk store.
+        self.store_hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "size": len(self),
+            "capacity": self.capacity,
+        }
+
+    @property
+    def store(self) -> sqlite3.Connection | None:
+        if self.__store is None and self.store_path is not None:
+            self.store_path.parent.mkdir(parents=True, exist_ok=True)
+            self.__store = sqlite3.connect(self.store_path, timeout=30)
+            self.__store.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT, query TEXT, embedding BLOB, PRIMARY KEY (model, query))"
+            )
+        return self.__store
+
+    def __remember(self, key: tuple[str, str], embedding: NDArray[np.float32]) -> None:
+        self.__entries[key] = embedding
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.capacity:
+            self.__entries.popitem(last=False)
+
+    def __load(self, key: tuple[str, str]) -> NDArray[np.float32] | None:
+        if self.store is None:
+            return None
+        row = self.store.execute(
+            "SELECT embedding FROM query_embeddings WHERE model = ? AND query = ?", key
+        ).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=QUERY_EMBEDDING_DTYPE)
+
+    def __save(self, entries: dict[tuple[str, str], NDArray[np.float32]]) -> None:
+        if self.store is None:
+            return
+        with self.store:
+            self.store.executemany(
+                "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?)",
+                [(*key, embedding.tobytes()) for key, embedding in entries.items()],
+            )
+
+    def get(self, model_name: str, query: str) -> NDArray[np.float32] | None:
+        key = (model_name, normalize_query(query))
+        embedding = self.__entries.get(key)
+        if embedding is not None:
+            self.hits += 1
+            self.__entries.move_to_end(key)
+            return embedding
+
+        embedding = self.__load(key)
+        if embedding is not None:
+            self.store_hits += 1
+            self.__remember(key, embedding)
+        return embedding
+
+    # Returns one embedding row per query, encoding the ones that aren't cached with a
+    # single call to `encode`. Repeats of a query within the batch count as hits.
+    def embed(
+        self,
+        model_name: str,
+        queries: list[str],
+        encode: Callable[[list[str]], NDArray[Any]],
+    ) -> NDArray[np.float32]:
+        embeddings: list[NDArray[np.float32] | None] = []
+        missing: dict[str, list[int]] = {}
+        for i, query in enumerate(queries):
+            normalized_query = normalize_query(query)
+            if normalized_query in missing:
+                self.hits += 1
+                missing[normalized_query].append(i)
+                embeddings.append(None)
+                continue
+            embedding = self.get(model_name, normalized_query)
+            if embedding is None:
+                self.misses += 1
+                missing[normalized_query] = [i]
+            embeddings.append(embedding)
+
+        if missing:
+            encoded = np.asarray(encode(list(missing)), dtype=QUERY_EMBEDDING_DTYPE)
+            new_entries: dict[tuple[str, str], NDArray[np.float32]] = {}
+            for (query, positions), embedding in zip(missing.items(), encoded):
+                # Cached rows are shared by every caller, so they must not be modified.
+                embedding = embedding.copy()
+                embedding.flags.writeable = False
+                new_entries[(model_name, query)] = embedding
+                self.__remember((model_name, query), embedding)
+                for i in positions:
+                    embeddings[i] = embedding
+            self.__save(new_entries)
+
+        if not embeddings:
+            return np.zeros((0, 0), dtype=QUERY_EMBEDDING_DTYPE)
+        return np.stack(embeddings)
+
+
+# One cache per process, shared by every semantic and hybrid search engine.
+@functools.cache
+def get_query_embedding_cache() -> QueryEmbeddingCache:
+    return QueryEmbeddingCache(store_path=QUERY_CACHE_FILE)
@@ -0,0 +1,76 @@
+from typing import Any
+
+import numpy as np
+from numpy.typing import NDArray
+
+# Tolerance used when checking whether a stored matrix is already unit-normalized.
+NORM_TOLERANCE = 1e-3
+
+
+def normalize_rows(matrix: NDArray[Any]) -> NDArray[np.float32]:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    # Zero vectors stay zero, which gives them a cosine similarity of 0 with anything.
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def is_normalized(matrix: NDArray[Any], sample_size: int = 16) -> bool:
+    norms = np.linalg.norm(np.asarray(matrix[:sample_size], dtype=np.float32), axis=-1)
+    norms = norms[norms != 0]
+    return bool(np.all(np.abs(norms - 1) < NORM_TOLERANCE))
+
+
+# Both the matrix rows and the query must already be unit-normalized, so cosine
+# similarity reduces to a single matrix-vector product.
+def cosine_similarities(
+    normalized_matrix: NDArray[np.float32], normalized_query: NDArray[np.float32]
+) -> NDArray[np.float32]:
+    return normalized_matrix @ normalized_query
+
+
+# Row q holds the similarities of query q with every row of the matrix, computed with
+# a single matrix-matrix product.
+def cosine_similarities_many(
+    normalized_matrix: NDArray[np.float32], normalized_queries: NDArray[np.float32]
+) -> NDArray[np.float32]:
+    return normalized_queries @ normalized_matrix.T
+
+
+def top_k_indices(scores: NDArray[Any], limit: int) -> NDArray[np.int64]:
+    if limit <= 0 or len(scores) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    candidates = np.arange(len(scores))
+    if limit < len(scores):
+        # Keep everything tied with the limit-th best score so that ties are broken by
+        # index (the order a full stable sort would give) rather than arbitrarily.
+        kth = len(scores) - limit
+        kth_score = np.partition(scores, kth)[kth]
+        candidates = np.flatnonzero(scores >= kth_score)
+
+    order = np.lexsort((candidates, -scores[candidates]))[:limit]
+    return candidates[order]
+
+
+def cosine_top_k(
+    normalized_matrix: NDArray[np.float32],
+    normalized_query: NDArray[np.float32],
+    limit: int,
+) -> tuple[NDArray[np.int64], NDArray[np.float32]]:
+    scores = cosine_similarities(normalized_matrix, normalized_query)
+    indices = top_k_indices(scores, limit)
+    return indices, scores[indices]
+
+
+def cosine_top_k_many(
+    normalized_matrix: NDArray[np.float32],
+    normalized_queries: NDArray[np.float32],
+    limit: int,
+) -> list[tuple[NDArray[np.int64], NDArray[np.float32]]]:
+    scores = cosine_similarities_many(normalized_matrix, normalized_queries)
+    top_k: list[tuple[NDArray[np.int64], NDArray[np.float32]]] = []
+    for query_scores in scores:
+        indices = top_k_indices(query_scores, limit)
+        top_k.append((indices, query_scores[indices]))
+    return top_k
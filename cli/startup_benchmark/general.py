@@ -0,0 +1,111 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser, Namespace
+from pathlib import Path
+
+CLI_DIR = Path(__file__).resolve().parent.parent
+STARTUP_BENCH_REPEAT = 5
+# Cheap commands that shouldn't need any model. Each one is run as a fresh process,
+# exactly the way a user would run it.
+STARTUP_BENCH_COMMANDS = {
+    "hybrid-normalize": ["hybrid_search_cli.py", "normalize", "0.5", "2.3", "1.2"],
+    "keyword-bm25search": ["keyword_search_cli.py", "bm25search", "bear"],
+    "semantic-chunk": ["semantic_search_cli.py", "chunk", "a short text to chunk"],
+    "augmented-generation-help": ["augmented_generation_cli.py", "--help"],
+    "evaluation-help": ["evaluation_cli.py", "--help"],
+    "multimodal-help": ["multimodal_search_cli.py", "--help"],
+}
+# Modules that take seconds to import and should only be imported by the commands
+# that use them.
+HEAVY_MODULES = ("google.genai", "nltk", "sentence_transformers", "torch")
+
+
+def _command_env() -> dict[str, str]:
+    env = dict(os.environ)
+    python_path = env.get("PYTHONPATH")
+    env["PYTHONPATH"] = (
+        f"{CLI_DIR}{os.pathsep}{python_path}" if python_path else str(CLI_DIR)
+    )
+    return env
+
+
+def _time_command(argv: list[str], env: dict[str, str]) -> tuple[float, int]:
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, str(CLI_DIR / argv[0]), *argv[1:]],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return (time.perf_counter() - start) * 1000, completed.returncode
+
+
+# Runs the command once more with `-X importtime` and returns the cumulative import
+# time (in ms) of every heavy module it imported.
+def _heavy_imports(argv: list[str], env: dict[str, str]) -> dict[str, float]:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", str(CLI_DIR / argv[0]), *argv[1:]],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    heavy_imports: dict[str, float] = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line.removeprefix("import time:").split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        module = fields[2].strip()
+        if module in HEAVY_MODULES:
+            heavy_imports[module] = int(fields[1]) / 1000
+    return heavy_imports
+
+
+def startup_bench_command(commands: list[str], repeat: int) -> None:
+    if repeat < 1:
+        raise ValueError("repeat must be at least 1")
+    for name in commands:
+        if name not in STARTUP_BENCH_COMMANDS:
+            raise ValueError(f"Unknown command '{name}'")
+
+    env = _command_env()
+    padding = 4
+    for i, name in enumerate(commands):
+        argv = STARTUP_BENCH_COMMANDS[name]
+        timings: list[float] = []
+        return_codes: set[int] = set()
+        for _ in range(repeat):
+            elapsed_ms, return_code = _time_command(argv, env)
+            timings.append(elapsed_ms)
+            return_codes.add(return_code)
+        heavy_imports = _heavy_imports(argv, env)
+
+        left_num = f"{i + 1}."
+        print(f"{left_num:<{padding}}{name}: {' '.join(argv)}")
+        print(
+            f"{' ':<{padding}}min: {min(timings):.1f} ms, "
+            f"median: {statistics.median(timings):.1f} ms"
+        )
+        if return_codes != {0}:
+            print(
+                f"{' ':<{padding}}exit codes: {', '.join(map(str, sorted(return_codes)))}"
+            )
+        if heavy_imports:
+            imports = ", ".join(
+                f"{module} ({import_ms:.1f} ms)"
+                for module, import_ms in sorted(heavy_imports.items())
+            )
+            print(f"{' ':<{padding}}heavy imports: {imports}")
+        else:
+            print(f"{' ':<{padding}}heavy imports: none")
+
+
+def run(cli_opts: Namespace, parser: ArgumentParser) -> None:
+    startup_bench_command(
+        cli_opts.commands or list(STARTUP_BENCH_COMMANDS), cli_opts.repeat
+    )
@@ -0,0 +1,28 @@
+from argparse import ArgumentParser, Namespace
+
+from startup_benchmark.general import STARTUP_BENCH_COMMANDS, STARTUP_BENCH_REPEAT
+
+
+def get_opts() -> tuple[Namespace, ArgumentParser]:
+    parser = ArgumentParser(
+        description="Measure how long the CLIs take to start for cheap commands"
+    )
+    parser.add_argument(
+        "commands",
+        type=str,
+        nargs="*",
+        help=(
+            "Commands to benchmark, out of "
+            f"{', '.join(STARTUP_BENCH_COMMANDS)} (default: all of them)"
+        ),
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=STARTUP_BENCH_REPEAT,
+        help="Number of times to run each command",
+    )
+
+    args = parser.parse_args()
+
+    return args, parser
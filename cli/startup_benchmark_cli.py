@@ -0,0 +1,19 @@
+#!/usr/bin/env python
+import sys
+
+from startup_benchmark.general import run
+from startup_benchmark.opts import get_opts
+
+
+def main() -> None:
+    cli_opts, cli_parser = get_opts()
+
+    try:
+        run(cli_opts, cli_parser)
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
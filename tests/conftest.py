@@ -0,0 +1,66 @@
+import json
+import shutil
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+
+MOVIES = [
+    {
+        "id": 1,
+        "title": "The Bear",
+        "description": "A grizzly bear wanders into a small mountain town.",
+    },
+    {
+        "id": 2,
+        "title": "Paddington",
+        "description": "A polite bear from Peru moves in with a family in London.",
+    },
+    {
+        "id": 3,
+        "title": "Jaws",
+        "description": "A great white shark terrorizes a beach town in summer.",
+    },
+    {
+        "id": 4,
+        "title": "The Meg",
+        "description": "A prehistoric shark attacks a deep sea research station.",
+    },
+    {
+        "id": 5,
+        "title": "Toy Story",
+        "description": "Toys come to life when their owner leaves the room.",
+    },
+    {
+        "id": 6,
+        "title": "Ratatouille",
+        "description": "A rat who dreams of cooking teams up with a young chef.",
+    },
+]
+
+
+def _write_movies(movies: list[dict[str, Any]]) -> None:
+    with open("data/movies.json", "w") as movies_file:
+        json.dump({"movies": movies}, movies_file)
+
+
+# Runs the test in an empty project directory holding the stopwords and a small
+# catalog, since every cache and data path is relative to the working directory.
+@pytest.fixture
+def catalog(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> list[dict[str, Any]]:
+    monkeypatch.chdir(tmp_path)
+    Path("data").mkdir()
+    shutil.copy(Path(DATA_DIR, "stopwords.txt"), "data/stopwords.txt")
+    _write_movies(MOVIES)
+    return list(MOVIES)
+
+
+# Replaces the catalog of the test, as another process editing the movies file would.
+@pytest.fixture
+def write_movies(
+    catalog: list[dict[str, Any]],
+) -> Callable[[list[dict[str, Any]]], None]:
+    return _write_movies
@@ -0,0 +1,45 @@
+import hashlib
+import threading
+import time
+from typing import Any, NamedTuple
+
+
+class StubRateLimitError(Exception):
+    code = 429
+
+
+class StubResponse(NamedTuple):
+    text: str
+
+
+# Stands in for `genai.Client().models`: every call takes `latency_seconds` and every
+# `rate_limit_every`-th call fails with a 429, like an overloaded API would. The
+# response is a 0-10 score derived from a hash of the prompt, so a prompt always gets
+# the same score however the calls are scheduled.
+class StubModels:
+    def __init__(self, latency_seconds: float, rate_limit_every: int = 0) -> None:
+        self.latency_seconds = latency_seconds
+        self.rate_limit_every = rate_limit_every
+        self.calls = 0
+        self.rate_limited_calls = 0
+        self.__lock = threading.Lock()
+
+    def generate_content(self, model: str, contents: Any, config: Any = None):
+        with self.__lock:
+            self.calls += 1
+            rate_limited = (
+                self.rate_limit_every > 0 and self.calls % self.rate_limit_every == 0
+            )
+            if rate_limited:
+                self.rate_limited_calls += 1
+        time.sleep(self.latency_seconds)
+        if rate_limited:
+            raise StubRateLimitError("429 RESOURCE_EXHAUSTED")
+
+        digest = hashlib.blake2b(str(contents).encode("utf-8"), digest_size=4)
+        return StubResponse(text=str(int.from_bytes(digest.digest(), "big") % 11))
+
+
+class StubClient:
+    def __init__(self, latency_seconds: float, rate_limit_every: int = 0) -> None:
+        self.models = StubModels(latency_seconds, rate_limit_every)
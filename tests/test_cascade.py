@@ -0,0 +1,85 @@
+import time
+from typing import Any
+
+import pytest
+
+from hybrid_search.utils_cascade import CascadeRanker, CascadeStage, score_margin
+
+RRF_SECONDS_PER_CANDIDATE = 0.0002
+
+
+# Takes longer the more candidates it is asked for, with strictly decreasing scores.
+class SlowSearcher:
+    def __init__(self) -> None:
+        self.limits: list[int] = []
+
+    def rrf_search(
+        self, query: str, k: int, limit: int, num_probes: int | None = None
+    ) -> list[dict[str, Any]]:
+        self.limits.append(limit)
+        time.sleep(limit * RRF_SECONDS_PER_CANDIDATE)
+        return [{"id": i, "rrf_score": 1 / (k + i)} for i in range(1, limit + 1)]
+
+
+# Takes a millisecond per candidate, keeping the order of the candidates.
+class SlowReranker:
+    def rerank(
+        self, query: str, docs: list[dict[str, Any]], limit: int, method: str
+    ) -> list[dict[str, Any]]:
+        time.sleep(len(docs) * 0.001)
+        return [
+            {**doc, "cross_encoder_score": float(len(docs) - i)}
+            for i, doc in enumerate(docs)
+        ]
+
+
+def test_score_margin() -> None:
+    assert score_margin([3.0, 2.0, 1.0, 0.0], 2) == 1 / 3
+    assert score_margin([1.0, 1.0, 1.0], 1) == 0.0
+    assert score_margin([1.0], 5) == float("inf")
+
+
+def test_rrf_stage_keeps_its_budget() -> None:
+    searcher = SlowSearcher()
+    # 100 candidates take at least 20 ms, twice the budget.
+    stages = (CascadeStage("rrf", 100, 10.0),)
+    ranker = CascadeRanker(searcher, None, None, stages)  # type: ignore[arg-type]
+
+    first = ranker.rank("bears", limit=5)
+    assert first.timings[0].candidates == 100
+    assert first.timings[0].over_budget
+
+    second = ranker.rank("bears", limit=5)
+    assert 5 <= searcher.limits[1] <= 50
+    assert second.timings[0].candidates == searcher.limits[1]
+    assert len(second.results) == 5
+
+
+def test_rerank_stage_needs_two_candidates() -> None:
+    stages = (CascadeStage("rrf", 100, 150.0), CascadeStage("cross_encoder", 1, 100.0))
+    with pytest.raises(ValueError, match="at least 2 candidates"):
+        CascadeRanker(SlowSearcher(), None, None, stages)  # type: ignore[arg-type]
+
+
+def test_rerank_stage_skipped_for_latency_budget() -> None:
+    # 25 candidates take at least 25 ms, far over the budget.
+    stages = (CascadeStage("rrf", 100, 150.0), CascadeStage("cross_encoder", 25, 1.0))
+    ranker = CascadeRanker(
+        SlowSearcher(), SlowReranker(), None, stages  # type: ignore[arg-type]
+    )
+
+    first = ranker.rank("bears", limit=5)
+    assert first.timings[1].candidates == 25
+    assert first.timings[1].over_budget
+
+    second = ranker.rank("bears", limit=5)
+    assert second.timings[1].skipped == "latency budget"
+    assert [result["id"] for result in second.results] == [1, 2, 3, 4, 5]
+
+    # Every skip lowers the estimate, until the stage is tried again.
+    for _ in range(20):
+        timing = ranker.rank("bears", limit=5).timings[1]
+        if not timing.skipped:
+            break
+    assert not timing.skipped
+    assert timing.candidates >= 2
@@ -0,0 +1,97 @@
+from collections.abc import Callable, Iterator
+from typing import IO, Any
+
+import pytest
+from document_store import document_store
+from document_store.document_store import DocumentStore
+from keyword_search.inverted_index import InvertedIndex
+
+WriteMovies = Callable[[list[dict[str, Any]]], None]
+
+
+def _matches(index: InvertedIndex, query: str) -> list[int]:
+    return [doc_id for doc_id, score in index.bm25_search(query, 5) if score > 0]
+
+
+def test_load_builds_missing_store(catalog: list[dict[str, Any]]) -> None:
+    store = DocumentStore()
+    store.load()
+    assert list(store) == catalog
+    assert store.get(3)["title"] == "Jaws"
+
+
+def test_reload_if_changed_follows_other_processes(
+    catalog: list[dict[str, Any]], write_movies: WriteMovies
+) -> None:
+    store = DocumentStore()
+    store.load()
+    assert not store.reload_if_changed()
+
+    movie = {"id": 7, "title": "Up", "description": "A house flies away."}
+    write_movies(catalog + [movie])
+    DocumentStore().load()
+    assert store.reload_if_changed()
+    assert store.get(7)["title"] == "Up"
+    assert not store.reload_if_changed()
+
+
+def test_build_keeps_previous_generation(
+    catalog: list[dict[str, Any]], write_movies: WriteMovies
+) -> None:
+    store = DocumentStore()
+    for i in range(3):
+        write_movies(catalog[: 3 + i])
+        store.build()
+    names = sorted(path.name for path in store.store_dir.iterdir())
+    assert names[2:] == ["meta.json", "publish.lock"]
+    assert names[0].startswith("generation_000001_")
+    assert names[1] == store.meta["directory"]
+    assert names[1].startswith("generation_000002_")
+
+
+def test_concurrent_builds_keep_each_others_work(
+    catalog: list[dict[str, Any]], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    DocumentStore().load()
+    # Another builder that read the same manifest, and so builds the same
+    # generation, starts and publishes while the first one reads the movies.
+    second = DocumentStore()
+    read_movies = document_store.iter_json_array
+
+    def build_second_meanwhile(json_file: IO[str], key: str) -> Iterator[Any]:
+        monkeypatch.setattr(document_store, "iter_json_array", read_movies)
+        second.build()
+        return read_movies(json_file, key)
+
+    monkeypatch.setattr(document_store, "iter_json_array", build_second_meanwhile)
+    first = DocumentStore()
+    first.build()
+
+    assert first.meta == second.meta
+    assert first.meta["generation"] == 1
+    assert list(first) == catalog
+    names = sorted(path.name for path in first.store_dir.iterdir())
+    assert len(names) == 4
+    assert names[1] == second.meta["directory"]
+
+
+def test_index_reload_picks_up_new_store_generation(
+    catalog: list[dict[str, Any]], write_movies: WriteMovies
+) -> None:
+    store = DocumentStore()
+    store.load()
+    index = InvertedIndex(documents=store)
+    index.build()
+
+    movie = {"id": 999999, "title": "Walrus", "description": "A walrus on the ice."}
+    write_movies(catalog[1:] + [movie])
+    writer_store = DocumentStore()
+    writer_store.load()
+    writer = InvertedIndex(documents=writer_store)
+    writer.load()
+    assert writer.update() == (1, 1)
+
+    assert index.reload_if_changed()
+    assert _matches(index, "walrus") == [999999]
+    assert store.get(999999)["title"] == "Walrus"
+    assert _matches(index, "grizzly") == []
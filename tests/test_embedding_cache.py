@@ -0,0 +1,83 @@
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+from semantic_search.utils_embedding_cache import (
+    EMBEDDING_KEY_DTYPE,
+    EmbeddingCache,
+    embedding_key,
+    load_embedding_cache,
+    save_embedding_cache,
+    update_embedding_cache,
+)
+
+TEXTS = ["a bear", "a shark", "a rat"]
+
+
+# Encodes text i as a one-hot vector of `dimension` values, counting the calls.
+class FakeEncoder:
+    def __init__(self, dimension: int) -> None:
+        self.dimension = dimension
+        self.encoded: list[str] = []
+
+    def __call__(self, texts: list[str]) -> NDArray[np.float32]:
+        self.encoded.extend(texts)
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for i, text in enumerate(texts):
+            embeddings[i, TEXTS.index(text) % self.dimension] = 1.0
+        return embeddings
+
+
+def _keys(model_name: str, texts: list[str]) -> NDArray[np.bytes_]:
+    return np.array(
+        [embedding_key(model_name, text) for text in texts], dtype=EMBEDDING_KEY_DTYPE
+    )
+
+
+def _update(
+    model_name: str,
+    texts: list[str],
+    cache: EmbeddingCache | None,
+    encoder: FakeEncoder,
+) -> tuple[EmbeddingCache, int]:
+    return update_embedding_cache(
+        cache, _keys(model_name, texts), lambda i: [texts[i]], encoder, model_name
+    )
+
+
+def test_only_new_units_are_encoded() -> None:
+    cache, num_encoded = _update("small", TEXTS[:2], None, FakeEncoder(3))
+    assert num_encoded == 2
+
+    encoder = FakeEncoder(3)
+    updated, num_encoded = _update("small", TEXTS[1:], cache, encoder)
+    assert (num_encoded, encoder.encoded) == (1, ["a rat"])
+    assert np.array_equal(updated.embeddings, np.eye(3, dtype=np.float32)[1:])
+
+
+def test_other_model_discards_the_cache() -> None:
+    cache, _ = _update("small", TEXTS, None, FakeEncoder(3))
+    encoder = FakeEncoder(4)
+    updated, num_encoded = _update("large", TEXTS, cache, encoder)
+    assert num_encoded == 3
+    assert updated.model_name == "large"
+    assert updated.embeddings.shape == (3, 4)
+
+
+def test_other_dimension_discards_the_cache() -> None:
+    cache, _ = _update("small", TEXTS[:2], None, FakeEncoder(3))
+    updated, num_encoded = _update("small", TEXTS, cache, FakeEncoder(4))
+    assert num_encoded == 3
+    assert updated.embeddings.shape == (3, 4)
+
+
+def test_saved_cache_is_only_loaded_for_its_model(tmp_path: Path) -> None:
+    paths = [Path(tmp_path, name) for name in ("e.npy", "o.npy", "k.npy")]
+    cache, _ = _update("small", TEXTS, None, FakeEncoder(3))
+    save_embedding_cache(*paths, cache)
+
+    loaded = load_embedding_cache(*paths, "small")
+    assert loaded is not None
+    assert np.array_equal(loaded.keys, cache.keys)
+    assert np.array_equal(loaded.embeddings, cache.embeddings)
+    assert load_embedding_cache(*paths, "large") is None
@@ -0,0 +1,122 @@
+from collections.abc import Callable
+from typing import Any
+
+import pytest
+from document_store.document_store import DocumentStore
+from hybrid_search.hybrid_search import HybridSearch
+from keyword_search.inverted_index import InvertedIndex
+from semantic_search.utils_query_cache import QueryEmbeddingCache
+
+BM25_RANKING = [3, 4, 1]
+SEMANTIC_RANKING = [4, 6, 5, 2]
+
+
+class FakeSemanticSearch:
+    def __init__(self) -> None:
+        self.depths: list[int] = []
+
+    def search_chunks(
+        self, query: str, limit: int, num_probes: int | None = None
+    ) -> list[dict[str, Any]]:
+        self.depths.append(limit)
+        return [
+            {"id": doc_id, "score": 1.0 - 0.1 * rank}
+            for rank, doc_id in enumerate(SEMANTIC_RANKING[:limit])
+        ]
+
+
+# Fuses fixed BM25 and semantic rankings over the test catalog.
+class FakeHybridSearch(HybridSearch):
+    def __init__(self, documents: DocumentStore) -> None:
+        super().__init__(documents=documents, query_cache=QueryEmbeddingCache())
+        self.fake_semantic_search = FakeSemanticSearch()
+
+    @property
+    def semantic_search(self) -> FakeSemanticSearch:  # type: ignore[override]
+        return self.fake_semantic_search
+
+    def reload_if_changed(self) -> bool:
+        return False
+
+    def _bm25_search(self, query: str, limit: int) -> list[tuple[int, float]]:
+        return [
+            (doc_id, 10.0 - rank) for rank, doc_id in enumerate(BM25_RANKING[:limit])
+        ]
+
+
+# Searches the actual keyword index instead of the fixed BM25 ranking.
+class IndexedHybridSearch(FakeHybridSearch):
+    def _bm25_search(self, query: str, limit: int) -> list[tuple[int, float]]:
+        return self.idx.bm25_search(query, limit)
+
+
+@pytest.fixture
+def searcher(catalog: list[dict[str, Any]]) -> FakeHybridSearch:
+    store = DocumentStore()
+    store.load()
+    return FakeHybridSearch(store)
+
+
+def test_rrf_search_includes_documents_from_one_list(
+    searcher: FakeHybridSearch,
+) -> None:
+    results = searcher.rrf_search("query", k=60, limit=10)
+    by_id = {result["id"]: result for result in results}
+    assert sorted(by_id) == [1, 2, 3, 4, 5, 6]
+
+    # In both lists.
+    assert by_id[4]["bm25_rank"] == 2
+    assert by_id[4]["semantic_rank"] == 1
+    assert by_id[4]["rrf_score"] == pytest.approx(1 / 62 + 1 / 61)
+    # Only found by BM25.
+    assert by_id[3]["bm25_rank"] == 1
+    assert by_id[3]["semantic_rank"] is None
+    assert by_id[3]["rrf_score"] == pytest.approx(1 / 61)
+    # Only found by the semantic search.
+    assert by_id[6]["bm25_rank"] is None
+    assert by_id[6]["semantic_rank"] == 2
+    assert by_id[6]["rrf_score"] == pytest.approx(1 / 62)
+
+    assert results[0]["id"] == 4
+    assert results[0]["title"] == "The Meg"
+    scores = [result["rrf_score"] for result in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_rrf_search_only_fuses_candidates_within_depth(
+    searcher: FakeHybridSearch,
+) -> None:
+    results = searcher.rrf_search("query", k=60, limit=2, depth=2)
+    assert searcher.fake_semantic_search.depths == [2]
+    assert [result["id"] for result in results] == [4, 3]
+
+
+def test_adaptive_depth_deepens_until_results_settle(
+    searcher: FakeHybridSearch,
+) -> None:
+    results = searcher.rrf_search("query", k=60, limit=2, depth=1, adaptive_depth=True)
+    # The depth starts at the limit and stops doubling once the results are the
+    # same as at the previous depth.
+    assert searcher.fake_semantic_search.depths == [2, 4]
+    assert [result["id"] for result in results] == [4, 3]
+
+
+def test_search_skips_movies_deleted_since_the_last_update(
+    catalog: list[dict[str, Any]],
+    write_movies: Callable[[list[dict[str, Any]]], None],
+) -> None:
+    store = DocumentStore()
+    store.load()
+    InvertedIndex(documents=store).build()
+
+    # The store is rebuilt without Jaws, but the keyword index isn't updated.
+    write_movies([movie for movie in catalog if movie["id"] != 3])
+    assert store.reload_if_changed()
+    assert 3 not in store
+
+    searcher = IndexedHybridSearch(store)
+    rrf_ids = [result["id"] for result in searcher.rrf_search("shark", limit=10)]
+    assert 3 not in rrf_ids
+    assert 4 in rrf_ids
+    weighted_ids = [result["id"] for result in searcher.weighted_search("shark")]
+    assert 3 not in weighted_ids
@@ -0,0 +1,132 @@
+from collections.abc import Callable
+from typing import Any
+
+import pytest
+from document_store.document_store import DocumentStore
+from keyword_search.inverted_index import MAX_INDEX_SEGMENTS, InvertedIndex
+
+
+@pytest.fixture
+def index(catalog: list[dict[str, Any]]) -> InvertedIndex:
+    store = DocumentStore()
+    store.load()
+    index = InvertedIndex(documents=store)
+    index.build()
+    return index
+
+
+# Scores every document against every term, one BM25 lookup at a time.
+def _brute_force_bm25(
+    index: InvertedIndex, terms: list[str], limit: int
+) -> list[tuple[int, float]]:
+    scores = [
+        (doc_id, sum(index.bm25(doc_id, term) for term in terms))
+        for doc_id in index.doc_ids.tolist()
+    ]
+    # Ties go to the document that comes first in the index.
+    return sorted(scores, key=lambda item: -item[1])[:limit]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 4, 10])
+def test_bm25_search_matches_brute_force(index: InvertedIndex, limit: int) -> None:
+    terms = ["bear", "shark", "town"]
+    results = index.bm25_search(" ".join(terms), limit)
+    expected = _brute_force_bm25(index, terms, limit)
+    assert [doc_id for doc_id, _ in results] == [doc_id for doc_id, _ in expected]
+    assert [score for _, score in results] == pytest.approx(
+        [score for _, score in expected]
+    )
+
+
+def test_bm25_search_pads_with_unmatched_documents(index: InvertedIndex) -> None:
+    results = index.bm25_search("shark", 4)
+    assert [doc_id for doc_id, _ in results] == [3, 4, 1, 2]
+    assert [score for _, score in results[2:]] == [0.0, 0.0]
+
+
+def _matches(index: InvertedIndex, query: str) -> list[int]:
+    return [doc_id for doc_id, score in index.bm25_search(query, 10) if score > 0]
+
+
+def test_add_documents_writes_a_new_segment(index: InvertedIndex) -> None:
+    index.add_documents(
+        [{"id": 7, "title": "Free Willy", "description": "A boy frees a whale."}]
+    )
+    assert len(index.segments) == 2
+    assert index.num_docs == 7
+    assert _matches(index, "whale") == [7]
+
+
+def test_add_documents_replaces_indexed_versions(index: InvertedIndex) -> None:
+    index.add_documents(
+        [{"id": 3, "title": "Jaws", "description": "A giant squid eats a boat."}]
+    )
+    assert index.num_docs == 6
+    assert _matches(index, "squid") == [3]
+    assert _matches(index, "shark") == [4]
+
+
+def test_delete_documents_masks_them_out(index: InvertedIndex) -> None:
+    index.delete_documents([1, 42])
+    assert index.num_docs == 5
+    assert _matches(index, "bear") == [2]
+    assert index.get_documents("grizzly") == []
+    with pytest.raises(ValueError):
+        index.get_tf(1, "bear")
+
+
+def test_merge_matches_a_fresh_build(
+    catalog: list[dict[str, Any]], index: InvertedIndex
+) -> None:
+    index.add_documents(
+        [{"id": 7, "title": "Free Willy", "description": "A boy frees a whale."}]
+    )
+    index.add_documents(
+        [{"id": 3, "title": "Jaws", "description": "A giant squid eats a boat."}]
+    )
+    index.delete_documents([5])
+    query = "bear shark whale squid town toys"
+    before = index.bm25_search(query, 10)
+
+    index.merge()
+    assert len(index.segments) == 1
+    assert index.live is None
+    assert sorted(index.doc_ids.tolist()) == [1, 2, 3, 4, 6, 7]
+    merged = index.bm25_search(query, 10)
+    assert [doc_id for doc_id, _ in merged] == [doc_id for doc_id, _ in before]
+    assert [score for _, score in merged] == pytest.approx(
+        [score for _, score in before]
+    )
+
+    reloaded = InvertedIndex(documents=index.documents)
+    reloaded.load()
+    assert reloaded.bm25_search(query, 10) == merged
+
+
+def test_update_leaves_merging_to_merge(
+    catalog: list[dict[str, Any]],
+    write_movies: Callable[[list[dict[str, Any]]], None],
+    index: InvertedIndex,
+) -> None:
+    movies = list(catalog)
+    for i in range(MAX_INDEX_SEGMENTS + 1):
+        movies.append({"id": 100 + i, "title": f"Sequel {i}", "description": "More."})
+        write_movies(movies)
+        index.documents.reload_if_changed()
+        assert index.update() == (1, 0)
+    assert len(index.segments) == MAX_INDEX_SEGMENTS + 2
+    assert index.needs_merge
+
+    index.merge()
+    assert not index.needs_merge
+    assert index.num_docs == len(movies)
+
+
+def test_readers_reload_after_an_update(index: InvertedIndex) -> None:
+    reader = InvertedIndex(documents=index.documents)
+    reader.load()
+    index.delete_documents([3])
+    assert _matches(reader, "jaws") == [3]
+    assert reader.reload_if_changed()
+    assert _matches(reader, "jaws") == []
+    assert not reader.reload_if_changed()
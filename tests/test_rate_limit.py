@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+import pytest
+from hybrid_search import utils_rate_limit
+from hybrid_search.utils_rate_limit import TokenBucket, call_with_retries
+from hybrid_search.utils_rerank import LLMReranker
+from hybrid_search.utils_response_cache import ResponseCache
+from stub_client import StubClient, StubModels, StubRateLimitError
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(utils_rate_limit, "backoff_delay", lambda attempt: 0.0)
+
+
+def _generate(models: StubModels) -> str:
+    return models.generate_content("gemini-test", "prompt").text
+
+
+def test_token_bucket_rejects_bad_settings() -> None:
+    with pytest.raises(ValueError):
+        TokenBucket(0, 1)
+    with pytest.raises(ValueError):
+        TokenBucket(1, 0.5)
+
+
+def test_token_bucket_allows_a_burst_then_its_rate() -> None:
+    async def acquire_all(bucket: TokenBucket, count: int) -> float:
+        start = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    bucket = TokenBucket(rate=100, capacity=5)
+    assert asyncio.run(acquire_all(bucket, 5)) < 0.02
+    # The bucket is empty, so 5 more tokens take about 50 ms.
+    assert asyncio.run(acquire_all(bucket, 5)) >= 0.04
+
+
+def test_call_with_retries_retries_rate_limited_calls() -> None:
+    models = StubModels(latency_seconds=0, rate_limit_every=2)
+    bucket = TokenBucket(rate=1000, capacity=10)
+    texts = [
+        asyncio.run(call_with_retries(lambda: _generate(models), bucket))
+        for _ in range(3)
+    ]
+    assert len(set(texts)) == 1
+    # Calls 2 and 4 were rate limited and retried.
+    assert models.calls == 5
+    assert models.rate_limited_calls == 2
+
+
+def test_call_with_retries_gives_up_after_max_attempts() -> None:
+    models = StubModels(latency_seconds=0, rate_limit_every=1)
+    bucket = TokenBucket(rate=1000, capacity=10)
+    with pytest.raises(StubRateLimitError):
+        asyncio.run(
+            call_with_retries(lambda: _generate(models), bucket, max_attempts=3)
+        )
+    assert models.calls == 3
+
+
+def test_call_with_retries_raises_other_errors_right_away() -> None:
+    calls = 0
+
+    def fail() -> str:
+        nonlocal calls
+        calls += 1
+        raise RuntimeError("bad request")
+
+    bucket = TokenBucket(rate=1000, capacity=10)
+    with pytest.raises(RuntimeError):
+        asyncio.run(call_with_retries(fail, bucket))
+    assert calls == 1
+
+
+# Reranks against a stub that is slow and rate limited, then against one that is
+# neither. The stub scores only depend on the prompt, so both must return the same
+# order. Each reranker has its own empty response cache, so every prompt reaches the
+# stub.
+def test_individual_reranking_is_concurrent() -> None:
+    results = [
+        {"id": i, "title": f"Movie {i}", "description": f"Plot {i}."} for i in range(10)
+    ]
+    client = StubClient(latency_seconds=0.05, rate_limit_every=4)
+    reranker = LLMReranker(
+        "",
+        client=client,
+        requests_per_minute=60000,
+        max_concurrency=10,
+        response_cache=ResponseCache(),
+    )
+    start = time.monotonic()
+    reranked = reranker.rerank("query", [dict(r) for r in results], 10, "individual")
+    elapsed = time.monotonic() - start
+
+    reference = LLMReranker(
+        "", client=StubClient(0), response_cache=ResponseCache()
+    ).rerank("query", [dict(r) for r in results], 10, "individual")
+    assert [r["id"] for r in reranked] == [r["id"] for r in reference]
+    assert client.models.rate_limited_calls > 0
+    assert client.models.calls == len(results) + client.models.rate_limited_calls
+    # One request at a time would take at least 0.05 s per call.
+    assert elapsed < client.models.calls * 0.05 / 2
@@ -0,0 +1,102 @@
+from pathlib import Path
+
+import pytest
+from hybrid_search import utils_response_cache
+from hybrid_search.utils_response_cache import ResponseCache, response_key
+
+MODEL = "gemini-test"
+
+
+# Moves the clock of the cache by hand.
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(utils_response_cache.time, "time", clock.time)
+    return clock
+
+
+def test_response_key_separates_parts() -> None:
+    assert response_key(["ab", "c"]) != response_key(["a", "bc"])
+    assert response_key("abc") == response_key(["abc"])
+    assert response_key(b"abc") != response_key("abc")
+
+
+def test_get_returns_put_text_per_model(clock: FakeClock) -> None:
+    cache = ResponseCache()
+    assert cache.get(MODEL, "prompt") is None
+    cache.put(MODEL, "prompt", "7")
+    assert cache.get(MODEL, "prompt") == "7"
+    assert cache.get("other-model", "prompt") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_entries_expire_after_the_ttl(clock: FakeClock) -> None:
+    cache = ResponseCache(ttl_seconds=60)
+    cache.put(MODEL, "prompt", "7")
+    clock.now += 60
+    assert cache.get(MODEL, "prompt") == "7"
+    clock.now += 1
+    assert cache.get(MODEL, "prompt") is None
+    assert cache.expired == 1
+    assert len(cache) == 0
+
+
+# Reading an entry doesn't extend its TTL, which counts from when it was written.
+def test_use_does_not_extend_the_ttl(clock: FakeClock) -> None:
+    cache = ResponseCache(ttl_seconds=60)
+    cache.put(MODEL, "prompt", "7")
+    clock.now += 50
+    assert cache.get(MODEL, "prompt") == "7"
+    clock.now += 20
+    assert cache.get(MODEL, "prompt") is None
+
+
+def test_least_recently_used_entries_are_evicted(clock: FakeClock) -> None:
+    cache = ResponseCache(max_entries=2)
+    cache.put(MODEL, "a", "1")
+    clock.now += 1
+    cache.put(MODEL, "b", "2")
+    clock.now += 1
+    assert cache.get(MODEL, "a") == "1"
+    clock.now += 1
+    cache.put(MODEL, "c", "3")
+
+    assert cache.evicted == 1
+    assert len(cache) == 2
+    assert cache.get(MODEL, "b") is None
+    assert cache.get(MODEL, "a") == "1"
+    assert cache.get(MODEL, "c") == "3"
+    assert cache.stats()["size"] == 2
+
+
+def test_generate_caches_text_and_skips_blocked_responses(clock: FakeClock) -> None:
+    class Response:
+        def __init__(self, text: str | None) -> None:
+            self.text = text
+
+    cache = ResponseCache()
+    calls: list[str | None] = []
+
+    def generate(text: str | None) -> Response:
+        calls.append(text)
+        return Response(text)
+
+    assert cache.generate(MODEL, "blocked", lambda: generate(None)) is None
+    assert cache.generate(MODEL, "blocked", lambda: generate(None)) is None
+    assert cache.generate(MODEL, "prompt", lambda: generate("7")) == "7"
+    assert cache.generate(MODEL, "prompt", lambda: generate("8")) == "7"
+    assert calls == [None, None, "7"]
+
+
+def test_entries_persist_in_the_store(tmp_path: Path, clock: FakeClock) -> None:
+    store_path = Path(tmp_path, "cache", "responses.sqlite")
+    ResponseCache(store_path=store_path).put(MODEL, "prompt", "7")
+    assert ResponseCache(store_path=store_path).get(MODEL, "prompt") == "7"
@@ -0,0 +1,82 @@
+import json
+import logging
+import threading
+import urllib.error
+import urllib.request
+from collections.abc import Iterator
+from http.server import ThreadingHTTPServer
+from typing import Any
+
+import pytest
+
+pytest.importorskip("google.genai")
+from search_server.server import (  # noqa: E402
+    REQUIRED_FIELDS,
+    SEARCH_ENDPOINTS,
+    check_payload,
+    new_request_handler,
+)
+
+
+# Answers every request with the given result, or by raising it.
+class FakeService:
+    def __init__(self, result: dict[str, Any] | Exception) -> None:
+        self.logger = logging.getLogger("test_server")
+        self.result = result
+
+    def handle(self, endpoint: str, payload: dict[str, Any]) -> dict[str, Any]:
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def _post(port: int, endpoint: str, payload: Any) -> tuple[int, dict[str, Any]]:
+    request = urllib.request.Request(
+        f"http://localhost:{port}/{endpoint}", data=json.dumps(payload).encode()
+    )
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+@pytest.fixture
+def serve() -> Iterator[Any]:
+    servers: list[ThreadingHTTPServer] = []
+
+    def start(service: FakeService) -> int:
+        server = ThreadingHTTPServer(("localhost", 0), new_request_handler(service))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server.server_address[1]
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_every_endpoint_lists_its_required_fields() -> None:
+    assert set(REQUIRED_FIELDS) == set(SEARCH_ENDPOINTS)
+
+
+def test_check_payload_rejects_missing_fields() -> None:
+    check_payload("rag", {"command": "rag", "query": "bears"})
+    with pytest.raises(ValueError, match="Missing field 'query'"):
+        check_payload("rag", {"command": "rag"})
+    with pytest.raises(ValueError, match="JSON object"):
+        check_payload("rrf", ["bears"])
+
+
+def test_missing_field_is_a_bad_request(serve: Any) -> None:
+    port = serve(FakeService({"results": []}))
+    assert _post(port, "rrf", {"limit": 3}) == (400, {"error": "Missing field 'query'"})
+    assert _post(port, "rrf", {"query": "bears"}) == (200, {"results": []})
+
+
+def test_failed_lookup_is_a_server_error(serve: Any) -> None:
+    port = serve(FakeService(KeyError("Document '999999' is not in the store")))
+    status, body = _post(port, "bm25search", {"query": "walrus"})
+    assert status == 500
+    assert "Document '999999' is not in the store" in body["error"]
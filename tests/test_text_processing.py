@@ -0,0 +1,20 @@
+from typing import Any
+
+import pytest
+from keyword_search.text_processing import text_processing
+from keyword_search.text_processing.text_processing import (
+    TextProcessingContext,
+    clean_text,
+    clean_text_pipeline,
+)
+
+
+def test_stem_cache_is_bounded(
+    catalog: list[dict[str, Any]], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(text_processing, "STEM_CACHE_SIZE", 4)
+    ctx = TextProcessingContext()
+    for movie in catalog:
+        text = f"{movie['title']} {movie['description']}"
+        assert clean_text(text, ctx) == clean_text_pipeline(text, ctx)
+        assert len(ctx.stem_cache) <= 4